@@ -18,7 +18,8 @@ from .parser_types import *
 from .const import *
 
 from .conductor import write_sample_yaml_cwl, write_sample_yaml, \
-    write_sample_yaml_prj, write_submission_yaml
+    write_sample_yaml_prj, write_submission_yaml, write_sample_store, \
+    read_submission_yaml
 
 from ubiquerg import VersionInHelpParser
 from divvy import DEFAULT_COMPUTE_RESOURCES_NAME, NEW_COMPUTE_KEY as COMPUTE_KEY
@@ -193,6 +194,23 @@ def build_parser():
                     "-n", "--lumpn", default=None, metavar="N",
                     type=html_range(min_val=1, max_val="num_samples", value=1),
                     help="Number of commands to batch into one job")
+            subparser.add_argument(
+                    "--hook-jobs", type=int, default=1, metavar="N",
+                    help="Number of cacheable pre-submission hook commands "
+                         "to run concurrently, ahead of the samples they "
+                         "are rendered for. Default=1")
+            subparser.add_argument(
+                    "--render-workers", type=int, default=1, metavar="N",
+                    help="Number of processes to render the commands and "
+                         "submission scripts of single-sample jobs in. "
+                         "Default=1")
+            subparser.add_argument(
+                    "--plan", nargs="?", const="", default=None,
+                    metavar="FILE",
+                    help="Compute the job plan and report its totals, "
+                         "without writing any script or running the "
+                         "pre-submission hooks; write the plan to FILE as "
+                         "JSON lines, if given")
 
         inspect_subparser.add_argument(
             "-n", "--snames", required=False, nargs="+", metavar="S",
@@ -201,6 +219,31 @@ def build_parser():
             "-l", "--attr-limit", required=False, type=int, default=10,
             metavar="L", help="Number of sample attributes to display")
 
+        for subparser in [table_subparser, report_subparser]:
+            subparser.add_argument(
+                    "--format", nargs="+", default=["tsv"],
+                    choices=SUMMARY_FORMATS,
+                    type=html_select(choices=SUMMARY_FORMATS), metavar="F",
+                    help="Formats to write the summary tables in, any of: "
+                         "{}. Default: tsv".format(", ".join(SUMMARY_FORMATS)))
+
+        report_subparser.add_argument(
+                "--jobs", type=int, default=1, metavar="N",
+                help="Number of processes to render the report pages with. "
+                     "Default=1")
+        report_subparser.add_argument(
+                "--serve", nargs="?", type=int, const=8000, default=None,
+                metavar="PORT",
+                help="Serve the report locally, rendering pages on request; "
+                     "the rendered pages are written when the server is "
+                     "stopped. Default port=8000")
+
+        table_subparser.add_argument(
+                "--stream", action=_StoreBoolActionType, default=False,
+                type=html_checkbox(checked=False),
+                help="Write the summaries row by row to limit memory use; "
+                     "TSV format only. Default=False")
+
         check_subparser.add_argument(
                 "-A", "--all-folders", action=_StoreBoolActionType,
                 default=False, type=html_checkbox(checked=False),
@@ -211,6 +254,21 @@ def build_parser():
                 type=html_select(choices=FLAGS), metavar="F",
                 help="Check on only these flags/status values")
 
+        destroy_subparser.add_argument(
+                "--jobs", type=int, default=1, metavar="N",
+                help="Number of sample results folders to measure or remove "
+                     "concurrently. Default=1")
+        destroy_subparser.add_argument(
+                "--flags", nargs='*', default=None,
+                type=html_select(choices=FLAGS), metavar="F",
+                help="Destroy only the results of samples with these "
+                     "flags/status values")
+
+        clean_subparser.add_argument(
+                "--jobs", type=int, default=1, metavar="N",
+                help="Number of cleanup scripts to run concurrently. "
+                     "Default=1")
+
         for subparser in [destroy_subparser, clean_subparser]:
             subparser.add_argument(
                     "--force-yes", action=_StoreBoolActionType, default=False,
@@ -239,6 +297,9 @@ def build_parser():
             # "Results subdirectory name"
             subparser.add_argument("--results-subdir", metavar="DIR",
                                    help=argparse.SUPPRESS)
+            # "Number of hash-prefix folder levels for per-sample files"
+            subparser.add_argument("--shard-depth", metavar="N", type=int,
+                                   help=argparse.SUPPRESS)
             # "Sample attribute for pipeline interface sources"
             subparser.add_argument("--pipeline-interfaces-key", metavar="K",
                                    help=argparse.SUPPRESS)
@@ -0,0 +1,497 @@
+""" Submission backends, which submit the job scripts and track the jobs """
+
+import importlib
+import itertools
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+from .const import SUBMISSION_BACKEND_KEY, SUBMISSION_BACKENDS_GROUP, \
+    SUBMISSION_BATCH_SIZE_KEY
+from .exceptions import JobSubmissionException, MisconfigurationException
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["SubmissionBackend", "ShellBackend", "LocalPoolBackend",
+           "MemoryBackend", "FakeSchedulerBackend", "BUILTIN_BACKENDS",
+           "JOB_STATES", "backend_settings", "create_backend",
+           "get_backend_class", "normalize_state"]
+
+_LOGGER = getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+UNKNOWN = "unknown"
+JOB_STATES = [QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED, UNKNOWN]
+
+# scheduler job states, as reported by squeue, qstat or bjobs, by job state
+_STATE_ALIASES = {
+    QUEUED: ["pending", "pd", "qw", "pend", "q", "configuring", "cf"],
+    RUNNING: ["r", "run", "completing", "cg"],
+    COMPLETED: ["cd", "done", "c"],
+    FAILED: ["f", "timeout", "to", "node_fail", "nf", "out_of_memory", "oom",
+             "exit", "boot_fail", "bf", "eqw"],
+    CANCELLED: ["ca", "canceled"]
+}
+
+# matches the job ID in the output of sbatch, SGE qsub and bsub
+DEFAULT_JOB_ID_PATTERN = r"(?:Submitted batch job|Your job|Job <)\s*(\w+)"
+# number of the last lines of the submission command output searched for the
+# job ID
+_OUTPUT_TAIL_LINES = 50
+
+
+class SubmissionBackend(object):
+    """
+    Submits job scripts and tracks the submitted jobs.
+
+    A backend is created from the settings of the compute package the job
+    scripts are rendered with, which select it with their
+    'submission_backend' setting. Looper hands it the scripts in batches of
+    'submission_batch_size' scripts, so that a backend can submit many
+    scripts in one call.
+
+    :param Mapping compute: compute settings
+    :raise MisconfigurationException: if the batch size is not a positive
+        integer
+    """
+    # number of scripts handed to submit_many at once, by default
+    batch_size = 1
+    # compute settings the backend is configured with; the scripts whose
+    # compute settings differ in other keys only share a backend
+    settings = [SUBMISSION_BACKEND_KEY, SUBMISSION_BATCH_SIZE_KEY,
+                "submission_command"]
+
+    def __init__(self, compute):
+        self.compute = compute
+        batch_size = compute.get(SUBMISSION_BATCH_SIZE_KEY) or self.batch_size
+        try:
+            self.batch_size = int(batch_size)
+        except (TypeError, ValueError):
+            self.batch_size = 0
+        if self.batch_size < 1:
+            raise MisconfigurationException(
+                "'{}' must be a positive integer, got: {}".format(
+                    SUBMISSION_BATCH_SIZE_KEY, batch_size))
+
+    def __str__(self):
+        return "{} (batch size: {})".format(self.__class__.__name__,
+                                            self.batch_size)
+
+    def submit_many(self, scripts):
+        """
+        Submit job scripts
+
+        :param list[str] scripts: paths to the job scripts
+        :return list[str | NoneType | JobSubmissionException]: ID of the job
+            of each script, None if the backend could not determine it, or the
+            error the script failed to submit with
+        """
+        raise NotImplementedError
+
+    def status(self, job_ids):
+        """
+        Get the state of submitted jobs
+
+        :param Iterable[str] job_ids: IDs of the jobs
+        :return dict[str, str]: state of each job, one of JOB_STATES
+        """
+        return {job_id: UNKNOWN for job_id in job_ids}
+
+    def cancel(self, job_ids):
+        """
+        Cancel submitted jobs
+
+        :param Iterable[str] job_ids: IDs of the jobs
+        """
+        raise NotImplementedError("{} can't cancel jobs".format(
+            self.__class__.__name__))
+
+    def close(self, wait=True):
+        """
+        Release the resources of the backend
+
+        :param bool wait: whether to wait for the jobs the backend runs itself
+        """
+        pass
+
+
+class ShellBackend(SubmissionBackend):
+    """
+    Submits each script with the 'submission_command' of the compute
+    package, run through a shell, like 'sbatch' or 'sh'.
+
+    The output of the command is printed as it is produced; the job ID is
+    the first group of the 'job_id_pattern' regular expression found in it.
+    The state of a job is the output of the 'status_command' called with the
+    job ID, like 'squeue -h -o %T -j'; the jobs are cancelled with the
+    'cancel_command' called with the job IDs, like 'scancel'.
+    """
+    settings = SubmissionBackend.settings + [
+        "job_id_pattern", "status_command", "cancel_command"]
+
+    def __init__(self, compute):
+        super(ShellBackend, self).__init__(compute)
+        self.command = compute.get("submission_command")
+        self.job_id_pattern = re.compile(
+            compute.get("job_id_pattern") or DEFAULT_JOB_ID_PATTERN,
+            re.MULTILINE)
+        self.status_command = compute.get("status_command")
+        self.cancel_command = compute.get("cancel_command")
+
+    def submit_many(self, scripts):
+        return [self._submit(script) for script in scripts]
+
+    def _submit(self, script):
+        """
+        Submit a job script and search its output for the job ID
+
+        :param str script: path to the job script
+        :return str | NoneType | JobSubmissionException: job ID, or the error
+            the script failed to submit with
+        """
+        proc = subprocess.Popen("{} {}".format(self.command, script),
+                                shell=True, stdout=subprocess.PIPE,
+                                universal_newlines=True, errors="replace")
+        tail = deque(maxlen=_OUTPUT_TAIL_LINES)
+        for line in proc.stdout:
+            sys.stdout.write(line)
+            tail.append(line)
+        sys.stdout.flush()
+        # Capture submission command return value so that we can
+        # intercept and report basic submission failures; #167
+        if proc.wait() != 0:
+            return JobSubmissionException(self.command, script)
+        match = self.job_id_pattern.findall("".join(tail))
+        return match[-1] if match else None
+
+    def status(self, job_ids):
+        if not self.status_command:
+            return super(ShellBackend, self).status(job_ids)
+        states = {}
+        for job_id in job_ids:
+            try:
+                output = subprocess.check_output(
+                    "{} {}".format(self.status_command, job_id), shell=True,
+                    universal_newlines=True, stderr=subprocess.DEVNULL)
+            except subprocess.CalledProcessError:
+                output = ""
+            states[job_id] = normalize_state(output)
+        return states
+
+    def cancel(self, job_ids):
+        if not self.cancel_command:
+            return super(ShellBackend, self).cancel(job_ids)
+        job_ids = list(job_ids)
+        if job_ids:
+            subprocess.check_call("{} {}".format(
+                self.cancel_command, " ".join(job_ids)), shell=True)
+
+
+class LocalPoolBackend(SubmissionBackend):
+    """
+    Runs the scripts on the local machine, in a pool of
+    'submission_workers' concurrent processes, with the 'submission_command'
+    of the compute package, 'sh' by default.
+
+    The scripts are queued, so the submission returns right away; the
+    standard output of the scripts is discarded, since the job templates
+    write it to the job log. Closing the backend waits for the queued
+    scripts to finish.
+    """
+    settings = SubmissionBackend.settings + ["submission_workers"]
+
+    def __init__(self, compute):
+        super(LocalPoolBackend, self).__init__(compute)
+        self.command = compute.get("submission_command") or "sh"
+        self.workers = int(compute.get("submission_workers") or
+                           os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(self.workers)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._states = OrderedDict()
+        self._processes = {}
+
+    def __str__(self):
+        return "{} ({} workers)".format(self.__class__.__name__, self.workers)
+
+    def submit_many(self, scripts):
+        job_ids = []
+        for script in scripts:
+            job_id = "local.{}".format(next(self._ids))
+            with self._lock:
+                self._states[job_id] = QUEUED
+            self._executor.submit(self._run, job_id, script)
+            job_ids.append(job_id)
+        return job_ids
+
+    def _run(self, job_id, script):
+        """
+        Run a job script, unless the job is cancelled already
+
+        :param str job_id: ID of the job
+        :param str script: path to the job script
+        """
+        with self._lock:
+            if self._states[job_id] != QUEUED:
+                return
+            self._states[job_id] = RUNNING
+            # in a process group of its own, so that it can be cancelled
+            # along with the processes it starts
+            proc = subprocess.Popen("{} {}".format(self.command, script),
+                                    shell=True, stdout=subprocess.DEVNULL,
+                                    start_new_session=True)
+            self._processes[job_id] = proc
+        returncode = proc.wait()
+        with self._lock:
+            del self._processes[job_id]
+            if self._states[job_id] == RUNNING:
+                self._states[job_id] = \
+                    COMPLETED if returncode == 0 else FAILED
+
+    def status(self, job_ids):
+        with self._lock:
+            return {job_id: self._states.get(job_id, UNKNOWN)
+                    for job_id in job_ids}
+
+    def cancel(self, job_ids):
+        with self._lock:
+            for job_id in job_ids:
+                if self._states.get(job_id) in [QUEUED, RUNNING]:
+                    self._states[job_id] = CANCELLED
+                    if job_id in self._processes:
+                        _terminate(self._processes[job_id])
+
+    def close(self, wait=True):
+        if wait:
+            with self._lock:
+                pending = sum(state in [QUEUED, RUNNING]
+                              for state in self._states.values())
+            if pending:
+                _LOGGER.info("Waiting for {} local jobs to finish".
+                             format(pending))
+        self._executor.shutdown(wait=wait)
+
+
+class MemoryBackend(SubmissionBackend):
+    """
+    In-memory scheduler, for tests: the scripts are queued with sequential
+    job IDs and never run.
+    """
+    def __init__(self, compute):
+        super(MemoryBackend, self).__init__(compute)
+        self.jobs = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def __str__(self):
+        return "{} ({} jobs)".format(self.__class__.__name__, len(self.jobs))
+
+    def submit_many(self, scripts):
+        job_ids = []
+        for script in scripts:
+            job_id = str(next(self._ids))
+            self.jobs[job_id] = {"script": script, "state": QUEUED}
+            job_ids.append(job_id)
+        return job_ids
+
+    def status(self, job_ids):
+        return {job_id: self.jobs[job_id]["state"] if job_id in self.jobs
+                else UNKNOWN for job_id in job_ids}
+
+    def cancel(self, job_ids):
+        for job_id in job_ids:
+            if job_id in self.jobs and \
+                    self.jobs[job_id]["state"] in [QUEUED, RUNNING]:
+                self.jobs[job_id]["state"] = CANCELLED
+
+
+class FakeSchedulerBackend(SubmissionBackend):
+    """
+    Submits the scripts to the fake scheduler, to measure the submission
+    throughput and the effect of failures and throttling offline. Each batch
+    of scripts is submitted in one call.
+
+    The scheduler is the one served at the 'fake_scheduler_address' or at the
+    address in the LOOPER_FAKE_SCHEDULER environment variable; otherwise, a
+    scheduler is started in the looper process, configured with the
+    'fake_'-prefixed settings, like 'fake_queue_latency' or 'fake_execute'.
+    Its statistics are reported when the backend is closed.
+    """
+    # settings of the scheduler started in the looper process
+    scheduler_settings = ["submit_latency", "queue_latency", "run_time",
+                          "failure_rate", "job_failure_rate", "rate_limit",
+                          "max_jobs", "execute", "seed"]
+    settings = SubmissionBackend.settings + ["fake_scheduler_address"] + \
+        ["fake_" + k for k in scheduler_settings]
+
+    def __init__(self, compute):
+        super(FakeSchedulerBackend, self).__init__(compute)
+        from .fake_scheduler import ADDRESS_ENV_VAR, FakeScheduler, \
+            FakeSchedulerClient
+        address = compute.get("fake_scheduler_address") or \
+            os.getenv(ADDRESS_ENV_VAR)
+        if address:
+            self.scheduler = FakeSchedulerClient(address)
+            self._own_scheduler = False
+        else:
+            settings = {k: compute.get("fake_" + k)
+                        for k in self.scheduler_settings
+                        if compute.get("fake_" + k) is not None}
+            self.scheduler = FakeScheduler(**settings)
+            self.scheduler.start()
+            self._own_scheduler = True
+
+    def __str__(self):
+        return "{} ({})".format(self.__class__.__name__, self.scheduler)
+
+    def submit_many(self, scripts):
+        return [JobSubmissionException("fake scheduler ({})".format(result),
+                                       script)
+                if isinstance(result, Exception) else result
+                for script, result in zip(
+                    scripts, self.scheduler.submit_many(scripts))]
+
+    def status(self, job_ids):
+        job_ids = list(job_ids)
+        states = self.scheduler.squeue(job_ids)
+        return {job_id: normalize_state(states.get(job_id, UNKNOWN))
+                for job_id in job_ids}
+
+    def cancel(self, job_ids):
+        self.scheduler.scancel(job_ids)
+
+    def close(self, wait=True):
+        if not self._own_scheduler:
+            return
+        if wait and self.scheduler.execute:
+            _LOGGER.info("Waiting for the fake scheduler jobs to finish")
+            self.scheduler.wait()
+        stats = self.scheduler.stats()
+        _LOGGER.info(
+            "Fake scheduler: {} submitted, {} rejected, in {} calls{}".format(
+                stats["submitted"], stats["rejected"], stats["calls"],
+                "; {:.1f} jobs/s".format(stats["throughput"])
+                if stats["throughput"] else ""))
+        self.scheduler.stop()
+
+
+BUILTIN_BACKENDS = {
+    "shell": ShellBackend,
+    "local": LocalPoolBackend,
+    "memory": MemoryBackend,
+    "fake": FakeSchedulerBackend
+}
+
+
+def normalize_state(state):
+    """
+    Map a job state, as reported by a scheduler, to one of JOB_STATES
+
+    :param str state: job state, like 'PENDING' or 'qw'
+    :return str: job state, 'unknown' if the state is not recognized
+    """
+    state = state.strip().lower()
+    if state in JOB_STATES:
+        return state
+    for job_state, aliases in _STATE_ALIASES.items():
+        if state in aliases:
+            return job_state
+    return UNKNOWN
+
+
+def get_backend_class(name):
+    """
+    Find a submission backend by name.
+
+    The name is looked up in the built-in backends, then in the backends
+    registered in the 'looper.submission_backends' entry point group; a
+    dotted name, like 'package.module.Class', is imported.
+
+    :param str name: name of the backend
+    :return type: submission backend class
+    :raise MisconfigurationException: if there is no such backend
+    """
+    if name in BUILTIN_BACKENDS:
+        return BUILTIN_BACKENDS[name]
+    for entry_point in _backend_entry_points():
+        if entry_point.name == name:
+            return entry_point.load()
+    if "." in name:
+        pkgstr, clsstr = os.path.splitext(name)
+        try:
+            return getattr(importlib.import_module(pkgstr), clsstr[1:])
+        except (ImportError, AttributeError) as e:
+            _LOGGER.debug("Can't import backend '{}': {}".format(name, e))
+    raise MisconfigurationException(
+        "Unknown submission backend: '{}'. Available backends: {}".format(
+            name, ", ".join(
+                list(BUILTIN_BACKENDS) +
+                [entry_point.name for entry_point in _backend_entry_points()
+                 if entry_point.name not in BUILTIN_BACKENDS])))
+
+
+def backend_settings(compute):
+    """
+    Get the compute settings that configure the submission backend they
+    select, as listed by its 'settings' attribute
+
+    :param Mapping compute: compute settings
+    :return dict: settings of the backend that are set
+    """
+    backend_class = get_backend_class(
+        compute.get(SUBMISSION_BACKEND_KEY) or "shell")
+    return {key: compute.get(key) for key in backend_class.settings
+            if compute.get(key) is not None}
+
+
+def create_backend(compute):
+    """
+    Create the submission backend the compute settings select with their
+    'submission_backend' setting, the shell backend by default
+
+    :param Mapping compute: compute settings
+    :return SubmissionBackend: submission backend
+    """
+    backend = get_backend_class(
+        compute.get(SUBMISSION_BACKEND_KEY) or "shell")(compute)
+    _LOGGER.debug("Submitting with {}".format(backend))
+    return backend
+
+
+def _terminate(proc):
+    """
+    Terminate a job process and the processes in its group
+
+    :param subprocess.Popen proc: job process, started in a new session
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except (AttributeError, OSError):
+        proc.terminate()
+
+
+def _backend_entry_points():
+    """
+    Get the entry points the submission backends are registered with
+
+    :return list: entry points in the 'looper.submission_backends' group
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        from pkg_resources import iter_entry_points
+        return list(iter_entry_points(SUBMISSION_BACKENDS_GROUP))
+    registered = entry_points()
+    if hasattr(registered, "select"):
+        return list(registered.select(group=SUBMISSION_BACKENDS_GROUP))
+    return list(registered.get(SUBMISSION_BACKENDS_GROUP, []))
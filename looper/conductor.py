@@ -2,14 +2,23 @@
 
 import logging
 import os
-import subprocess
 import time
+import copy
+import hashlib
 import importlib
+import itertools
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import Future
 
-from jinja2.exceptions import UndefinedError
 from subprocess import check_output, CalledProcessError
-from json import loads
-from yaml import dump
+from json import dumps, loads
+from yaml import dump, load
+try:
+    from yaml import CDumper as Dumper, CSafeDumper as SafeDumper, \
+        CFullLoader as FullLoader
+except ImportError:
+    from yaml import Dumper, SafeDumper, FullLoader
 
 from attmap import AttMap
 from eido import read_schema, validate_inputs
@@ -17,10 +26,17 @@ from eido.const import MISSING_KEY, INPUT_FILE_SIZE_KEY
 from ubiquerg import expandpath
 from peppy.const import CONFIG_KEY, SAMPLE_YAML_EXT, SAMPLE_NAME_ATTR
 
+from .backends import UNKNOWN, backend_settings, create_backend
 from .processed_project import populate_sample_paths
 from .const import *
 from .exceptions import JobSubmissionException
-from .utils import fetch_sample_flags, jinja_render_template_strictly
+from .file_writer import flush_writes, write_file
+from .hook_runner import HookCommandRunner, run_hook_command
+from .namespaces import LayeredNamespace, overlay
+from .render_pool import render_command, render_submission_script
+from .sample_store import open_store
+from .utils import fetch_sample_flags, jinja_render_template_strictly, \
+    sharded_path, template_context
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -43,26 +59,75 @@ def _get_yaml_path(namespaces, template_key, default_name_appendix="",
     if VAR_TEMPL_KEY in namespaces["pipeline"] and \
             template_key in namespaces["pipeline"][VAR_TEMPL_KEY]:
         path = expandpath(jinja_render_template_strictly(
-            namespaces["pipeline"][template_key], namespaces))
-        if not path.endswith(SAMPLE_YAML_EXT) and not filename:
+            namespaces["pipeline"][VAR_TEMPL_KEY][template_key], namespaces))
+        exts = tuple(SAMPLE_YAML_EXT) + (JSON_EXT, )
+        if not path.endswith(exts) and not filename:
             raise ValueError(
                 f"{template_key} is not a valid target YAML file path. "
-                f"It needs to end with: {' or '.join(SAMPLE_YAML_EXT)}")
+                f"It needs to end with: {' or '.join(exts)}")
         final_path = os.path.join(path, filename) if filename else path
         if not os.path.exists(os.path.dirname(final_path)):
             os.makedirs(os.path.dirname(final_path), exist_ok=True)
     else:
         # default YAML location
-        f = filename or f"{namespaces['sample'][SAMPLE_NAME_ATTR]}" \
+        sample_name = namespaces['sample'][SAMPLE_NAME_ATTR]
+        f = filename or f"{sample_name}" \
                         f"{default_name_appendix}" \
                         f"{SAMPLE_YAML_EXT[0]}"
         default = os.path.join(namespaces["looper"][OUTDIR_KEY], "submission")
-        final_path = os.path.join(default, f)
-        if not os.path.exists(default):
-            os.makedirs(default, exist_ok=True)
+        final_path = sharded_path(
+            default, sample_name, f,
+            namespaces["looper"].get(SHARD_DEPTH_KEY, 0))
+        if not os.path.exists(os.path.dirname(final_path)):
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
     return final_path
 
 
+def _write_serialized(path, data, dumper=SafeDumper, **yaml_kwargs):
+    """
+    Write data to a YAML file, or to a JSON file if the path ends with
+    '.json'. The file is not rewritten if its content would not change.
+
+    :param str path: path to the file to write
+    :param Mapping data: data to write
+    :param type dumper: YAML dumper class, by default the libyaml-based
+        safe dumper, if available
+    :param yaml_kwargs: additional arguments to yaml.dump
+    """
+    path = os.path.expandvars(path)
+    _write_content(path, _serialize(path, data, dumper, **yaml_kwargs))
+
+
+def _serialize(path, data, dumper=SafeDumper, **yaml_kwargs):
+    """
+    Serialize data to YAML, or to JSON if the path ends with '.json'
+
+    :param str path: path to the file the data is to be written to
+    :param Mapping data: data to serialize
+    :param type dumper: YAML dumper class
+    :param yaml_kwargs: additional arguments to yaml.dump
+    :return bytes: serialized data
+    """
+    if path.endswith(JSON_EXT):
+        content = dumps(data, indent=2, default=str) + "\n"
+    else:
+        content = dump(data, Dumper=dumper, **yaml_kwargs)
+    return content.encode("utf-8")
+
+
+def _write_content(path, content):
+    """
+    Write content to a file, unless the file holds that content already.
+
+    The file is handed to the active writer pool, if any, and written in
+    the background.
+
+    :param str path: path to the file to write
+    :param bytes content: content to write
+    """
+    write_file(path, content)
+
+
 def write_sample_yaml(namespaces):
     """
     Plugin: saves sample representation to YAML.
@@ -76,8 +141,9 @@ def write_sample_yaml(namespaces):
     :return dict: sample namespace dict
     """
     sample = namespaces["sample"]
-    sample.to_yaml(_get_yaml_path(namespaces, SAMPLE_YAML_PATH_KEY, "_sample"),
-                   add_prj_ref=False)
+    _write_serialized(
+        _get_yaml_path(namespaces, SAMPLE_YAML_PATH_KEY, "_sample"),
+        sample.to_dict(add_prj_ref=False), default_flow_style=False)
     return {"sample": sample}
 
 
@@ -94,8 +160,9 @@ def write_sample_yaml_prj(namespaces):
     :return dict: sample namespace dict
     """
     sample = namespaces["sample"]
-    sample.to_yaml(_get_yaml_path(
-        namespaces, SAMPLE_YAML_PRJ_PATH_KEY, "_sample_prj"), add_prj_ref=True)
+    _write_serialized(
+        _get_yaml_path(namespaces, SAMPLE_YAML_PRJ_PATH_KEY, "_sample_prj"),
+        sample.to_dict(add_prj_ref=True), default_flow_style=False)
     return {"sample": sample}
 
 
@@ -166,26 +233,173 @@ def write_sample_yaml_cwl(namespaces):
         _LOGGER.warning("No 'input_schema' defined, producing a regular "
                         "sample YAML representation")
     _LOGGER.info("Writing sample yaml to {}".format(sample.sample_yaml_cwl))
-    sample.to_yaml(sample.sample_yaml_cwl)
+    _write_serialized(sample.sample_yaml_cwl, sample.to_dict(),
+                      default_flow_style=False)
     return {"sample": sample}
 
 
+def write_sample_store(namespaces):
+    """
+    Plugin: appends sample representation to a store of all the samples.
+
+    The samples are written to a single JSON lines file with an index, rather
+    than to a file per sample; a pipeline can read the record of its sample
+    with looper.sample_store.get. This plugin can be parametrized by
+    providing the path value/template in 'pipeline.var_templates.sample_store_path'.
+    If not provided, the store of the pipeline is
+    '{looper.output_dir}/submission/{pipeline.pipeline_name}_samples.jsonl'.
+
+    Also adds the 'sample_store' attribute to sample objects, which points
+    to the store.
+
+    :param dict namespaces: variable namespaces dict
+    :return dict: sample namespace dict
+    """
+    pipeline = namespaces["pipeline"]
+    if VAR_TEMPL_KEY in pipeline and \
+            SAMPLE_STORE_PATH_KEY in pipeline[VAR_TEMPL_KEY]:
+        path = expandpath(jinja_render_template_strictly(
+            pipeline[VAR_TEMPL_KEY][SAMPLE_STORE_PATH_KEY], namespaces))
+    else:
+        path = os.path.join(namespaces["looper"][OUTDIR_KEY], "submission",
+                            "{}_samples.jsonl".format(pipeline.pipeline_name))
+    sample = namespaces["sample"]
+    open_store(path).put(sample.to_dict())
+    _LOGGER.debug("Sample data written to store: {}".format(path))
+    return {"sample": {"sample_store": path}}
+
+
 def write_submission_yaml(namespaces):
     """
     Save all namespaces to YAML.
 
+    The project, pipeline and compute namespaces, which are usually the same
+    for all the samples, are written to shared files in the 'shared'
+    subfolder of the submission folder, named after a digest of their
+    content, so each distinct namespace is written once. The submission file
+    of the sample holds the other namespaces and the paths to the shared
+    files, relative to the submission file. Use read_submission_yaml to
+    read all the namespaces.
+
     :param dict namespaces: variable namespaces dict
     :return dict: sample namespace dict
     """
-    path = _get_yaml_path(namespaces, SAMPLE_CWL_YAML_PATH_KEY, "_submission")
+    path = os.path.expandvars(
+        _get_yaml_path(namespaces, SUBMISSION_YAML_PATH_KEY, "_submission"))
+    ext = JSON_EXT if path.endswith(JSON_EXT) else SAMPLE_YAML_EXT[0]
+    shared_dir = os.path.join(namespaces["looper"]["submission_subdir"],
+                              SHARED_NAMESPACES_SUBDIR)
     my_namespaces = {}
+    submission = {}
+    shared = {}
     for namespace, values in namespaces.items():
         my_namespaces.update({str(namespace): values.to_dict()})
-    with open(path, 'w') as yamlfile:
-        dump(my_namespaces, yamlfile)
+        if namespace in SHARED_NAMESPACES:
+            shared_path = _write_shared_namespace(
+                shared_dir, namespace, my_namespaces[namespace], ext,
+                layers=_source_layers(values))
+            shared[namespace] = \
+                os.path.relpath(shared_path, os.path.dirname(path))
+        else:
+            submission[namespace] = my_namespaces[namespace]
+    submission[SHARED_NAMESPACES_KEY] = shared
+    _write_content(path, _serialize(path, submission, dumper=Dumper))
     return my_namespaces
 
 
+# shared namespace files written by this process, by folder, extension and
+# namespace name: the source layers, the namespace and the path to the file
+# of the latest distinct namespaces, most recent first
+_SHARED_NAMESPACE_FILES = {}
+# number of distinct namespaces remembered by folder, extension and name,
+# for example the pipeline namespaces of the pipelines run in turns
+_SHARED_NAMESPACE_CACHE_SIZE = 16
+
+
+def _write_shared_namespace(folder, namespace, data, ext, layers=None):
+    """
+    Write a namespace to a file named after its content, unless this process
+    wrote that file already
+
+    :param str folder: path to the folder with the shared namespace files
+    :param str namespace: name of the namespace
+    :param dict data: namespace to write
+    :param str ext: extension of the file, determines the format
+    :param tuple[Mapping] layers: unmodified layers the namespace consists
+        of, if known; a namespace made of the same layers is not compared
+    :return str: path to the namespace file
+    """
+    written = _SHARED_NAMESPACE_FILES.setdefault((folder, ext, namespace), [])
+    for i, (written_layers, written_data, path) in enumerate(written):
+        if _same_layers(layers, written_layers) or written_data == data:
+            written.insert(0, written.pop(i))
+            return path
+    content = _serialize(namespace + ext, data, dumper=Dumper)
+    path = os.path.join(folder, "{}_{}{}".format(
+        namespace, hashlib.sha1(content).hexdigest()[:16], ext))
+    os.makedirs(folder, exist_ok=True)
+    _write_content(path, content)
+    written.insert(0, (layers, copy.deepcopy(data), path))
+    del written[_SHARED_NAMESPACE_CACHE_SIZE:]
+    return path
+
+
+def _source_layers(values):
+    """
+    Get the shared source layers of a namespace that has no values of its
+    own; the sources are not modified while the samples are processed
+
+    :param Mapping values: namespace
+    :return tuple[Mapping] | NoneType: source layers, None if the namespace
+        is not layered or has values of its own
+    """
+    if isinstance(values, LayeredNamespace) and not values.maps[0]:
+        return tuple(values.maps[1:])
+    return None
+
+
+def _same_layers(layers, other):
+    """
+    Check whether two namespaces consist of the same layer objects
+
+    :param tuple[Mapping] | NoneType layers: layers of a namespace
+    :param tuple[Mapping] | NoneType other: layers of the other namespace
+    :return bool: whether the layers are known and the same
+    """
+    return layers is not None and other is not None and \
+        len(layers) == len(other) and \
+        all(a is b for a, b in zip(layers, other))
+
+
+def read_submission_yaml(path):
+    """
+    Read the namespaces written by the write_submission_yaml plugin,
+    including the shared ones
+
+    :param str path: path to the submission file of a sample
+    :return dict[dict]: namespaces mapping
+    """
+    namespaces = _load_serialized(path)
+    shared = namespaces.pop(SHARED_NAMESPACES_KEY, None) or {}
+    for namespace, shared_path in shared.items():
+        namespaces[namespace] = _load_serialized(
+            os.path.join(os.path.dirname(path), shared_path))
+    return namespaces
+
+
+def _load_serialized(path):
+    """
+    Read a YAML file, or a JSON file if the path ends with '.json'
+
+    :param str path: path to the file to read
+    :return dict: file contents
+    """
+    with open(path, 'r') as f:
+        if path.endswith(JSON_EXT):
+            return loads(f.read())
+        return load(f, Loader=FullLoader)
+
+
 class SubmissionConductor(object):
     """
     Collects and then submits pipeline jobs.
@@ -200,7 +414,8 @@ class SubmissionConductor(object):
     def __init__(self, pipeline_interface, prj, delay=0, extra_args=None,
                  extra_args_override=None, ignore_flags=False,
                  compute_variables=None, max_cmds=None, max_size=None,
-                 automatic=True, collate=False):
+                 automatic=True, collate=False, hook_runner=None,
+                 render_pool=None, plan=None, backend=None):
         """
         Create a job submission manager.
 
@@ -236,6 +451,18 @@ class SubmissionConductor(object):
             the pool reaches capacity.
         :param bool collate: Whether a collate job is to be submitted (runs on
             the project level, rather that on the sample level)
+        :param HookCommandRunner hook_runner: runner of the pre-submission
+            hook commands, possibly shared with other conductors
+        :param RenderPool render_pool: pool of processes to render the
+            commands and scripts of single-sample jobs in, possibly shared with
+            other conductors; it must not be started yet
+        :param JobPlan plan: plan to record the jobs in instead of writing
+            and submitting their scripts; the pre-submission hooks are not
+            executed
+        :param SubmissionBackend backend: backend to submit all the scripts
+            with; by default, the scripts are grouped by the compute settings
+            that configure their backend, and each group is submitted with
+            the backend its settings select
         """
         super(SubmissionConductor, self).__init__()
         self.collate = collate
@@ -258,6 +485,22 @@ class SubmissionConductor(object):
         self._num_cmds_submitted = 0
         self._curr_size = 0
         self._failed_sample_names = []
+        self._batch_updates = {}
+        self._script_compute = None
+        self._schemas = {}
+        self.plan = plan
+        self.backend = backend
+        # submission backends and the scripts queued for them, by the compute
+        # settings that configure the backend of the scripts
+        self._backends = OrderedDict()
+        self._queued_scripts = OrderedDict()
+        self._job_ids = OrderedDict()
+        self.hook_runner = hook_runner or HookCommandRunner()
+        # samples whose hooks may be prefetched, and the evaluations of the
+        # samples in the prefetch window, by sample name
+        self._upcoming = deque()
+        self._prefetch_hooks = []
+        self._evaluated = {}
 
         if self.extra_pipe_args:
             _LOGGER.debug("String appended to every pipeline command: "
@@ -280,10 +523,73 @@ class SubmissionConductor(object):
             self._reset_curr_skips()
             self._skipped_sample_pools = []
 
+        # the names of the lumped jobs depend on the number of commands
+        # rendered before, so only the single-sample jobs are rendered in
+        # the pool
+        self.render_pool = None
+        self._pending_renders = deque()
+        if render_pool is not None and plan is None and not self.collate \
+                and self.max_cmds == 1 and "command_template" in self.pl_iface:
+            self.render_pool = render_pool
+            self._render_key = self.pl_iface.pipe_iface_file
+            render_pool.add_context(self._render_key, dict(
+                command_template=self._command_template(),
+                extra_args=self.extra_pipe_args,
+                adapters=dict((self.prj.dcc.get_adapters() or {}).items())))
+
     @property
     def failed_samples(self):
         return self._failed_sample_names
 
+    @property
+    def job_ids(self):
+        """
+        Return the IDs of the jobs that this conductor has submitted.
+
+        :return dict[str, str | NoneType]: job ID by job name; None if the
+            submission backend could not determine it
+        """
+        return OrderedDict((name, job_id) for name, (job_id, _)
+                           in self._job_ids.items())
+
+    def job_states(self):
+        """
+        Get the state of the jobs that this conductor has submitted, from
+        the backends that submitted them
+
+        :return dict[str, str]: state of each job, one of JOB_STATES, by job
+            name
+        """
+        states = {}
+        for backend, jobs in self._jobs_by_backend():
+            backend_states = backend.status([job_id for _, job_id in jobs])
+            states.update((name, backend_states.get(job_id, UNKNOWN))
+                          for name, job_id in jobs)
+        return states
+
+    def cancel_jobs(self):
+        """
+        Cancel the jobs that this conductor has submitted, with the backends
+        that submitted them
+        """
+        for backend, jobs in self._jobs_by_backend():
+            backend.cancel([job_id for _, job_id in jobs])
+
+    def _jobs_by_backend(self):
+        """
+        Group the submitted jobs with a known ID by the backend that
+        submitted them
+
+        :return list[(SubmissionBackend, list[(str, str)])]: backends and
+            the names and IDs of the jobs they submitted
+        """
+        groups = OrderedDict()
+        for name, (job_id, backend) in self._job_ids.items():
+            if job_id is not None:
+                groups.setdefault(id(backend), (backend, []))[1].append(
+                    (name, job_id))
+        return list(groups.values())
+
     @property
     def num_cmd_submissions(self):
         """
@@ -302,23 +608,109 @@ class SubmissionConductor(object):
         """
         return self._num_good_job_submissions
 
-    def add_sample(self, sample, rerun=False):
+    def exec_batch_pre_submit(self, samples):
         """
-        Add a sample for submission to this conductor.
+        Execute the batch pre-submission hooks for the samples that may be
+        submitted by this conductor.
 
-        :param peppy.Sample sample: sample to be included with this conductor's
-            currently growing collection of command submissions
-        :param bool rerun: whether the given sample is being rerun rather than
+        The namespace updates the hooks return are applied when the
+        submission script for each sample is written.
+
+        :param Iterable[peppy.Sample] samples: samples to run the hooks for
+        """
+        samples = list(samples)
+        if self.collate or not samples:
+            return
+        namespaces = dict(project=overlay(self.prj[CONFIG_KEY]),
+                          looper=self._project_looper_namespace(),
+                          pipeline=overlay(self.pl_iface),
+                          compute=overlay(self.prj.dcc.compute),
+                          samples=samples)
+        self._batch_updates = _exec_batch_pre_submit(self.pl_iface, namespaces)
+
+    def prefetch_pre_submit(self, samples):
+        """
+        Set the upcoming samples of this conductor, whose cacheable
+        pre-submission hook commands are started ahead of time.
+
+        Each time a sample is added, the commands of a bounded window of the
+        next samples are started, as far as those samples are not skipped.
+        The commands are rendered with the namespaces of each sample, with
+        its input size, before its hooks are executed; a prefetched output
+        is used only if the command rendered when the submission script is
+        written is the same. The commands are prefetched for single-sample
+        jobs only, since the namespaces of lumped jobs depend on the samples
+        lumped together.
+
+        :param Iterable[peppy.Sample] samples: samples that may be submitted
+            by this conductor, in the order they are added
+        """
+        self._prefetch_hooks = [
+            (templ, timeout) for templ, timeout, cacheable
+            in _cmd_hook_specs(self.pl_iface) if cacheable]
+        if self.collate or not self._prefetch_hooks or self.max_cmds != 1 \
+                or self.hook_runner.jobs < 2:
+            return
+        self._upcoming = deque(samples)
+
+    def _prefetch_upcoming(self, sample, rerun):
+        """
+        Start the cacheable pre-submission hook commands of the samples in
+        the prefetch window after the given one
+
+        :param peppy.Sample sample: sample being added
+        :param bool rerun: whether the samples are being rerun
+        """
+        if not self._upcoming:
+            return
+        if any(s.sample_name == sample.sample_name for s in self._upcoming):
+            while self._upcoming.popleft().sample_name != sample.sample_name:
+                pass
+        window = self.hook_runner.jobs * 2
+        for upcoming in itertools.islice(self._upcoming, window):
+            name = upcoming.sample_name
+            if name in self._evaluated:
+                continue
+            self._evaluated[name] = self._evaluate_sample(upcoming, rerun)
+            use_this_sample, skip_reasons, _, validation, _ = \
+                self._evaluated[name]
+            if not _use_sample(use_this_sample, skip_reasons):
+                continue
+            size = float(validation[INPUT_FILE_SIZE_KEY])
+            try:
+                namespaces = self._sample_namespaces(
+                    upcoming, self._set_looper_namespace([upcoming], size),
+                    size)
+                if name in self._batch_updates:
+                    _update_namespaces(namespaces, self._batch_updates[name])
+                for templ, timeout in self._prefetch_hooks:
+                    self.hook_runner.prefetch(
+                        jinja_render_template_strictly(templ, namespaces),
+                        timeout)
+            except Exception as e:
+                # the hooks are executed when the script is written anyway
+                _LOGGER.debug("Not prefetching pre-submit commands for sample "
+                              "'{}': {}".format(name,
+                                                getattr(e, 'message', repr(e))))
+
+    def _evaluate_sample(self, sample, rerun):
+        """
+        Determine whether a sample is to be submitted, from its flags, its
+        toggle attribute and its input files
+
+        :param peppy.Sample sample: sample to evaluate
+        :param bool rerun: whether the sample is being rerun rather than
             run for the first time
-        :return bool: Indication of whether the given sample was added to
-            the current 'pool.'
-        :raise TypeError: If sample subtype is provided but does not extend
-            the base Sample class, raise a TypeError.
+        :return (bool, list[str], list[str], dict, list[(int, str)]): whether
+            the sample is used, the reasons it is skipped for, the reasons
+            for the plan, the result of the input validation, and the messages
+            to log, with their levels
         """
-        _LOGGER.debug("Adding {} to conductor for {} to {}run".format(
-            sample.sample_name, self.pl_name, "re" if rerun else ""))
         flag_files = fetch_sample_flags(self.prj, sample, self.pl_name)
         use_this_sample = not rerun
+        # why the sample is not used, for the plan
+        plan_reasons = []
+        messages = []
 
         if flag_files or rerun:
             if not self.ignore_flags:
@@ -327,7 +719,8 @@ class SubmissionConductor(object):
             failed_flag = any("failed" in x for x in flag_files)
             if rerun:
                 if failed_flag:
-                    _LOGGER.info("> Re-running failed sample")
+                    messages.append(
+                        (logging.INFO, "> Re-running failed sample"))
                     use_this_sample = True
                 else:
                     use_this_sample = False
@@ -335,15 +728,17 @@ class SubmissionConductor(object):
                 msg = "> Skipping sample because no failed flag found"
                 if flag_files:
                     msg += ". Flags found: {}".format(flag_files)
-                _LOGGER.info(msg)
+                messages.append((logging.INFO, msg))
+                plan_reasons.append(msg[2:])
 
         if self.prj.toggle_key in sample \
                 and int(sample[self.prj.toggle_key]) == 0:
-            _LOGGER.warning(
-                "> Skipping sample ({}: {})".
-                    format(self.prj.toggle_key, sample[self.prj.toggle_key])
-            )
+            messages.append((logging.WARNING, "> Skipping sample ({}: {})".
+                             format(self.prj.toggle_key,
+                                    sample[self.prj.toggle_key])))
             use_this_sample = False
+            plan_reasons.append("Toggled off ({}: {})".format(
+                self.prj.toggle_key, sample[self.prj.toggle_key]))
 
         skip_reasons = []
         validation = {}
@@ -352,11 +747,40 @@ class SubmissionConductor(object):
         _LOGGER.debug("Determining missing requirements")
         schema_source = self.pl_iface.get_pipeline_schemas()
         if schema_source and self.prj.file_checks:
-            validation = validate_inputs(sample, read_schema(schema_source))
+            validation = validate_inputs(sample,
+                                         self._read_schema(schema_source))
             if validation[MISSING_KEY]:
                 missing_reqs_msg = f"Missing files: {validation[MISSING_KEY]}"
-                _LOGGER.warning(NOT_SUB_MSG.format(missing_reqs_msg))
+                messages.append((logging.WARNING,
+                                 NOT_SUB_MSG.format(missing_reqs_msg)))
                 use_this_sample and skip_reasons.append("Missing files")
+                plan_reasons.append(missing_reqs_msg)
+        return use_this_sample, skip_reasons, plan_reasons, validation, \
+            messages
+
+    def add_sample(self, sample, rerun=False):
+        """
+        Add a sample for submission to this conductor.
+
+        :param peppy.Sample sample: sample to be included with this conductor's
+            currently growing collection of command submissions
+        :param bool rerun: whether the given sample is being rerun rather than
+            run for the first time
+        :return bool: Indication of whether the given sample was added to
+            the current 'pool.'
+        :raise TypeError: If sample subtype is provided but does not extend
+            the base Sample class, raise a TypeError.
+        """
+        _LOGGER.debug("Adding {} to conductor for {} to {}run".format(
+            sample.sample_name, self.pl_name, "re" if rerun else ""))
+        evaluation = self._evaluated.pop(sample.sample_name, None) or \
+            self._evaluate_sample(sample, rerun)
+        use_this_sample, skip_reasons, plan_reasons, validation, messages = \
+            evaluation
+        for level, msg in messages:
+            _LOGGER.log(level, msg)
+        # the hooks of the next samples run while this one is submitted
+        self._prefetch_upcoming(sample, rerun)
 
         if _use_sample(use_this_sample, skip_reasons):
             self._pool.append(sample)
@@ -364,6 +788,10 @@ class SubmissionConductor(object):
             if self.automatic and self._is_full(self._pool, self._curr_size):
                 self.submit()
         else:
+            if self.plan is not None:
+                self.plan.add_skipped(self.pl_name, sample.sample_name,
+                                      plan_reasons,
+                                      validation[INPUT_FILE_SIZE_KEY])
             self._curr_skip_size += float(validation[INPUT_FILE_SIZE_KEY])
             self._curr_skip_pool.append(sample)
             if self._is_full(self._curr_skip_pool, self._curr_skip_size):
@@ -384,7 +812,8 @@ class SubmissionConductor(object):
         :param bool force: Whether submission should be done/simulated even
             if this conductor's pool isn't full.
         :return bool: Whether a job was submitted (or would've been if
-            not for dry run)
+            not for dry run); whether it was queued, if the script is
+            rendered in the render pool
         """
         submitted = False
         if not self._pool:
@@ -397,43 +826,188 @@ class SubmissionConductor(object):
                         s[SAMPLE_NAME_ATTR]), OUTPUT_SCHEMA_KEY)
 
                     for schema in schemas:
-                        populate_sample_paths(s, read_schema(schema))
-
-            script = self.write_script(self._pool, self._curr_size)
-            # Determine whether to actually do the submission.
-            _LOGGER.info("Job script (n={0}; {1:.2f}Gb): {2}".
-                         format(len(self._pool), self._curr_size, script))
-            if self.dry_run:
-                _LOGGER.info("Dry run, not submitted")
-            elif self._rendered_ok:
-                sub_cmd = self.prj.dcc.compute.submission_command
-                submission_command = "{} {}".format(sub_cmd, script)
-                # Capture submission command return value so that we can
-                # intercept and report basic submission failures; #167
-                try:
-                    subprocess.check_call(submission_command, shell=True)
-                except subprocess.CalledProcessError:
-                    fails = "" if self.collate \
-                        else [s.sample_name for s in self._samples]
-                    self._failed_sample_names.extend(fails)
-                    self._reset_pool()
-                    raise JobSubmissionException(sub_cmd, script)
-                time.sleep(self.delay)
+                        populate_sample_paths(s, self._read_schema(schema))
 
-            # Update the job and command submission tallies.
-            _LOGGER.debug("SUBMITTED")
-            if self._rendered_ok:
+            if self.plan is not None:
+                submitted = self._plan_job(self._pool, self._curr_size)
+                self._reset_pool()
+            elif self.render_pool is not None:
+                self._queue_script(self._pool, self._curr_size)
                 submitted = True
-                self._num_cmds_submitted += len(self._pool)
-            self._reset_pool()
+                self._reset_pool()
+            else:
+                script = self.write_script(self._pool, self._curr_size)
+                try:
+                    submitted = self._submit_script(
+                        script, self._pool, self._curr_size)
+                finally:
+                    self._reset_pool()
 
         else:
             _LOGGER.debug("No submission (pool is not full and submission "
                           "was not forced): %s", self.pl_name)
             # submitted = False
 
+        if self.render_pool is not None:
+            self.finish_rendering(wait=force)
+        if force or self.collate:
+            self.submit_queued()
         return submitted
 
+    def finish_rendering(self, wait=True):
+        """
+        Write and submit the scripts rendered in the render pool, in the
+        order their jobs were queued.
+
+        Jobs that could not be rendered in the pool are rendered here. The
+        samples of the jobs that fail to submit are reported as failed.
+
+        :param bool wait: whether to wait for all the queued jobs; otherwise,
+            the jobs are finished as long as they are rendered already or
+            more than the pool allows are pending
+        """
+        while self._pending_renders:
+            future, pool, size, namespaces = self._pending_renders[0]
+            if not wait and not future.done() and \
+                    len(self._pending_renders) <= self.render_pool.max_pending:
+                break
+            self._pending_renders.popleft()
+            try:
+                command, message, content = future.result()
+            except Exception as e:
+                _LOGGER.debug("Rendering the script for sample '{}' in the "
+                              "main process: {}".format(
+                    pool[0].sample_name, getattr(e, 'message', repr(e))))
+                command, message = render_command(
+                    self._command_template(), self.extra_pipe_args,
+                    namespaces)
+                content = None
+            self._count_command(command, message)
+            looper = namespaces["looper"]
+            looper.command = command or ""
+            script = self._write_rendered_script(looper, namespaces["compute"],
+                                                 content)
+            try:
+                self._submit_script(script, pool, size)
+            except JobSubmissionException as e:
+                _LOGGER.debug(str(e))
+
+    def close_backend(self):
+        """
+        Close the submission backends, once the queued scripts are submitted;
+        a backend that runs the jobs itself waits for them
+        """
+        backends = [self.backend] if self.backend is not None \
+            else list(self._backends.values())
+        for backend in backends:
+            backend.close()
+
+    def _submit_script(self, script, pool, size):
+        """
+        Submit a job script, unless this is a dry run.
+
+        The script is queued for the submission backend its compute settings
+        select and configure, which submits the scripts queued for it once there are as
+        many as its batch size.
+
+        :param str script: path to the job script
+        :param Iterable[peppy.Sample] pool: samples of the job
+        :param float size: cumulative size of the given pool
+        :return bool: Whether a job was submitted or queued (or would've been
+            if not for dry run)
+        :raise JobSubmissionException: if a script of the submitted batch
+            fails to submit
+        """
+        # Determine whether to actually do the submission.
+        _LOGGER.info("Job script (n={0}; {1:.2f}Gb): {2}".
+                     format(len(pool), size, script))
+        if self.dry_run:
+            _LOGGER.info("Dry run, not submitted")
+        elif self._rendered_ok:
+            key = _backend_key(self._script_compute)
+            if key not in self._backends:
+                self._backends[key] = self.backend or \
+                    create_backend(self._script_compute)
+            queued = self._queued_scripts.setdefault(key, [])
+            queued.append((script, pool))
+            if len(queued) >= self._backends[key].batch_size:
+                self.submit_queued(key)
+            return True
+
+        # Update the job and command submission tallies.
+        _LOGGER.debug("SUBMITTED")
+        if self._rendered_ok:
+            self._num_cmds_submitted += len(pool)
+            return True
+        return False
+
+    def submit_queued(self, key=None):
+        """
+        Submit the scripts queued for the submission backends, in one batch
+        per backend.
+
+        The job IDs the backends return are recorded by job name. The samples
+        of the scripts that fail to submit are reported as failed.
+
+        :param str key: key of the compute settings of the scripts to submit,
+            all the queued scripts by default
+        :raise JobSubmissionException: if a script fails to submit, once the
+            rest of the batches are submitted
+        """
+        keys = list(self._queued_scripts) if key is None else [key]
+        batches = [(k, self._queued_scripts.pop(k)) for k in keys
+                   if self._queued_scripts.get(k)]
+        if not batches:
+            return
+        # the scripts and the files they use must be on disk first
+        flush_writes()
+        error = None
+        for k, batch in batches:
+            error = self._submit_batch(self._backends[k], batch) or error
+        time.sleep(self.delay)
+        if error is not None:
+            raise error
+
+    def _submit_batch(self, backend, batch):
+        """
+        Submit a batch of queued scripts with a submission backend
+
+        :param SubmissionBackend backend: backend to submit the scripts with
+        :param list[(str, Iterable[peppy.Sample])] batch: scripts and the
+            samples of their jobs
+        :return JobSubmissionException | NoneType: error of the first script
+            that failed to submit, if any
+        """
+        job_ids = backend.submit_many([script for script, _ in batch])
+        error = None
+        for (script, pool), job_id in zip(batch, job_ids):
+            if isinstance(job_id, Exception):
+                fails = "" if self.collate \
+                    else [s.sample_name for s in pool]
+                self._failed_sample_names.extend(fails)
+                _LOGGER.debug(str(job_id))
+                error = error or job_id
+                continue
+            job_name = os.path.splitext(os.path.basename(script))[0]
+            self._job_ids[job_name] = (job_id, backend)
+            if job_id is not None:
+                _LOGGER.info("Submitted job {}: {}".format(job_name, job_id))
+            _LOGGER.debug("SUBMITTED")
+            self._num_cmds_submitted += len(pool)
+        return error
+
+    def _read_schema(self, source):
+        """
+        Read a schema, once per conductor
+
+        :param str source: path or URL of the schema
+        :return list[dict]: schema and the schemas it imports, as read by
+            eido; must not be modified
+        """
+        if source not in self._schemas:
+            self._schemas[source] = read_schema(source)
+        return self._schemas[source]
+
     def _is_full(self, pool, size):
         """
         Determine whether it's time to submit a job for the pool of commands.
@@ -491,18 +1065,17 @@ class SubmissionConductor(object):
         :param float size: cumulative size of the given pool
         :return dict: looper/submission related settings
         """
-        settings = AttMap()
-        settings.pep_config = self.prj.config_file
-        settings.results_subdir = self.prj.results_folder
-        settings.submission_subdir = self.prj.submission_folder
-        settings.output_dir = self.prj.output_dir
+        settings = self._project_looper_namespace()
+        lump_name = self._sample_lump_name(pool)
         settings.sample_output_folder = \
-            os.path.join(self.prj.results_folder, self._sample_lump_name(pool))
+            os.path.join(self.prj.results_folder, lump_name)
         settings.job_name = self._jobname(pool)
         settings.total_input_size = size
-        settings.log_file = \
-            os.path.join(self.prj.submission_folder, settings.job_name) + ".log"
-        settings.piface_dir = os.path.dirname(self.pl_iface.pipe_iface_file)
+        # sharded by sample name, so the job files of a sample share the
+        # folder with its YAML files
+        settings.log_file = sharded_path(
+            self.prj.submission_folder, lump_name,
+            settings.job_name + ".log", settings.shard_depth)
         if hasattr(self.prj, "pipeline_config"):
             # Make sure it's a file (it could be provided as null.)
             pl_config_file = self.prj.pipeline_config
@@ -516,6 +1089,22 @@ class SubmissionConductor(object):
                 settings.pipeline_config = pl_config_file
         return settings
 
+    def _project_looper_namespace(self):
+        """
+        Compile the looper settings that do not depend on the submitted
+        samples
+
+        :return dict: looper/submission related settings
+        """
+        settings = AttMap()
+        settings.pep_config = self.prj.config_file
+        settings.results_subdir = self.prj.results_folder
+        settings.submission_subdir = self.prj.submission_folder
+        settings.output_dir = self.prj.output_dir
+        settings.piface_dir = os.path.dirname(self.pl_iface.pipe_iface_file)
+        settings.shard_depth = self.prj.shard_depth
+        return settings
+
     def write_script(self, pool, size):
         """
         Create the script for job submission.
@@ -529,63 +1118,200 @@ class SubmissionConductor(object):
             pool = [None]
         looper = self._set_looper_namespace(pool, size)
         commands = []
-        namespaces = dict(project=self.prj[CONFIG_KEY],
-                          looper=looper,
-                          pipeline=self.pl_iface,
-                          compute=self.prj.dcc.compute)
+        templ = self._command_template()
+        for sample in pool:
+            namespaces = self._prepare_namespaces(sample, looper, size)
+            command, message = render_command(templ, self.extra_pipe_args,
+                                              namespaces)
+            self._count_command(command, message)
+            if command is not None:
+                commands.append(command)
+        looper.command = "\n".join(commands)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            if self.collate:
+                _LOGGER.debug("samples namespace:\n{}".format(self.prj.samples))
+            else:
+                _LOGGER.debug("sample namespace:\n{}".format(
+                    sample.__str__(max_attr=len(list(sample.keys())))))
+            _LOGGER.debug("project namespace:\n{}".format(self.prj[CONFIG_KEY]))
+            _LOGGER.debug("pipeline namespace:\n{}".format(
+                namespaces["pipeline"]))
+            _LOGGER.debug("compute namespace:\n{}".format(
+                namespaces["compute"]))
+            _LOGGER.debug("looper namespace:\n{}".format(looper))
+        # the script is rendered with the compute settings of the last sample
+        return self._write_rendered_script(looper, namespaces["compute"])
+
+    def _plan_job(self, pool, size):
+        """
+        Record a job in the plan, as it would be submitted.
+
+        The namespaces and the commands are created like for write_script,
+        without executing the pre-submission hooks, and the script is not
+        written.
+
+        :param Iterable[peppy.Sample] pool: collection of sample instances
+        :param float size: cumulative size of the given pool
+        :return bool: whether the job would be submitted
+        """
+        if self.collate:
+            pool = [None]
+        looper = self._set_looper_namespace(pool, size)
+        commands = []
+        reasons = []
+        templ = self._command_template()
+        for sample in pool:
+            namespaces = self._sample_namespaces(sample, looper, size)
+            command, message = render_command(templ, self.extra_pipe_args,
+                                              namespaces)
+            self._count_command(command, message)
+            if command is None:
+                reasons.append(message)
+            else:
+                commands.append(command)
+        samples = [] if self.collate else [s.sample_name for s in pool]
+        self.plan.add_job(self.pl_name, looper.job_name, samples, size,
+                          namespaces["compute"], commands, reasons,
+                          submitted=self._rendered_ok)
+        if self._rendered_ok:
+            self._num_cmds_submitted += len(pool)
+        return self._rendered_ok
+
+    def _queue_script(self, pool, size):
+        """
+        Queue the script of a single-sample job to be rendered in the render
+        pool.
+
+        The namespaces are created and the pre-submission hooks executed
+        here, like for write_script; the script is written and submitted by
+        finish_rendering.
+
+        :param Iterable[peppy.Sample] pool: the sample of the job
+        :param float size: input file size of the sample
+        """
+        looper = self._set_looper_namespace(pool, size)
+        namespaces = self._prepare_namespaces(pool[0], looper, size)
+        try:
+            job = (template_context([self._command_template()], namespaces),
+                   dict(namespaces["compute"].items()), looper.to_dict())
+            future = self.render_pool.submit(self._render_key, job)
+        except Exception as e:
+            # e.g. the template uses the namespaces in a way that prevents
+            # copying the values it references
+            _LOGGER.debug("Not rendering the script for sample '{}' in the "
+                          "render pool: {}".format(
+                pool[0].sample_name, getattr(e, 'message', repr(e))))
+            future = Future()
+            future.set_exception(e)
+        self._pending_renders.append((future, pool, size, namespaces))
+
+    def _command_template(self):
+        """
+        Get the command template of the pipeline, with the extras
+
+        :return str: command template
+        """
         templ = self.pl_iface["command_template"]
         if not self.override_extra:
             extras_template = EXTRA_PROJECT_CMD_TEMPLATE if self.collate \
                 else EXTRA_SAMPLE_CMD_TEMPLATE
             templ += extras_template
-        for sample in pool:
-            # cascading compute settings determination:
-            # divcfg < pipeline interface < config <  CLI
-            cli = self.compute_variables or {}  # CLI
-            if sample:
-                namespaces.update({"sample": sample})
-            else:
-                namespaces.update({"samples": self.prj.samples})
-            res_pkg = self.pl_iface.choose_resource_package(namespaces, size or 0)  # config
-            res_pkg.update(cli)
-            self.prj.dcc.compute.update(res_pkg)  # divcfg
-            namespaces["compute"].update(res_pkg)
-            self.pl_iface.render_var_templates(namespaces=namespaces)
-            namespaces["pipeline"] = self.pl_iface
-            # pre_submit hook namespace updates
-            namespaces = _exec_pre_submit(self.pl_iface, namespaces)
-            self._rendered_ok = False
-            try:
-                argstring = jinja_render_template_strictly(template=templ,
-                                                           namespaces=namespaces)
-            except UndefinedError as jinja_exception:
-                _LOGGER.warning(NOT_SUB_MSG.format(str(jinja_exception)))
-            except KeyError as e:
-                exc = "pipeline interface is missing {} section".format(str(e))
-                _LOGGER.warning(NOT_SUB_MSG.format(exc))
-            else:
-                commands.append("{} {}".format(argstring, self.extra_pipe_args))
-                self._rendered_ok = True
-                self._num_good_job_submissions += 1
-                self._num_total_job_submissions += 1
-        looper.command = "\n".join(commands)
-        if self.collate:
-            _LOGGER.debug("samples namespace:\n{}".format(self.prj.samples))
+        return templ
+
+    def _prepare_namespaces(self, sample, looper, size):
+        """
+        Create the namespaces of a sample and update them with the
+        pre-submission hooks
+
+        :param peppy.Sample | NoneType sample: sample to create the
+            namespaces for, None for a collate job
+        :param attmap.AttMap looper: looper namespace
+        :param float size: input file size of the submission
+        :return dict[Mapping]: namespaces
+        """
+        namespaces = self._sample_namespaces(sample, looper, size)
+        # batch pre_submit hook namespace updates, then the per-sample ones
+        if sample and sample.sample_name in self._batch_updates:
+            _update_namespaces(namespaces,
+                               self._batch_updates[sample.sample_name])
+        # pre_submit hook namespace updates
+        return _exec_pre_submit(self.pl_iface, namespaces, self.hook_runner)
+
+    def _count_command(self, command, message):
+        """
+        Record the outcome of rendering the command of a sample
+
+        :param str | NoneType command: rendered command, None if it could
+            not be rendered
+        :param str | NoneType message: message explaining why the command
+            could not be rendered
+        """
+        self._rendered_ok = command is not None
+        if command is None:
+            _LOGGER.warning(message)
+        else:
+            self._num_good_job_submissions += 1
+            self._num_total_job_submissions += 1
+
+    def _write_rendered_script(self, looper, compute, content=None):
+        """
+        Write a job script next to the job log
+
+        :param attmap.AttMap looper: looper namespace, with the commands
+        :param Mapping compute: compute settings to render the script with
+        :param str content: script content, if rendered already
+        :return str: path to the job script
+        """
+        subm_path = os.path.join(os.path.dirname(looper.log_file),
+                                 looper.job_name + ".sub")
+        _LOGGER.info("Writing script to {}".format(os.path.abspath(subm_path)))
+        self._script_compute = compute
+        if content is None:
+            content = render_submission_script(
+                self.prj.dcc.get_adapters(), compute, [{"looper": looper}])
+        _write_content(subm_path, content.encode("utf-8"))
+        return subm_path
+
+    def _sample_namespaces(self, sample, looper, size):
+        """
+        Create the namespaces to render the commands for a sample with.
+
+        The project, pipeline and compute namespaces are overlays on layers
+        shared by all the samples, which are never modified: the namespaces
+        are updated, with the rendered 'var_templates' and by the
+        pre-submission hooks, in their own top layer. The compute settings
+        cascade as follows, from the lowest priority: divvy compute package
+        < pipeline interface < project config < CLI < sample.
+
+        :param peppy.Sample | NoneType sample: sample to create the
+            namespaces for, None for a collate job
+        :param attmap.AttMap looper: looper namespace
+        :param float size: input file size of the submission
+        :return dict[Mapping]: namespaces
+        """
+        namespaces = dict(project=overlay(self.prj[CONFIG_KEY]),
+                          looper=looper,
+                          pipeline=overlay(self.pl_iface),
+                          compute=overlay(self.prj.dcc.compute))
+        if sample:
+            namespaces["sample"] = sample
         else:
-            _LOGGER.debug("sample namespace:\n{}".format(
-                sample.__str__(max_attr=len(list(sample.keys())))))
-        _LOGGER.debug("project namespace:\n{}".format(self.prj[CONFIG_KEY]))
-        _LOGGER.debug("pipeline namespace:\n{}".format(self.pl_iface))
-        _LOGGER.debug("compute namespace:\n{}".format(self.prj.dcc.compute))
-        _LOGGER.debug("looper namespace:\n{}".format(looper))
-        subm_base = os.path.join(self.prj.submission_folder, looper.job_name)
-        return self.prj.dcc.write_script(output_path=subm_base + ".sub",
-                                         extra_vars=[{"looper": looper}])
+            namespaces["samples"] = self.prj.samples
+        resources = self.pl_iface.choose_resource_layers(namespaces, size or 0)
+        namespaces["compute"] = overlay(self.compute_variables, *resources,
+                                        self.prj.dcc.compute)
+        var_templates = self.pl_iface.render_var_templates(namespaces)
+        if var_templates is not None:
+            namespaces["pipeline"][VAR_TEMPL_KEY] = var_templates
+        return namespaces
 
     def write_skipped_sample_scripts(self):
         """
         For any sample skipped during initial processing write submission script
         """
+        if self.plan is not None:
+            # the skipped samples are recorded in the plan already
+            return
         if self._curr_skip_pool:
             # move any hanging samples from current skip pool to the main pool
             self._skipped_sample_pools.append(
@@ -611,12 +1337,65 @@ def _use_sample(flag, skips):
     return flag and not skips
 
 
-def _exec_pre_submit(piface, namespaces):
+def _update_namespaces(x, y, cmd=False):
+    """
+    Update namespaces mapping with a dictionary of the same structure,
+    that includes just the values that need to be updated.
+
+    :param dict[dict] x: namespaces mapping
+    :param dict[dict] y: mapping to update namespaces with
+    :param bool cmd: whether the mapping to upodate with comes from the
+        command template, used for messaging
+    """
+    if not isinstance(y, dict):
+        if cmd:
+            raise TypeError(
+                f"Object returned by {PRE_SUBMIT_HOOK_KEY}."
+                f"{PRE_SUBMIT_CMD_KEY} must return a dictionary when "
+                f"processed with json.loads(), not {y.__class__.__name__}")
+        raise TypeError(f"Object returned by {PRE_SUBMIT_HOOK_KEY}."
+                        f"{PRE_SUBMIT_PY_FUN_KEY} must return a dictionary,"
+                        f" not {y.__class__.__name__}")
+    _LOGGER.debug("Updating namespaces with:\n{}".format(y))
+    for namespace, mapping in y.items():
+        for attr, val in mapping.items():
+            setattr(x[namespace], attr, val)
+
+
+def _cmd_hook_specs(piface):
+    """
+    Get the command template hooks defined in the pipeline interface.
+
+    Each hook is either a command template or a mapping with the template
+    and the hook settings: 'timeout', in seconds, and 'cacheable', whether
+    the output of the rendered command can be memoized.
+
+    :param PipelineInterface piface: piface, a source of pre_submit hooks
+    :return list[(str, float | NoneType, bool)]: command template, timeout
+        and whether it is cacheable, for each hook
+    """
+    if PRE_SUBMIT_HOOK_KEY not in piface or \
+            PRE_SUBMIT_CMD_KEY not in piface[PRE_SUBMIT_HOOK_KEY]:
+        return []
+    specs = []
+    for hook in piface[PRE_SUBMIT_HOOK_KEY][PRE_SUBMIT_CMD_KEY]:
+        if isinstance(hook, Mapping):
+            specs.append((hook[PRE_SUBMIT_TEMPLATE_KEY],
+                          hook.get(PRE_SUBMIT_TIMEOUT_KEY),
+                          bool(hook.get(PRE_SUBMIT_CACHEABLE_KEY, False))))
+        else:
+            specs.append((hook, None, False))
+    return specs
+
+
+def _exec_pre_submit(piface, namespaces, hook_runner=None):
     """
     Execute pre submission hooks defined in the pipeline interface
 
     :param PipelineInterface piface: piface, a source of pre_submit hooks to execute
     :param dict[dict[]] namespaces: namspaces mapping
+    :param HookCommandRunner hook_runner: runner of the hook commands;
+        if not provided, the commands are run directly
     :return dict[dict[]]: updated namspaces mapping
     """
 
@@ -625,29 +1404,6 @@ def _exec_pre_submit(piface, namespaces):
         _LOGGER.error("Could not retrieve JSON via command: '{}'".format(cmd))
         raise
 
-    def _update_namespaces(x, y, cmd=False):
-        """
-        Update namespaces mapping with a dictionary of the same structure,
-        that includes just the values that need to be updated.
-
-        :param dict[dict] x: namespaces mapping
-        :param dict[dict] y: mapping to update namespaces with
-        :param bool cmd: whether the mapping to upodate with comes from the
-            command template, used for messaging
-        """
-        if not isinstance(y, dict):
-            if cmd:
-                raise TypeError(
-                    f"Object returned by {PRE_SUBMIT_HOOK_KEY}."
-                    f"{PRE_SUBMIT_CMD_KEY} must return a dictionary when "
-                    f"processed with json.loads(), not {y.__class__.__name__}")
-            raise TypeError(f"Object returned by {PRE_SUBMIT_HOOK_KEY}."
-                            f"{PRE_SUBMIT_PY_FUN_KEY} must return a dictionary,"
-                            f" not {y.__class__.__name__}")
-        _LOGGER.debug("Updating namespaces with:\n{}".format(y))
-        for namespace, mapping in y.items():
-            for attr, val in mapping.items():
-                setattr(x[namespace], attr, val)
     if PRE_SUBMIT_HOOK_KEY in piface:
         pre_submit = piface[PRE_SUBMIT_HOOK_KEY]
         if PRE_SUBMIT_PY_FUN_KEY in pre_submit:
@@ -658,21 +1414,109 @@ def _exec_pre_submit(piface, namespaces):
                 _LOGGER.info("Calling pre-submit function: {}.{}".format(
                     pkgstr, func.__name__))
                 _update_namespaces(namespaces, func(namespaces))
-        if PRE_SUBMIT_CMD_KEY in pre_submit:
-            for cmd_template in pre_submit[PRE_SUBMIT_CMD_KEY]:
-                _LOGGER.debug(
-                    "Rendering pre-submit command template: {}".format(
-                        cmd_template))
-                try:
-                    cmd = jinja_render_template_strictly(template=cmd_template,
-                                                         namespaces=namespaces)
-                    _LOGGER.info("Executing pre-submit command: {}".format(cmd))
-                    json = loads(check_output(cmd, shell=True))
-                except CalledProcessError as e:
-                    print(e.output)
-                    _log_raise_latest(cmd)
-                except Exception:
-                    _log_raise_latest(cmd_template)
-                else:
-                    _update_namespaces(namespaces, json, cmd=True)
+        cmd_specs = _cmd_hook_specs(piface)
+        if cmd_specs:
+            # the commands may read the files written by the functions
+            flush_writes()
+        for cmd_template, timeout, cacheable in cmd_specs:
+            _LOGGER.debug(
+                "Rendering pre-submit command template: {}".format(
+                    cmd_template))
+            try:
+                cmd = jinja_render_template_strictly(template=cmd_template,
+                                                     namespaces=namespaces)
+                _LOGGER.info("Executing pre-submit command: {}".format(cmd))
+                json = hook_runner.run(cmd, timeout, cacheable) \
+                    if hook_runner is not None \
+                    else run_hook_command(cmd, timeout)
+            except CalledProcessError as e:
+                print(e.output)
+                _log_raise_latest(cmd)
+            except Exception:
+                _log_raise_latest(cmd_template)
+            else:
+                _update_namespaces(namespaces, json, cmd=True)
     return namespaces
+
+
+def _backend_key(compute):
+    """
+    Get the key of the submission backend for the compute settings of a
+    script; scripts whose settings configure the backend the same way, even
+    with different resources, share the backend
+
+    :param Mapping compute: compute settings of the script
+    :return str: key of the settings
+    """
+    return dumps(backend_settings(compute), sort_keys=True, default=str)
+
+
+def _exec_batch_pre_submit(piface, namespaces):
+    """
+    Execute batch pre submission hooks defined in the pipeline interface.
+
+    Batch hooks are executed once for all the samples: Python functions are
+    called with the namespaces mapping, which includes the list of samples
+    in the 'samples' namespace; commands read the samples from the standard
+    input, one JSON object per line. Both return namespace updates keyed by
+    sample name, e.g. {"sample1": {"sample": {"genome": "hg38"}}}
+
+    :param PipelineInterface piface: piface, a source of pre_submit hooks
+        to execute
+    :param dict[dict[]] namespaces: namespaces mapping, with the samples
+    :return dict[dict[dict]]: namespace updates keyed by sample name
+    """
+    updates = {}
+    if PRE_SUBMIT_HOOK_KEY not in piface:
+        return updates
+    pre_submit = piface[PRE_SUBMIT_HOOK_KEY]
+    if PRE_SUBMIT_BATCH_PY_FUN_KEY in pre_submit:
+        for py_fun in pre_submit[PRE_SUBMIT_BATCH_PY_FUN_KEY]:
+            pkgstr, funcstr = os.path.splitext(py_fun)
+            pkg = importlib.import_module(pkgstr)
+            func = getattr(pkg, funcstr[1:])
+            _LOGGER.info("Calling batch pre-submit function: {}.{}".format(
+                pkgstr, func.__name__))
+            _update_batch_updates(updates, func(namespaces),
+                                  PRE_SUBMIT_BATCH_PY_FUN_KEY)
+    if PRE_SUBMIT_BATCH_CMD_KEY in pre_submit:
+        samples_lines = "".join(
+            dumps(sample.to_dict(), default=str) + "\n"
+            for sample in namespaces["samples"])
+        for cmd_template in pre_submit[PRE_SUBMIT_BATCH_CMD_KEY]:
+            _LOGGER.debug("Rendering batch pre-submit command template: {}".
+                          format(cmd_template))
+            cmd = jinja_render_template_strictly(template=cmd_template,
+                                                 namespaces=namespaces)
+            _LOGGER.info("Executing batch pre-submit command: {}".format(cmd))
+            try:
+                output = check_output(cmd, shell=True,
+                                      input=samples_lines.encode())
+                json = loads(output)
+            except Exception:
+                _LOGGER.error("Could not retrieve JSON via command: '{}'".
+                              format(cmd))
+                raise
+            _update_batch_updates(updates, json, PRE_SUBMIT_BATCH_CMD_KEY)
+    return updates
+
+
+def _update_batch_updates(x, y, hook_key):
+    """
+    Update the namespace updates keyed by sample name with the ones returned
+    by a batch hook; the later hooks take precedence
+
+    :param dict[dict[dict]] x: namespace updates keyed by sample name
+    :param dict[dict[dict]] y: namespace updates returned by a hook
+    :param str hook_key: pre_submit section the hook comes from, used for
+        messaging
+    """
+    if not isinstance(y, dict) or \
+            not all(isinstance(v, dict) for v in y.values()):
+        raise TypeError(f"Object returned by {PRE_SUBMIT_HOOK_KEY}."
+                        f"{hook_key} must be a dictionary of namespace "
+                        f"updates keyed by sample name")
+    for sample_name, namespaces in y.items():
+        for namespace, mapping in namespaces.items():
+            x.setdefault(str(sample_name), {}).\
+                setdefault(namespace, {}).update(mapping)
@@ -12,6 +12,7 @@ __all__ = [
     "SIZE_DEP_VARS_KEY", "FLAGS", "DYN_VARS_KEY", "SAMPLE_YAML_PATH_KEY",
     "RESOURCES_KEY", "NOT_SUB_MSG", "EXTRA_KEY", "DEFAULT_CFG_PATH",
     "PIFACE_SCHEMA_SRC", "RESULTS_SUBDIR_KEY", "SUBMISSION_SUBDIR_KEY",
+    "SHARD_DEPTH_KEY",
     "TEMPLATES_DIRNAME", "FILE_SIZE_COLNAME", "COMPUTE_PACKAGE_KEY",
     "INPUT_SCHEMA_KEY", "OUTPUT_SCHEMA_KEY", "EXAMPLE_COMPUTE_SPEC_FMT",
     "SAMPLE_PL_KEY", "PROJECT_PL_KEY", "CFG_ENV_VARS", "LOGGING_LEVEL",
@@ -21,8 +22,15 @@ __all__ = [
     "EXTRA_SAMPLE_CMD_TEMPLATE", "SELECTED_COMPUTE_PKG", "CLI_PROJ_ATTRS",
     "DOTFILE_CFG_PTH_KEY", "DRY_RUN_KEY", "FILE_CHECKS_KEY", "CLI_KEY",
     "PRE_SUBMIT_HOOK_KEY", "PRE_SUBMIT_PY_FUN_KEY", "PRE_SUBMIT_CMD_KEY",
+    "PRE_SUBMIT_BATCH_PY_FUN_KEY", "PRE_SUBMIT_BATCH_CMD_KEY",
+    "PRE_SUBMIT_TEMPLATE_KEY", "PRE_SUBMIT_TIMEOUT_KEY",
+    "PRE_SUBMIT_CACHEABLE_KEY", "PRE_SUBMIT_CACHE_FILENAME",
     "SUBMISSION_YAML_PATH_KEY", "SAMPLE_YAML_PRJ_PATH_KEY",
-    "SAMPLE_CWL_YAML_PATH_KEY",
+    "SAMPLE_CWL_YAML_PATH_KEY", "SAMPLE_STORE_PATH_KEY", "JSON_EXT",
+    "SHARED_NAMESPACES", "SHARED_NAMESPACES_KEY", "SHARED_NAMESPACES_SUBDIR",
+    "OBJECTS_COLNAMES", "SUMMARY_CACHE_FILENAME", "REPORT_MANIFEST_FILENAME",
+    "SUMMARY_FORMATS", "SUBMISSION_BACKEND_KEY", "SUBMISSION_BATCH_SIZE_KEY",
+    "SUBMISSION_BACKENDS_GROUP",
 ]
 
 FLAGS = ["completed", "running", "failed", "waiting", "partial"]
@@ -71,6 +79,12 @@ def _get_apperance_dict(type, templ=APPEARANCE_BY_FLAG):
 PRE_SUBMIT_HOOK_KEY = "pre_submit"
 PRE_SUBMIT_PY_FUN_KEY = "python_functions"
 PRE_SUBMIT_CMD_KEY = "command_templates"
+PRE_SUBMIT_BATCH_PY_FUN_KEY = "batch_python_functions"
+PRE_SUBMIT_BATCH_CMD_KEY = "batch_command_templates"
+# keys of the command_templates entries given as mappings
+PRE_SUBMIT_TEMPLATE_KEY = "template"
+PRE_SUBMIT_TIMEOUT_KEY = "timeout"
+PRE_SUBMIT_CACHEABLE_KEY = "cacheable"
 
 LOGGING_LEVEL = "INFO"
 CFG_ENV_VARS = ["LOOPER"]
@@ -93,6 +107,12 @@ SAMPLE_YAML_PATH_KEY = "sample_yaml_path"
 SAMPLE_YAML_PRJ_PATH_KEY = "sample_yaml_prj_path"
 SUBMISSION_YAML_PATH_KEY = "submission_yaml_path"
 SAMPLE_CWL_YAML_PATH_KEY = "sample_cwl_yaml_path"
+SAMPLE_STORE_PATH_KEY = "sample_store_path"
+JSON_EXT = ".json"
+# namespaces written once, to shared files, by write_submission_yaml
+SHARED_NAMESPACES = ["project", "pipeline", "compute"]
+SHARED_NAMESPACES_KEY = "shared_namespaces"
+SHARED_NAMESPACES_SUBDIR = "shared"
 TOGGLE_KEY_SELECTOR = "toggle_key"
 SAMPLE_TOGGLE_ATTR = "toggle"
 OUTKEY = "outputs"
@@ -113,6 +133,7 @@ LOOPER_KEY = "looper"
 OUTDIR_KEY = "output_dir"
 RESULTS_SUBDIR_KEY = "results_subdir"
 SUBMISSION_SUBDIR_KEY = "submission_subdir"
+SHARD_DEPTH_KEY = "shard_depth"
 DRY_RUN_KEY = "dry_run"
 FILE_CHECKS_KEY = "skip_file_checks"
 EXAMPLE_COMPUTE_SPEC_FMT = "k1=v1 k2=v2"
@@ -124,7 +145,21 @@ EXTRA_KEY = "_cli_extra"
 ALL_SUBCMD_KEY = "all"
 DEFAULT_CFG_PATH = os.path.join(os.getcwd(), LOOPER_DOTFILE_NAME)
 CLI_PROJ_ATTRS = [OUTDIR_KEY, TOGGLE_KEY_SELECTOR, SUBMISSION_SUBDIR_KEY, PIPELINE_INTERFACES_KEY,
-                  RESULTS_SUBDIR_KEY, PIFACE_KEY_SELECTOR, COMPUTE_PACKAGE_KEY, DRY_RUN_KEY, FILE_CHECKS_KEY]
+                  RESULTS_SUBDIR_KEY, PIFACE_KEY_SELECTOR, COMPUTE_PACKAGE_KEY, DRY_RUN_KEY, FILE_CHECKS_KEY,
+                  SHARD_DEPTH_KEY]
+
+SUMMARY_CACHE_FILENAME = "summary_cache.json"
+REPORT_MANIFEST_FILENAME = "report_manifest.json"
+PRE_SUBMIT_CACHE_FILENAME = "pre_submit_cache.json"
+SUMMARY_FORMATS = ["tsv", "parquet", "feather"]
+# compute package settings that select and configure the submission backend
+SUBMISSION_BACKEND_KEY = "submission_backend"
+SUBMISSION_BATCH_SIZE_KEY = "submission_batch_size"
+# entry point group the submission backends are registered in
+SUBMISSION_BACKENDS_GROUP = "looper.submission_backends"
+# this strongly depends on pypiper's objects.tsv format
+OBJECTS_COLNAMES = ['key', 'filename', 'anchor_text', 'anchor_image',
+                    'annotation']
 
 # resource package TSV-related consts
 ID_COLNAME = "id"
@@ -0,0 +1,562 @@
+""" Stand-in for a batch scheduler, to exercise the job submission offline
+
+The scheduler assigns job IDs, simulates the queue latency, submission
+failures and rate limits and, optionally, runs the jobs locally. It runs in
+the calling process; it can also serve other processes, like looper, which
+submit, query and cancel the jobs with commands that mimic sbatch, squeue
+and scancel. This module uses the standard library only, so the commands can
+run it as a script, without importing looper:
+
+    python fake_scheduler.py serve --queue-latency 1 --rate-limit 50
+    python fake_scheduler.py --address 127.0.0.1:PORT sbatch job.sub
+"""
+
+import argparse
+import json
+import os
+import random
+import shlex
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["FakeScheduler", "FakeSchedulerClient", "FakeSchedulerError",
+           "compute_package", "main"]
+
+# environment variable with the address of the scheduler daemon
+ADDRESS_ENV_VAR = "LOOPER_FAKE_SCHEDULER"
+
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED"
+
+# reasons a submission is rejected for, with the sbatch error messages
+REJECTION_MESSAGES = OrderedDict([
+    ("failure", "Batch job submission failed: Socket timed out on send/recv "
+                "operation"),
+    ("rate_limit", "Batch job submission failed: Resource temporarily "
+                   "unavailable"),
+    ("queue_full", "Batch job submission failed: Job violates accounting/QOS "
+                   "policy (job submit limit, user's size and/or time limits)")
+])
+
+
+class FakeSchedulerError(Exception):
+    """ Error type for when the fake scheduler rejects a submission. """
+    def __init__(self, reason):
+        self.reason = reason
+        super(FakeSchedulerError, self).__init__(REJECTION_MESSAGES[reason])
+
+
+class FakeScheduler(object):
+    """
+    Stand-in for a batch scheduler, like SLURM.
+
+    The jobs are pending for the queue latency, then run for the run time,
+    or, if they are executed, until their script exits. The state of the
+    jobs is updated when the scheduler is called, and, once it is started,
+    in a background thread.
+
+    :param float submit_latency: time each submission call takes, in seconds
+    :param float queue_latency: time the jobs are pending, in seconds
+    :param float run_time: time the jobs run, in seconds, unless they are
+        executed
+    :param float failure_rate: probability that a submission fails
+    :param float job_failure_rate: probability that a job fails, unless it
+        is executed
+    :param float rate_limit: number of submissions accepted per second; the
+        others are rejected
+    :param int max_jobs: number of pending and running jobs above which the
+        submissions are rejected
+    :param bool execute: whether to run the job scripts locally, with 'sh'
+    :param int seed: seed of the simulated failures
+    """
+    def __init__(self, submit_latency=0, queue_latency=0, run_time=0,
+                 failure_rate=0, job_failure_rate=0, rate_limit=None,
+                 max_jobs=None, execute=False, seed=None):
+        self.submit_latency = float(submit_latency)
+        self.queue_latency = float(queue_latency)
+        self.run_time = float(run_time)
+        self.failure_rate = float(failure_rate)
+        self.job_failure_rate = float(job_failure_rate)
+        self.rate_limit = float(rate_limit) if rate_limit else None
+        self.max_jobs = int(max_jobs) if max_jobs is not None else None
+        self.execute = _flag(execute)
+        self.jobs = OrderedDict()
+        self._active = OrderedDict()
+        self._processes = {}
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._tokens = self.rate_limit
+        self._tokens_time = None
+        self._counts = OrderedDict([("calls", 0), ("submitted", 0)] +
+                                   [(r, 0) for r in REJECTION_MESSAGES])
+        self._first_call = None
+        self._last_call = None
+        self._stopped = threading.Event()
+        self._ticker = None
+        self._server = None
+
+    def __str__(self):
+        return "{} ({} jobs; {} active)".format(
+            self.__class__.__name__, len(self.jobs), len(self._active))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def submit(self, script):
+        """
+        Submit a job script, like sbatch
+
+        :param str script: path to the job script
+        :return str: job ID
+        :raise FakeSchedulerError: if the submission is rejected
+        """
+        result = self.submit_many([script])[0]
+        if isinstance(result, FakeSchedulerError):
+            raise result
+        return result
+
+    def submit_many(self, scripts):
+        """
+        Submit job scripts in one call
+
+        :param Iterable[str] scripts: paths to the job scripts
+        :return list[str | FakeSchedulerError]: job ID of each script, or the
+            error its submission was rejected with
+        """
+        if self.submit_latency:
+            time.sleep(self.submit_latency)
+        with self._lock:
+            now = time.time()
+            self._advance(now)
+            self._counts["calls"] += 1
+            self._first_call = self._first_call or now
+            self._last_call = now
+            results = []
+            for script in scripts:
+                try:
+                    results.append(self._submit(script, now))
+                except FakeSchedulerError as e:
+                    self._counts[e.reason] += 1
+                    results.append(e)
+            return results
+
+    def squeue(self, job_ids=None):
+        """
+        Get the state of jobs, like squeue
+
+        :param Iterable[str] job_ids: IDs of the jobs, all by default
+        :return dict[str, str]: SLURM state of each known job, by job ID
+        """
+        with self._lock:
+            self._advance(time.time())
+            job_ids = self.jobs.keys() if job_ids is None else job_ids
+            return OrderedDict([(job_id, self.jobs[job_id]["state"])
+                                for job_id in job_ids if job_id in self.jobs])
+
+    def scancel(self, job_ids):
+        """
+        Cancel the pending and running jobs, like scancel
+
+        :param Iterable[str] job_ids: IDs of the jobs
+        """
+        with self._lock:
+            for job_id in job_ids:
+                if job_id in self._active:
+                    self._finish(job_id, CANCELLED, time.time())
+
+    def stats(self):
+        """
+        Get the submission statistics
+
+        :return dict: number of submission calls, of submitted jobs and of
+            rejected submissions by reason, number of jobs by state, and the
+            submitted jobs per second between the first and the last call
+        """
+        with self._lock:
+            self._advance(time.time())
+            stats = OrderedDict(self._counts)
+            stats["rejected"] = sum(self._counts[r]
+                                    for r in REJECTION_MESSAGES)
+            states = OrderedDict()
+            for job in self.jobs.values():
+                states[job["state"]] = states.get(job["state"], 0) + 1
+            stats["states"] = states
+            elapsed = (self._last_call or 0) - (self._first_call or 0)
+            stats["elapsed"] = elapsed
+            stats["throughput"] = \
+                self._counts["submitted"] / elapsed if elapsed > 0 else None
+            return stats
+
+    def wait(self, timeout=None, interval=0.05):
+        """
+        Wait for all the jobs to finish
+
+        :param float timeout: time to wait for at most, in seconds
+        :param float interval: time between the checks, in seconds
+        :return bool: whether all the jobs finished
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._lock:
+                self._advance(time.time())
+                if not self._active:
+                    return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(interval)
+
+    def start(self, interval=0.05):
+        """
+        Update the state of the jobs in a background thread
+
+        :param float interval: time between the updates, in seconds
+        """
+        if self._ticker is not None:
+            return
+        self._stopped.clear()
+
+        def _tick():
+            while not self._stopped.wait(interval):
+                with self._lock:
+                    self._advance(time.time())
+
+        self._ticker = threading.Thread(target=_tick, daemon=True)
+        self._ticker.start()
+
+    def serve(self, host="127.0.0.1", port=0):
+        """
+        Serve the scheduler to other processes, in a background thread
+
+        :param str host: host to listen on
+        :param int port: port to listen on; any free port by default
+        :return str: address of the scheduler, 'host:port'
+        """
+        scheduler = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    response = scheduler._handle(json.loads(line.decode()))
+                    self.wfile.write((json.dumps(response) + "\n").encode())
+
+        self.start()
+        self._server = socketserver.ThreadingTCPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return "{}:{}".format(*self._server.server_address[:2])
+
+    def stop(self):
+        """ Stop serving and updating the jobs; the running jobs are killed """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self._stopped.set()
+        self._ticker = None
+        with self._lock:
+            for job_id in list(self._processes):
+                self._finish(job_id, CANCELLED, time.time())
+
+    def _submit(self, script, now):
+        """
+        Accept a job, unless its submission fails or is throttled
+
+        :param str script: path to the job script
+        :param float now: submission time
+        :return str: job ID
+        :raise FakeSchedulerError: if the submission is rejected
+        """
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise FakeSchedulerError("failure")
+        if self.rate_limit is not None:
+            # token bucket, refilled at the rate limit
+            if self._tokens_time is not None:
+                self._tokens = min(self.rate_limit, self._tokens + (
+                        now - self._tokens_time) * self.rate_limit)
+            self._tokens_time = now
+            if self._tokens < 1:
+                raise FakeSchedulerError("rate_limit")
+            self._tokens -= 1
+        if self.max_jobs is not None and len(self._active) >= self.max_jobs:
+            raise FakeSchedulerError("queue_full")
+        self._counts["submitted"] += 1
+        job_id = str(len(self.jobs) + 1)
+        self.jobs[job_id] = OrderedDict([
+            ("script", os.path.abspath(script)), ("state", PENDING),
+            ("submitted", now), ("started", None), ("ended", None),
+            ("returncode", None)])
+        self._active[job_id] = None
+        return job_id
+
+    def _advance(self, now):
+        """
+        Start the jobs that are pending long enough and finish those done
+
+        :param float now: current time
+        """
+        for job_id in list(self._active):
+            job = self.jobs[job_id]
+            if job["state"] == PENDING and \
+                    now - job["submitted"] >= self.queue_latency:
+                job["state"] = RUNNING
+                job["started"] = now
+                if self.execute:
+                    self._processes[job_id] = subprocess.Popen(
+                        ["sh", job["script"]], stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL, start_new_session=True)
+            if job["state"] != RUNNING:
+                continue
+            if self.execute:
+                returncode = self._processes[job_id].poll()
+                if returncode is not None:
+                    job["returncode"] = returncode
+                    self._finish(job_id, COMPLETED if returncode == 0
+                                 else FAILED, now)
+            elif now - job["started"] >= self.run_time:
+                failed = self.job_failure_rate and \
+                    self._random.random() < self.job_failure_rate
+                self._finish(job_id, FAILED if failed else COMPLETED, now)
+
+    def _finish(self, job_id, state, now):
+        """
+        End a job; its process is killed if it is still running
+
+        :param str job_id: ID of the job
+        :param str state: final state of the job
+        :param float now: current time
+        """
+        job = self.jobs[job_id]
+        job["state"] = state
+        job["ended"] = now
+        del self._active[job_id]
+        proc = self._processes.pop(job_id, None)
+        if proc is not None and proc.poll() is None:
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+            except OSError:
+                proc.terminate()
+
+    def _handle(self, request):
+        """
+        Answer a request of a client
+
+        :param dict request: operation, 'op', and its arguments
+        :return dict: result of the operation, 'result', or the error, 'error'
+        """
+        op = request.get("op")
+        if op == "sbatch":
+            return {"result": [
+                {"error": str(r), "reason": r.reason}
+                if isinstance(r, FakeSchedulerError) else {"job_id": r}
+                for r in self.submit_many(request["scripts"])]}
+        if op == "squeue":
+            return {"result": self.squeue(request.get("job_ids"))}
+        if op == "scancel":
+            self.scancel(request["job_ids"])
+            return {"result": None}
+        if op == "stats":
+            return {"result": self.stats()}
+        return {"error": "Unknown operation: {}".format(op)}
+
+
+class FakeSchedulerClient(object):
+    """
+    Client of a fake scheduler served by another process, with the same
+    submission and query methods as the scheduler.
+
+    :param str address: address of the scheduler, 'host:port'; by default,
+        the value of the LOOPER_FAKE_SCHEDULER environment variable
+    :raise ValueError: if no address is given
+    """
+    def __init__(self, address=None):
+        address = address or os.getenv(ADDRESS_ENV_VAR)
+        if not address:
+            raise ValueError("No fake scheduler address given and {} is not "
+                             "set".format(ADDRESS_ENV_VAR))
+        host, port = address.rsplit(":", 1)
+        self.address = (host, int(port))
+
+    def __str__(self):
+        return "{} ({}:{})".format(self.__class__.__name__, *self.address)
+
+    def submit(self, script):
+        result = self.submit_many([script])[0]
+        if isinstance(result, FakeSchedulerError):
+            raise result
+        return result
+
+    def submit_many(self, scripts):
+        return [FakeSchedulerError(r["reason"]) if "error" in r
+                else r["job_id"] for r in self._request(
+                    "sbatch", scripts=[os.path.abspath(s) for s in scripts])]
+
+    def squeue(self, job_ids=None):
+        return self._request("squeue", job_ids=None if job_ids is None
+                             else list(job_ids))
+
+    def scancel(self, job_ids):
+        self._request("scancel", job_ids=list(job_ids))
+
+    def stats(self):
+        return self._request("stats")
+
+    def _request(self, op, **kwargs):
+        """
+        Send a request to the scheduler
+
+        :param str op: operation
+        :return object: result of the operation
+        :raise RuntimeError: if the scheduler can't perform the operation
+        """
+        kwargs["op"] = op
+        with socket.create_connection(self.address) as conn:
+            conn.sendall((json.dumps(kwargs) + "\n").encode())
+            response = json.loads(conn.makefile("rb").readline().decode())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+
+def compute_package(address=None):
+    """
+    Get the divvy compute package settings that submit, query and cancel
+    the jobs with a fake scheduler served by another process
+
+    :param str address: address of the scheduler, 'host:port'; by default,
+        the value of the LOOPER_FAKE_SCHEDULER environment variable when the
+        commands run
+    :return dict[str, str]: submission, status and cancel commands
+    """
+    cmd = [sys.executable, os.path.abspath(__file__)]
+    if address:
+        cmd += ["--address", address]
+    cmd = " ".join(shlex.quote(part) for part in cmd)
+    return OrderedDict([
+        ("submission_command", cmd + " sbatch"),
+        ("status_command", cmd + " squeue -h -o %T -j"),
+        ("cancel_command", cmd + " scancel")])
+
+
+def _flag(value):
+    """
+    Convert a setting, possibly given as a string, to a bool
+
+    :param object value: setting
+    :return bool: whether the setting is on
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ["true", "yes", "y", "1", "on"]
+    return bool(value)
+
+
+def build_parser():
+    """
+    Build the command-line parser, with sbatch, squeue, scancel, stats and
+    serve subcommands
+
+    :return argparse.ArgumentParser: command-line parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Fake batch scheduler, to test the job submission offline")
+    parser.add_argument(
+        "--address", default=None, metavar="HOST:PORT",
+        help="Address of the scheduler. Default=${}".format(ADDRESS_ENV_VAR))
+    subparsers = parser.add_subparsers(dest="command")
+    sbatch = subparsers.add_parser("sbatch", help="Submit job scripts")
+    sbatch.add_argument("scripts", nargs="+", metavar="SCRIPT")
+    # -h is the no-header option of squeue
+    squeue = subparsers.add_parser("squeue", add_help=False,
+                                   help="Print the state of the jobs")
+    squeue.add_argument("-h", "--noheader", action="store_true")
+    squeue.add_argument("-o", "--format", default="%i %T",
+                        help="Output format; %%i is the job ID and %%T its "
+                             "state. Default='%%i %%T'")
+    squeue.add_argument("-j", "--jobs", default=None, metavar="IDS",
+                        help="Comma-separated IDs of the jobs")
+    scancel = subparsers.add_parser("scancel", help="Cancel jobs")
+    scancel.add_argument("job_ids", nargs="+", metavar="ID")
+    subparsers.add_parser("stats", help="Print the submission statistics")
+    serve = subparsers.add_parser("serve", help="Run the scheduler")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=0)
+    for arg, typ in [("submit-latency", float), ("queue-latency", float),
+                     ("run-time", float), ("failure-rate", float),
+                     ("job-failure-rate", float), ("rate-limit", float),
+                     ("max-jobs", int), ("seed", int)]:
+        serve.add_argument("--" + arg, type=typ, default=None)
+    serve.add_argument("--execute", action="store_true",
+                       help="Run the job scripts locally")
+    return parser
+
+
+def main(argv=None):
+    """
+    Run a subcommand
+
+    :param list[str] argv: command-line arguments
+    :return int: exit code
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help(sys.stderr)
+        return 1
+    if args.command == "serve":
+        settings = {k: v for k, v in vars(args).items()
+                    if k not in ["address", "command", "host", "port"]
+                    and v is not None}
+        scheduler = FakeScheduler(**settings)
+        address = scheduler.serve(args.host, args.port)
+        print("Fake scheduler serving at: {}\nexport {}={}".format(
+            address, ADDRESS_ENV_VAR, address))
+        for key, value in compute_package(address).items():
+            print("{}: {}".format(key, value))
+        sys.stdout.flush()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print(json.dumps(scheduler.stats()))
+            scheduler.stop()
+        return 0
+    client = FakeSchedulerClient(args.address)
+    if args.command == "sbatch":
+        rc = 0
+        for result in client.submit_many(args.scripts):
+            if isinstance(result, FakeSchedulerError):
+                sys.stderr.write("sbatch: error: {}\n".format(result))
+                rc = 1
+            else:
+                print("Submitted batch job {}".format(result))
+        return rc
+    if args.command == "squeue":
+        job_ids = args.jobs.split(",") if args.jobs else None
+        if not args.noheader:
+            print(args.format.replace("%i", "JOBID").replace("%T", "STATE"))
+        for job_id, state in client.squeue(job_ids).items():
+            print(args.format.replace("%i", job_id).replace("%T", state))
+        return 0
+    if args.command == "scancel":
+        client.scancel(args.job_ids)
+        return 0
+    print(json.dumps(client.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+""" Background writer of the files produced while submitting jobs """
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from logging import getLogger
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["FileWriterPool", "write_file", "write_file_now", "set_writer",
+           "get_writer", "flush_writes"]
+
+_LOGGER = getLogger(__name__)
+
+# pool the files are handed to, if any; files are written synchronously
+# otherwise
+_WRITER = None
+
+
+class FileWriterPool(object):
+    """
+    Pool of threads writing files in the background.
+
+    Files are handed over with their complete contents. The number of
+    pending writes is bounded, so that producing files faster than they can
+    be written blocks the producer rather than growing the queue. Writes to
+    the same path are applied in the order they were submitted.
+
+    :param int workers: number of writer threads
+    :param int max_pending: max number of writes queued or in progress
+    """
+    def __init__(self, workers=2, max_pending=64):
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._last_by_path = {}
+        # failed writes, and those whose errors were raised already
+        self._failed = []
+        self._reported = set()
+
+    def submit(self, path, content):
+        """
+        Queue a file to be written
+
+        :param str path: path to the file to write
+        :param bytes content: content of the file
+        """
+        self._slots.acquire()
+        with self._lock:
+            previous = self._last_by_path.get(path)
+            future = self._executor.submit(
+                _write_after, previous, path, content)
+            self._pending.add(future)
+            self._last_by_path[path] = future
+        future.add_done_callback(lambda f: self._done(f, path))
+
+    def barrier(self):
+        """
+        Wait for all the files queued so far to be written
+
+        :raise OSError: if any of the files could not be written
+        """
+        with self._lock:
+            pending = list(self._pending)
+        if pending:
+            _LOGGER.debug("Waiting for {} file writes".format(len(pending)))
+            wait(pending)
+        with self._lock:
+            # the done callbacks of the awaited writes may not have run yet
+            failed = [f for f in self._failed + pending if f.exception()
+                      is not None and f not in self._reported]
+            self._reported.update(failed)
+            self._failed = []
+        if failed:
+            raise failed[0].exception()
+
+    def close(self):
+        """
+        Write the queued files and stop the writer threads
+
+        :raise OSError: if any of the files could not be written
+        """
+        try:
+            self.barrier()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _done(self, future, path):
+        """ Release the slot of a completed write and record its failure """
+        with self._lock:
+            if future.exception() is not None and \
+                    future not in self._reported:
+                self._failed.append(future)
+            self._pending.discard(future)
+            if self._last_by_path.get(path) is future:
+                del self._last_by_path[path]
+        self._slots.release()
+
+
+def write_file(path, content):
+    """
+    Write a file, in the background if a writer pool is set
+
+    :param str path: path to the file to write
+    :param bytes content: content of the file
+    """
+    if _WRITER is None:
+        write_file_now(path, content)
+    else:
+        _WRITER.submit(path, content)
+
+
+def write_file_now(path, content):
+    """
+    Write a file, unless it holds the given content already
+
+    :param str path: path to the file to write
+    :param bytes content: content of the file
+    :return bool: whether the file was written
+    """
+    try:
+        if os.path.getsize(path) == len(content):
+            with open(path, 'rb') as f:
+                if f.read() == content:
+                    _LOGGER.debug("File up to date: {}".format(path))
+                    return False
+    except OSError:
+        pass
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    _LOGGER.debug("Data written to: {}".format(path))
+    return True
+
+
+def set_writer(writer):
+    """
+    Set the pool the files are handed to by write_file
+
+    :param FileWriterPool | NoneType writer: pool to use, None to write
+        the files synchronously
+    """
+    global _WRITER
+    _WRITER = writer
+
+
+def get_writer():
+    """
+    Get the pool the files are handed to by write_file
+
+    :return FileWriterPool | NoneType: pool in use, None if the files are
+        written synchronously
+    """
+    return _WRITER
+
+
+def flush_writes():
+    """
+    Wait for the files handed to the writer pool so far to be written, if
+    a pool is in use
+
+    :raise OSError: if any of the files could not be written
+    """
+    if _WRITER is not None:
+        _WRITER.barrier()
+
+
+def _write_after(previous, path, content):
+    """
+    Write a file once the previous write to the same path is complete
+
+    :param concurrent.futures.Future | NoneType previous: previous write to
+        the path
+    :param str path: path to the file to write
+    :param bytes content: content of the file
+    :return bool: whether the file was written
+    """
+    if previous is not None:
+        wait([previous])
+    return write_file_now(path, content)
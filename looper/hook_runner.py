@@ -0,0 +1,208 @@
+""" Concurrent, memoized execution of pre-submission hook commands """
+
+import copy
+import json
+import os
+import signal
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["HookCommandRunner", "run_hook_command"]
+
+_LOGGER = getLogger(__name__)
+
+CACHE_VERSION = 1
+# prefetched outputs that are kept until their command is run, per job
+MAX_PREFETCHED_PER_JOB = 4
+
+
+class HookCommandRunner(object):
+    """
+    Runner of rendered pre-submission hook commands.
+
+    Commands can be started ahead of time on a bounded thread pool; running
+    a command that was prefetched waits for the prefetched result instead of
+    starting the command again. The outputs of cacheable commands are
+    memoized, keyed by the rendered command, and persisted on disk.
+
+    :param int jobs: number of commands to run concurrently; with a single
+        job, commands are not prefetched
+    :param str cache_path: path to the JSON file the outputs of cacheable
+        commands are persisted in, None to keep them in memory only
+    """
+    def __init__(self, jobs=1, cache_path=None):
+        self.jobs = jobs
+        self.cache_path = cache_path
+        self._executor = ThreadPoolExecutor(max_workers=jobs) \
+            if jobs > 1 else None
+        self._futures = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    def __str__(self):
+        return "{} ({}; {} cached commands)".format(
+            self.__class__.__name__, self.cache_path, len(self._cache))
+
+    def prefetch(self, cmd, timeout=None):
+        """
+        Start running a command in the background, unless its output is
+        already known or it is running already
+
+        :param str cmd: rendered command
+        :param float timeout: seconds after which the command is killed
+        """
+        if self._executor is None:
+            return
+        with self._lock:
+            if cmd in self._cache or cmd in self._futures:
+                return
+            self._drop_unused()
+            _LOGGER.debug("Prefetching pre-submit command: {}".format(cmd))
+            self._futures[cmd] = \
+                self._executor.submit(run_hook_command, cmd, timeout)
+
+    def _drop_unused(self):
+        """
+        Forget the oldest finished prefetched commands that were never run,
+        so that at most a few times as many outputs as jobs are kept
+        """
+        excess = len(self._futures) - self.jobs * MAX_PREFETCHED_PER_JOB
+        if excess <= 0:
+            return
+        for cmd in [c for c, f in self._futures.items() if f.done()][:excess]:
+            _LOGGER.debug("Dropping unused prefetched pre-submit command: "
+                          "{}".format(cmd))
+            del self._futures[cmd]
+
+    def run(self, cmd, timeout=None, cacheable=False):
+        """
+        Get the output of a command, running it if it was not prefetched
+
+        :param str cmd: rendered command
+        :param float timeout: seconds after which the command is killed
+        :param bool cacheable: whether the output of the command depends on
+            the command only, so it can be memoized
+        :return object: JSON-parsed output of the command
+        :raise subprocess.CalledProcessError: if the command fails
+        :raise subprocess.TimeoutExpired: if the command times out
+        :raise ValueError: if the command output is not JSON
+        """
+        with self._lock:
+            if cacheable and cmd in self._cache:
+                _LOGGER.debug("Using memoized output of pre-submit command: "
+                              "{}".format(cmd))
+                return copy.deepcopy(self._cache[cmd])
+            future = self._futures.pop(cmd, None)
+        output = future.result() if future is not None \
+            else run_hook_command(cmd, timeout)
+        if cacheable:
+            with self._lock:
+                self._cache[cmd] = copy.deepcopy(output)
+                self._dirty = True
+        return output
+
+    def close(self):
+        """
+        Stop the commands that have not started yet, wait for the running
+        ones and persist the memoized outputs
+        """
+        if self._executor is not None:
+            with self._lock:
+                futures = list(self._futures.values())
+                self._futures.clear()
+            for future in futures:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.save()
+
+    def save(self):
+        """
+        Write the memoized outputs to disk, if any changed since they were
+        loaded
+        """
+        if not self._dirty or self.cache_path is None:
+            return
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({"version": CACHE_VERSION,
+                           "commands": self._cache}, f)
+            os.replace(tmp_path, self.cache_path)
+        except (IOError, OSError) as e:
+            _LOGGER.warning("Could not save pre-submit command cache '{}': "
+                            "{}".format(self.cache_path,
+                                        getattr(e, 'message', repr(e))))
+            return
+        self._dirty = False
+        _LOGGER.debug("Saved pre-submit command cache: {}".format(self))
+
+    def _load(self):
+        """ Read the cache file, if present and compatible """
+        if self.cache_path is None or not os.path.isfile(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r') as f:
+                data = json.load(f)
+        except (IOError, ValueError) as e:
+            _LOGGER.warning("Ignoring unreadable pre-submit command cache "
+                            "'{}': {}".format(self.cache_path,
+                                              getattr(e, 'message', repr(e))))
+            return
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            _LOGGER.debug("Ignoring outdated pre-submit command cache: {}".
+                          format(self.cache_path))
+            return
+        self._cache.update(data.get("commands", {}))
+        _LOGGER.debug("Loaded pre-submit command cache: {}".format(self))
+
+
+def run_hook_command(cmd, timeout=None):
+    """
+    Run a rendered pre-submission hook command in a shell and parse its
+    output as JSON.
+
+    The command runs in a new session, so that when it times out the
+    processes it started are killed along with it.
+
+    :param str cmd: rendered command
+    :param float timeout: seconds after which the command is killed
+    :return object: JSON-parsed output of the command
+    :raise subprocess.CalledProcessError: if the command fails
+    :raise subprocess.TimeoutExpired: if the command times out
+    :raise ValueError: if the command output is not JSON
+    """
+    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                            start_new_session=True)
+    try:
+        output, _ = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _LOGGER.error("Pre-submit command timed out after {}s: {}".
+                      format(timeout, cmd))
+        _kill_session(proc)
+        proc.communicate()
+        raise
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd,
+                                            output=output)
+    return json.loads(output)
+
+
+def _kill_session(proc):
+    """
+    Kill a process started in a new session, along with its children
+
+    :param subprocess.Popen proc: process to kill
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        proc.kill()
@@ -2,34 +2,55 @@
 
 import os
 import glob
+import html
 import pandas as _pd
 import logging
 import jinja2
+import json
+import multiprocessing
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from warnings import warn
-from datetime import timedelta
 from ._version import __version__ as v
 from .const import *
 from .processed_project import get_project_outputs
-from .utils import get_file_for_project
+from .report_manifest import ReportManifest, dir_state, file_state, \
+    page_digest
+from .summaries import read_stats_summary
+from .summary_cache import SummaryCache
+from .utils import get_file_for_project, sharded_path
 from peppy.const import *
 from eido import read_schema
 from copy import copy as cp
 _LOGGER = logging.getLogger("looper")
 
+# scripts with the data shared by the report pages
+NAVBAR_JS = "navbar.js"
+STATS_JS = "stats.js"
+SUMMARY_TABLE_JS = "summary_table.js"
+# lines of the pipeline logs with the total runtime and the peak memory, for
+# the samples with no profile
+LOG_PROFILE_REGEXES = {"time": r'(Total elapsed time)',
+                       "mem": r'(Peak memory)'}
+
 
 class HTMLReportBuilder(object):
     """ Generate HTML summary report for project/samples """
 
-    def __init__(self, prj):
+    def __init__(self, prj, jobs=1):
         """
         The Project defines the instance.
 
         :param Project prj: Project with which to work/operate on
+        :param int jobs: number of processes to render the sample and
+            object pages with
         """
         super(HTMLReportBuilder, self).__init__()
         self.prj = prj
+        self.jobs = jobs
+        self.shard_depth = getattr(prj, "shard_depth", 0)
+        self._templates_digest = None
         self.j_env = get_jinja_env()
         self.reports_dir = get_file_for_project(self.prj, "reports")
         self.index_html_path = get_file_for_project(self.prj, "summary.html")
@@ -48,6 +69,9 @@ class HTMLReportBuilder(object):
             self.create_navbar_links(
                 objs=objs, stats=stats, wd=self.reports_dir),
             os.path.join("..", self.index_html_filename))
+        # the pages in the reports directory share the navbar, which is
+        # written once and loaded by each page
+        navbar_reports = self.create_navbar_loader(navbar_reports)
         index_html_path = self.create_index_html(
             objs, stats, columns, footer=self.create_footer(),
             navbar=navbar, navbar_reports=navbar_reports)
@@ -101,8 +125,7 @@ class HTMLReportBuilder(object):
 
             # Confirm sample directory exists, then build page
             if os.path.exists(sample_dir):
-                page_name = sample_name + ".html"
-                page_path = os.path.join(self.reports_dir, page_name.replace(' ', '_').lower())
+                page_path = _sample_page_path(self.reports_dir, sample_name, self.shard_depth)
                 page_relpath = os.path.relpath(page_path, self.reports_dir)
                 pages.append(page_relpath)
                 labels.append(sample_name)
@@ -120,6 +143,20 @@ class HTMLReportBuilder(object):
         template_vars = dict(navbar_links=navbar_links, index_html=index_html_relpath)
         return render_jinja_template("navbar.html", self.j_env, template_vars)
 
+    def create_navbar_loader(self, navbar):
+        """
+        Save the navbar as a script in the reports directory and create the
+        HTML that loads it
+
+        :param str navbar: navbar HTML for the pages in the reports directory
+        :return str: HTML loading the navbar
+        """
+        self._write_html(os.path.join(self.reports_dir, NAVBAR_JS),
+                         "document.getElementById(\"looper-navbar\").innerHTML = "
+                         "{};\n".format(json.dumps(navbar)))
+        return render_jinja_template("navbar_loader.html", self.j_env,
+                                     dict(navbar_js=NAVBAR_JS))
+
     def create_footer(self):
         """
         Renders the footer from the templates directory
@@ -166,7 +203,8 @@ class HTMLReportBuilder(object):
         if stats:
             if len(stats) <= 20:
                 dropdown_relpaths_samples, sample_names = \
-                    _get_navbar_dropdown_data_samples(stats=stats, wd=wd, context=context, reports_dir=self.reports_dir)
+                    _get_navbar_dropdown_data_samples(stats=stats, wd=wd, context=context, reports_dir=self.reports_dir,
+                                                      shard_depth=self.shard_depth)
             else:
                 # Create a menu link to the samples parent page
                 dropdown_relpaths_samples = samples_relpath
@@ -256,39 +294,37 @@ class HTMLReportBuilder(object):
             _LOGGER.debug(filename.replace(' ', '_').lower() +
                           " nonexistent files: " + ','.join(str(x) for x in warnings))
         template_vars = dict(navbar=navbar, footer=footer, name=current_name, figures=figures, links=links)
-        save_html(html_page_path, render_jinja_template("object.html", self.j_env, args=template_vars))
+        self._write_html(html_page_path, render_jinja_template("object.html", self.j_env, args=template_vars))
 
-    def create_sample_html(self, objs, sample_name, sample_stats, navbar, footer):
+    def create_sample_html(self, sample_objs, sample_name, sample_stats, navbar, footer):
         """
         Produce an HTML page containing all of a sample's objects
         and the sample summary statistics
 
-        :param pandas.DataFrame objs: project level dataframe containing
-            any reported objects for all samples
+        :param pandas.DataFrame sample_objs: dataframe containing any
+            reported objects for the current sample
         :param str sample_name: the name of the current sample
         :param dict sample_stats: pipeline run statistics for the current sample
         :param str navbar: HTML to be included as the navbar in the main summary page
         :param str footer: HTML to be included as the footer
         :return str: path to the produced HTML page
         """
-        html_filename = sample_name + ".html"
-        html_page = os.path.join(self.reports_dir, html_filename.replace(' ', '_').lower())
+        html_page = _sample_page_path(self.reports_dir, sample_name, self.shard_depth)
         sample_page_relpath = os.path.relpath(html_page, self._outdir)
-        single_sample = _pd.DataFrame() if objs.empty else objs[objs['sample_name'] == sample_name]
         if not os.path.exists(os.path.dirname(html_page)):
             os.makedirs(os.path.dirname(html_page))
         sample_dir = os.path.join(self.prj.results_folder, sample_name)
         if os.path.exists(sample_dir):
-            if single_sample.empty:
+            if sample_objs.empty:
                 # When there is no objects.tsv file, search for the
                 # presence of log, profile, and command files
                 log_name = _match_file_for_sample(sample_name, 'log.md', self.prj.results_folder)
                 profile_name = _match_file_for_sample(sample_name, 'profile.tsv', self.prj.results_folder)
                 command_name = _match_file_for_sample(sample_name, 'commands.sh', self.prj.results_folder)
             else:
-                log_name = str(single_sample.iloc[0]['annotation']) + "_log.md"
-                profile_name = str(single_sample.iloc[0]['annotation']) + "_profile.tsv"
-                command_name = str(single_sample.iloc[0]['annotation']) + "_commands.sh"
+                log_name = str(sample_objs.iloc[0]['annotation']) + "_log.md"
+                profile_name = str(sample_objs.iloc[0]['annotation']) + "_profile.tsv"
+                command_name = str(sample_objs.iloc[0]['annotation']) + "_commands.sh"
             stats_name = "stats.tsv"
             flag = _get_flags(sample_dir)
             # get links to the files
@@ -319,55 +355,58 @@ class HTMLReportBuilder(object):
         links = []
         figures = []
         warnings = []
-        if not single_sample.empty:
-            for sample_name in single_sample['sample_name'].drop_duplicates().sort_values():
-                o = single_sample[single_sample['sample_name'] == sample_name]
-                for i, row in o.iterrows():
-                    try:
-                        # Image thumbnails are optional
-                        # This references to "image" should really
-                        # be "thumbnail"
-                        image_path = os.path.join(
-                            self.prj.results_folder,
-                            sample_name, row['anchor_image'])
-                        image_relpath = os.path.relpath(image_path, self.reports_dir)
-                    except (AttributeError, TypeError):
-                        image_path = ""
-                        image_relpath = ""
-
-                    # These references to "page" should really be
-                    # "object", because they can be anything.
-                    page_path = os.path.join(
+        if not sample_objs.empty:
+            for i, row in sample_objs.iterrows():
+                try:
+                    # Image thumbnails are optional
+                    # This references to "image" should really
+                    # be "thumbnail"
+                    image_path = os.path.join(
                         self.prj.results_folder,
-                        sample_name, row['filename'])
-                    page_relpath = os.path.relpath(page_path, self.reports_dir)
-                    # If the object has a thumbnail image, add as a figure
-                    if os.path.isfile(image_path) and os.path.isfile(page_path):
-                        # If the object has a valid image, add as a figure
-                        if str(image_path).lower().endswith(('.png', '.jpg', '.jpeg', '.svg', '.gif')):
-                            figures.append([page_relpath, str(row['key']), image_relpath])
-                        # Otherwise treat as a link
-                        elif os.path.isfile(page_path):
-                            links.append([str(row['key']), page_relpath])
-                        # If neither, there is no object by that name
-                        else:
-                            warnings.append(str(row['filename']))
-                    # If no thumbnail image, it's just a link
+                        sample_name, row['anchor_image'])
+                    image_relpath = os.path.relpath(image_path, self.reports_dir)
+                except (AttributeError, TypeError):
+                    image_path = ""
+                    image_relpath = ""
+
+                # These references to "page" should really be
+                # "object", because they can be anything.
+                page_path = os.path.join(
+                    self.prj.results_folder,
+                    sample_name, row['filename'])
+                page_relpath = os.path.relpath(page_path, self.reports_dir)
+                # If the object has a thumbnail image, add as a figure
+                if os.path.isfile(image_path) and os.path.isfile(page_path):
+                    # If the object has a valid image, add as a figure
+                    if str(image_path).lower().endswith(('.png', '.jpg', '.jpeg', '.svg', '.gif')):
+                        figures.append([page_relpath, str(row['key']), image_relpath])
+                    # Otherwise treat as a link
                     elif os.path.isfile(page_path):
                         links.append([str(row['key']), page_relpath])
-                    # If no file present, there is no object by that name
+                    # If neither, there is no object by that name
                     else:
                         warnings.append(str(row['filename']))
+                # If no thumbnail image, it's just a link
+                elif os.path.isfile(page_path):
+                    links.append([str(row['key']), page_relpath])
+                # If no file present, there is no object by that name
+                else:
+                    warnings.append(str(row['filename']))
         else:
             # Sample was not run through the pipeline
             _LOGGER.warning("{} is not present in {}".format(
                 sample_name, self.prj.results_folder))
 
+        # in the sharded layout the page links resolve against the reports
+        # directory, like the links of the other pages
+        page_dir = os.path.dirname(html_page)
+        base_href = None if page_dir == self.reports_dir else \
+            os.path.relpath(self.reports_dir, page_dir) + "/"
         template_vars = dict(navbar=navbar, footer=footer, sample_name=sample_name, stats_file_path=stats_file_path,
                              profile_file_path=profile_file_path, commands_file_path=commands_file_path,
                              log_file_path=log_file_path, button_class=button_class, sample_stats=sample_stats,
-                             flag=flag, links=links, figures=figures)
-        save_html(html_page, render_jinja_template("sample.html", self.j_env, template_vars))
+                             flag=flag, links=links, figures=figures, base_href=base_href)
+        self._write_html(html_page, render_jinja_template("sample.html", self.j_env, template_vars))
         return sample_page_relpath
 
     def create_status_html(self, status_table, navbar, footer):
@@ -482,6 +521,10 @@ class HTMLReportBuilder(object):
             navbar_reports = navbar
         if not objs.dropna().empty:
             objs.drop_duplicates(keep='last', inplace=True)
+        # partition the objects once, rather than filtering them for each page
+        objs_by_sample = _group_objects(objs, "sample_name")
+        # pages rendered by the previous build from the same inputs are kept
+        manifest = ReportManifest(get_file_for_project(self.prj, REPORT_MANIFEST_FILENAME))
         # Generate parent index.html page path
         index_html_path = get_file_for_project(self.prj, "summary.html")
 
@@ -493,53 +536,231 @@ class HTMLReportBuilder(object):
         stats_file_path = os.path.relpath(stats_file_name, self._outdir)
         # Add stats summary table to index page and produce individual
         # sample pages
+        table_row_data = []
         if os.path.isfile(stats_file_name):
             # Produce table rows
-            table_row_data = []
             samples_cols_missing = []
             _LOGGER.debug(" * Creating sample pages...")
+            sample_pages = []
+            for row in stats:
+                sample_objs = objs_by_sample.get(row["sample_name"], _pd.DataFrame())
+                sample_dir = os.path.join(self.prj.results_folder, row["sample_name"])
+                sample_pages.append((
+                    _sample_page_path(self.reports_dir, row["sample_name"], self.shard_depth),
+                    [row, self._objects_inputs(sample_objs), dir_state(sample_dir)],
+                    (sample_objs, row["sample_name"], row, navbar_reports, footer)))
+            self._render_changed_pages(manifest, self.create_sample_html,
+                                       sample_pages, navbar_reports, footer)
             for row in stats:
-                table_cell_data = []
                 sample_name = row["sample_name"]
-                sample_page = self.create_sample_html(objs, sample_name, row, navbar_reports, footer)
+                sample_page = os.path.relpath(
+                    _sample_page_path(self.reports_dir, sample_name, self.shard_depth), self._outdir)
                 # treat sample_name column differently - provide a link to the sample page
-                table_cell_data.append([sample_page, sample_name])
+                table_cell_data = {"c0": '<a class="LN1 LN2 LN3 LN4 LN5" href="{}">{}</a>'.format(
+                    sample_page, html.escape(sample_name))}
                 # for each column read the data from the stats
-                for c in cols:
+                for i, c in enumerate(cols, 1):
                     try:
-                        table_cell_data.append(str(row[c]))
+                        value = str(row[c])
                     except KeyError:
-                        table_cell_data.append("NA")
+                        value = "NA"
                         samples_cols_missing.append(sample_name)
+                    table_cell_data["c{}".format(i)] = self._table_cell_html(value)
                 table_row_data.append(table_cell_data)
             _LOGGER.debug("Samples with missing columns: {}".format(set(samples_cols_missing)))
         else:
             _LOGGER.warning("No stats file '%s'", stats_file_name)
 
         # Create parent samples page with links to each sample
-        save_html(os.path.join(self.reports_dir, "samples.html"), self.create_sample_parent_html(navbar_reports, footer))
+        self._save_page(os.path.join(self.reports_dir, "samples.html"),
+                        self.create_sample_parent_html, navbar_reports, footer)
         _LOGGER.debug(" * Creating object pages...")
         # Create objects pages
         if not objs.dropna().empty:
-            for key in objs['key'].drop_duplicates().sort_values():
-                single_object = objs[objs['key'] == key]
-                self.create_object_html(single_object, navbar_reports, footer)
+            objs_by_key = _group_objects(objs, "key")
+            self._render_changed_pages(
+                manifest, self.create_object_html,
+                [(self._page_path(key), [self._objects_inputs(objs_by_key[key])],
+                  (objs_by_key[key], navbar_reports, footer))
+                 for key in sorted(objs_by_key)], navbar_reports, footer)
 
         # Create parent objects page with links to each object type
-        save_html(os.path.join(self.reports_dir, "objects.html"),
-                  self.create_object_parent_html(objs, navbar_reports, footer))
+        self._save_page(os.path.join(self.reports_dir, "objects.html"),
+                        self.create_object_parent_html, objs, navbar_reports, footer)
         # Create status page with each sample's status listed
-        save_html(os.path.join(self.reports_dir, "status.html"),
-                  self.create_status_html(create_status_table(self.prj), navbar_reports, footer))
+        self._save_page(os.path.join(self.reports_dir, "status.html"),
+                        lambda: self.create_status_html(create_status_table(self.prj), navbar_reports, footer))
         # Add project level objects
         project_objects = self.create_project_objects()
         # Complete and close HTML file
-        template_vars = dict(project_name=self.prj.name, stats_json=_read_tsv_to_json(stats_file_name),
-                             navbar=navbar, footer=footer, stats_file_path=stats_file_path,
-                             project_objects=project_objects, columns=col_names, table_row_data=table_row_data)
-        save_html(index_html_path, render_jinja_template("index.html", self.j_env, template_vars))
+        # the table rows and the stats to plot are loaded by the index page
+        # from scripts, which keeps the page small. The table is paginated,
+        # so only the displayed rows are turned into HTML by the browser
+        table_js_path = os.path.join(self.reports_dir, SUMMARY_TABLE_JS)
+        self._write_html(table_js_path, "var summaryTableRows = {};\n".format(
+            json.dumps(table_row_data, separators=(",", ":"))))
+        stats_js_path = os.path.join(self.reports_dir, STATS_JS)
+        self._write_html(stats_js_path, "var statsTable = {};\n".format(
+            _summary_to_json(read_stats_summary(self.prj))))
+        template_vars = dict(project_name=self.prj.name, navbar=navbar, footer=footer,
+                             stats_file_path=stats_file_path, project_objects=project_objects,
+                             columns=col_names, stats_js=os.path.relpath(stats_js_path, self._outdir),
+                             summary_table_js=os.path.relpath(table_js_path, self._outdir))
+        self._write_html(index_html_path, render_jinja_template("index.html", self.j_env, template_vars))
+        self._finish_build(manifest)
         return index_html_path
 
+    def _write_html(self, path, content):
+        """
+        Write a rendered page or script of the report
+
+        :param str path: path to write the content to
+        :param str content: rendered page or script
+        """
+        save_html(path, content)
+
+    def _save_page(self, path, render, *args):
+        """
+        Render a page of the report and write it
+
+        :param str path: path to write the page to
+        :param callable render: function rendering the page
+        :param args: positional arguments for the rendering function
+        """
+        self._write_html(path, render(*args))
+
+    def _finish_build(self, manifest):
+        """
+        Remove the pages that the build does not produce anymore and
+        record the built pages
+
+        :param looper.report_manifest.ReportManifest manifest: pages built
+        """
+        for page in manifest.stale_pages():
+            if os.path.isfile(page):
+                _LOGGER.debug("Removing stale page: {}".format(page))
+                os.remove(page)
+                # remove the shard folders the page leaves empty
+                page_dir = os.path.dirname(page)
+                while page_dir.startswith(self.reports_dir + os.sep) \
+                        and not os.listdir(page_dir):
+                    os.rmdir(page_dir)
+                    page_dir = os.path.dirname(page_dir)
+        manifest.save()
+
+    def _table_cell_html(self, value):
+        """
+        Create the HTML content of a summary table cell; long values are
+        truncated and displayed in full in a popover
+
+        :param str value: value to display in the cell
+        :return str: cell HTML
+        """
+        if len(value) <= 60:
+            return html.escape(value)
+        truncated = jinja2.filters.do_truncate(self.j_env, value, 60, True)
+        return '{} <a data-html="true" data-toggle="popover" data-placement="top" data-trigger="click" ' \
+               'data-content="{}" href="javascript:void(0)"><i class="fa fa-caret-square-o-right" ' \
+               'aria-hidden="true"></i></a>'.format(html.escape(truncated), html.escape(value))
+
+    def _page_path(self, name):
+        """
+        Get the path to the report page of an object type
+
+        :param str name: name of the object type
+        :return str: path to the page in the reports directory
+        """
+        return os.path.join(self.reports_dir, (name + ".html").replace(' ', '_').lower())
+
+    def _objects_inputs(self, objs):
+        """
+        Get the page inputs from a set of reported objects: the objects
+        themselves and the state of the files they point to
+
+        :param pandas.DataFrame objs: reported objects
+        :return list: objects records and the states of their files
+        """
+        if objs.empty:
+            return []
+        records = objs.to_dict("records")
+        files = [[file_state(os.path.join(self.prj.results_folder, str(r['sample_name']), str(r[col])))
+                  for col in ['filename', 'anchor_image']] for r in records]
+        return [records, files]
+
+    def _render_changed_pages(self, manifest, render, pages, navbar, footer):
+        """
+        Render the pages whose inputs changed since the previous build
+
+        :param looper.report_manifest.ReportManifest manifest: pages built
+            previously, updated with the given ones
+        :param callable render: builder method rendering a single page
+        :param list[tuple] pages: path, inputs and rendering method arguments
+            of each page
+        :param str navbar: HTML included as the navbar in the pages
+        :param str footer: HTML included as the footer in the pages
+        """
+        if self._templates_digest is None:
+            self._templates_digest = page_digest(v, [
+                [name, self.j_env.loader.get_source(self.j_env, name)[0]]
+                for name in sorted(self.j_env.list_templates())])
+        common = [self._templates_digest, render.__name__, navbar, footer]
+        changed = [args for path, inputs, args in pages
+                   if not manifest.is_current(path, page_digest(common, inputs))]
+        _LOGGER.debug("Pages to render: {} of {}".format(len(changed), len(pages)))
+        self._render_pages(render, changed)
+
+    def _render_pages(self, render, pages_args):
+        """
+        Render a set of report pages, in parallel if requested.
+
+        The worker processes are forked, so they inherit the builder and the
+        page arguments; each of them creates its own jinja environment.
+        The pages are independent, so the output does not depend on the
+        number of processes.
+
+        :param callable render: builder method rendering a single page
+        :param list[tuple] pages_args: positional arguments for each page
+        :return list: results of the render calls, in the input order
+        """
+        jobs = min(self.jobs or 1, len(pages_args))
+        if jobs > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            _LOGGER.warning("Parallel report rendering is not supported on "
+                            "this platform, rendering serially")
+            jobs = 1
+        if jobs <= 1:
+            return [render(*args) for args in pages_args]
+        _LOGGER.debug("Rendering {} pages with {} processes".
+                      format(len(pages_args), jobs))
+        global _PAGES_TO_RENDER
+        _PAGES_TO_RENDER = (self, render.__name__, pages_args)
+        try:
+            with multiprocessing.get_context("fork").Pool(
+                    jobs, initializer=_init_page_worker) as pool:
+                return pool.map(_render_page, range(len(pages_args)))
+        finally:
+            _PAGES_TO_RENDER = None
+
+
+# builder, name of its rendering method and pages arguments, inherited
+# by the forked page rendering processes
+_PAGES_TO_RENDER = None
+
+
+def _init_page_worker():
+    """ Give the page rendering process its own jinja environment """
+    _PAGES_TO_RENDER[0].j_env = get_jinja_env()
+
+
+def _render_page(idx):
+    """
+    Render a single report page in a worker process
+
+    :param int idx: index of the page arguments to use
+    :return object: result of the builder rendering method
+    """
+    builder, method_name, pages_args = _PAGES_TO_RENDER
+    return getattr(builder, method_name)(*pages_args[idx])
+
 
 def render_jinja_template(name, jinja_env, args=dict()):
     """
@@ -665,7 +886,7 @@ def _get_navbar_dropdown_data_objects(objs, wd, context, reports_dir):
     return relpaths, df_keys
 
 
-def _get_navbar_dropdown_data_samples(stats, wd, context, reports_dir):
+def _get_navbar_dropdown_data_samples(stats, wd, context, reports_dir, shard_depth=0):
     if stats is None:
         return None, None
     relpaths = []
@@ -674,7 +895,7 @@ def _get_navbar_dropdown_data_samples(stats, wd, context, reports_dir):
         for entry, val in sample.items():
             if entry == "sample_name":
                 sample_name = str(val)
-                page_name = os.path.join(reports_dir, (sample_name + ".html").replace(' ', '_').lower())
+                page_name = _sample_page_path(reports_dir, sample_name, shard_depth)
                 relpaths.append(_make_relpath(page_name, wd, context))
                 sample_names.append(sample_name)
                 break
@@ -683,64 +904,87 @@ def _get_navbar_dropdown_data_samples(stats, wd, context, reports_dir):
     return relpaths, sample_names
 
 
-def _read_csv_encodings(path, encodings=["utf-8", "ascii"], **kwargs):
+def _sample_page_path(reports_dir, sample_name, shard_depth=0):
     """
-    Try to read file with the provided encodings
+    Get the path to the report page of a sample
 
-    :param str path: path to file
-    :param list encodings: list of encodings to try
+    :param str reports_dir: path to the reports directory
+    :param str sample_name: name of the sample
+    :param int shard_depth: number of hash-prefix folder levels the page is
+        nested in
+    :return str: path to the sample page
     """
-    idx = 0
-    while idx < len(encodings):
-        e = encodings[idx]
-        try:
-            t = _pd.read_csv(path, encoding=e, **kwargs)
-            return t
-        except UnicodeDecodeError:
-            pass
-        idx = idx + 1
-    _LOGGER.warning("Could not read the log file '{p}' with encodings '{enc}'".format(p=path, enc=encodings))
+    return sharded_path(reports_dir, sample_name, (sample_name + ".html").replace(' ', '_').lower(), shard_depth)
 
 
-def _get_from_log(log_path, regex):
+def _group_objects(objs, column):
     """
-    Get the value for the matched key from log file
+    Partition the objects data frame by the values in one of its columns
+
+    :param pandas.DataFrame objs: project level dataframe containing
+        any reported objects for all samples
+    :param str column: name of the column to partition the objects by
+    :return dict[str, pandas.DataFrame]: objects, keyed by the column values;
+        the original row order is preserved within each partition
+    """
+    if objs.empty:
+        return {}
+    return {k: v for k, v in objs.groupby(column, sort=False, observed=True)}
+
+
+def _scan_log(log_path, regexes):
+    """
+    Get the values for several keys from a log file in a single pass.
+
+    The file is read line by line and decoded incrementally, with undecodable
+    bytes replaced, so it is never loaded in full. Reading stops as soon as
+    every key is matched. The value for a key is the stripped text after the
+    first colon in the first line that matches its regex.
 
     :param str log_path: path to the log file
-    :param str regex: matching str. Should be formatted as follows: r'(phrase to match)'
-    :return str: matched and striped string
+    :param Mapping[str, str] regexes: regexes to match, keyed by the names of
+        the values, e.g. {"time": r'(Total elapsed time)'}
+    :return dict[str, str]: values of the matched keys
     :raises IOError: when the file is not found in the provided path
     """
     if not os.path.exists(log_path):
         raise IOError("Can't read the log file '{}'. Not found".format(log_path))
-    log = _read_csv_encodings(log_path, header=None, names=['data'])
-    if log is None:
-        _LOGGER.warning("'{r}' was not read from log".format(r=regex))
-        return None
-    # match regex, get row(s) that matched the regex
-    log_row = log.iloc[:, 0].str.extractall(regex)
-    # not matches? return None
-    if log_row.empty:
-        return None
-    if log_row.size > 1:
-        _LOGGER.warning("When parsing '{lp}', more than one values matched with: {r}. Returning first.".format(lp=log_path, r=regex))
-    # split the matched line by first colon return stripped data.
-    # This way both mem values (e.g 1.1GB) and time values (e.g 1:10:10) will work.
-    val = log.iloc[log_row.index[0][0]].str.split(":", 1, expand=True)[1][0].strip()
-    return val
+    pending = {key: re.compile(regex) for key, regex in regexes.items()}
+    values = {}
+    with open(log_path, 'r', encoding="utf-8", errors="replace") as f:
+        for line in f:
+            for key, regex in list(pending.items()):
+                if regex.search(line) is None:
+                    continue
+                del pending[key]
+                # split the matched line by first colon return stripped data.
+                # This way both mem values (e.g 1.1GB) and time values (e.g 1:10:10) will work.
+                parts = line.split(":", 1)
+                if len(parts) > 1:
+                    values[key] = parts[1].strip()
+            if not pending:
+                break
+    for key in pending:
+        _LOGGER.debug("'{}' was not found in log: {}".format(regexes[key], log_path))
+    return values
 
 
-def _read_tsv_to_json(path):
+def _summary_to_json(df):
     """
-    Read a tsv file to a JSON formatted string
+    Convert a summary data frame to a JSON formatted string. The columns are
+    indexed by their position and the first row of each holds its name,
+    like if the summary was read without a header. All values are strings.
 
-    :param path: to file path
+    :param pandas.DataFrame df: summary to convert
     :return str: JSON formatted string
     """
-    assert os.path.exists(path), "The file '{}' does not exist".format(path)
-    _LOGGER.debug("Reading TSV from '{}'".format(path))
-    df = _pd.read_csv(path, sep="\t", index_col=False, header=None)
-    return df.to_json()
+    data = {}
+    if df is not None:
+        for idx, col in enumerate(df.columns):
+            values = [str(col)] + \
+                     [None if _pd.isna(v) else str(v) for v in df[col]]
+            data[idx] = dict(enumerate(values))
+    return json.dumps(data, separators=(",", ":"))
 
 
 def uniqify(seq):
@@ -774,67 +1018,27 @@ def create_status_table(prj, final=True):
     row_classes = []
     times = []
     mems = []
-    for sample in prj.samples:
-        sample_name = str(sample.sample_name)
-        sample_dir = os.path.join(
-            prj.results_folder, sample_name)
-
-        # Confirm sample directory exists, then build page
-        if os.path.exists(sample_dir):
-            # Grab the status flag for the current sample
-            flag = _get_flags(sample_dir)
-            if not flag:
-                button_class = "table-secondary"
-                flag = "Missing"
-            elif len(flag) > 1:
-                button_class = "table-secondary"
-                flag = "Multiple"
-            else:
-                flag = flag[0]
-                try:
-                    flag_dict = TABLE_APPEARANCE_BY_FLAG[flag]
-                except KeyError:
-                    button_class = "table-secondary"
-                    flag = "Unknown"
-                else:
-                    button_class = flag_dict["button_class"]
-                    flag = flag_dict["flag"]
-            row_classes.append(button_class)
-            # get first column data (sample name/link)
-            page_name = sample_name + ".html"
-            page_path = os.path.join(get_file_for_project(prj, "reports"),
-                                     page_name.replace(' ', '_').lower())
-            page_relpath = os.path.relpath(page_path,
-                                           get_file_for_project(prj, "reports"))
-            sample_paths.append(page_relpath)
-            sample_link_names.append(sample_name)
-            # get second column data (status/flag)
-            flags.append(flag)
-            # get third column data (log file/link)
-            log_name = _match_file_for_sample(sample_name, "log.md",
-                                              prj.results_folder)
-            log_file_link = \
-                _get_relpath_to_file(log_name, sample_name, prj.results_folder,
-                                     get_file_for_project(prj, "reports"))
-            log_link_names.append(log_name)
-            log_paths.append(log_file_link)
-            # get fourth column data (runtime) and fifth column data (memory)
-            profile_file_path = \
-                _match_file_for_sample(sample.sample_name, 'profile.tsv',
-                                       prj.results_folder, full_path=True)
-            if os.path.exists(profile_file_path):
-                df = _pd.read_csv(profile_file_path, sep="\t", comment="#",
-                                  names=PROFILE_COLNAMES)
-                df['runtime'] = _pd.to_timedelta(df['runtime'])
-                times.append(_get_runtime(df))
-                mems.append(_get_maxmem(df))
-            else:
-                _LOGGER.warning("'{}' does not exist".format(profile_file_path))
-                times.append(NO_DATA_PLACEHOLDER)
-                mems.append(NO_DATA_PLACEHOLDER)
-        else:
+    reports_dir = get_file_for_project(prj, "reports")
+    # profile summaries are cached along with the parsed stats and objects
+    cache = SummaryCache(get_file_for_project(prj, SUMMARY_CACHE_FILENAME))
+    with ThreadPoolExecutor() as executor:
+        rows = list(executor.map(
+            lambda s: _get_status_row(prj, s, cache, reports_dir), prj.samples))
+    cache.save()
+    for sample_name, row in rows:
+        if row is None:
             # Sample was not run through the pipeline
             sample_warning.append(sample_name)
+            continue
+        button_class, flag, page_relpath, log_name, log_file_link, time, mem = row
+        row_classes.append(button_class)
+        sample_paths.append(page_relpath)
+        sample_link_names.append(sample_name)
+        flags.append(flag)
+        log_link_names.append(log_name)
+        log_paths.append(log_file_link)
+        times.append(time)
+        mems.append(mem)
 
     # Alert the user to any warnings generated
     if status_warning:
@@ -856,23 +1060,63 @@ def create_status_table(prj, final=True):
     return render_jinja_template(template_name, get_jinja_env(), template_vars)
 
 
-def _get_maxmem(profile_df):
+def _get_status_row(prj, sample, cache, reports_dir):
     """
-    Get current peak memory
-
-    :param pandas.core.frame.DataFrame profile_df: a data frame representing the current profile.tsv for a sample
-    :return str: max memory
+    Collect the status table data for a sample
+
+    :param looper.Project prj: project the sample belongs to
+    :param peppy.Sample sample: sample to collect the data for
+    :param looper.summary_cache.SummaryCache cache: profile summaries cache
+    :param str reports_dir: path to the reports directory
+    :return (str, tuple | NoneType): sample name and its row class, flag,
+        page path, log file name and path, runtime and memory; no row if
+        the sample results folder does not exist
     """
-    return "{} GB".format(str(max(profile_df['mem']) if not profile_df['mem'].empty else 0))
-
-
-def _get_runtime(profile_df):
-    """
-    Collect the unique and last duplicated runtimes, sum them and then return in str format
-
-    :param pandas.core.frame.DataFrame profile_df: a data frame representing the current profile.tsv for a sample
-    :return str: sum of runtimes
-    """
-    unique_df = profile_df[~profile_df.duplicated('cid', keep='last').values]
-    return str(timedelta(seconds=sum(unique_df['runtime'].apply(lambda x: x.total_seconds())))).split(".")[0]
+    sample_name = str(sample.sample_name)
+    sample_dir = os.path.join(prj.results_folder, sample_name)
+    if not os.path.exists(sample_dir):
+        return sample_name, None
+    # Grab the status flag for the current sample
+    flag = _get_flags(sample_dir)
+    if not flag:
+        button_class = "table-secondary"
+        flag = "Missing"
+    elif len(flag) > 1:
+        button_class = "table-secondary"
+        flag = "Multiple"
+    else:
+        flag = flag[0]
+        try:
+            flag_dict = TABLE_APPEARANCE_BY_FLAG[flag]
+        except KeyError:
+            button_class = "table-secondary"
+            flag = "Unknown"
+        else:
+            button_class = flag_dict["button_class"]
+            flag = flag_dict["flag"]
+    # get first column data (sample name/link)
+    page_path = _sample_page_path(reports_dir, sample_name, getattr(prj, "shard_depth", 0))
+    page_relpath = os.path.relpath(page_path, reports_dir)
+    # get third column data (log file/link)
+    log_name = _match_file_for_sample(sample_name, "log.md", prj.results_folder)
+    log_file_link = _get_relpath_to_file(log_name, sample_name, prj.results_folder, reports_dir)
+    # get fourth column data (runtime) and fifth column data (memory), from
+    # the log if the pipeline did not write a profile
+    profile_file_path = _match_file_for_sample(
+        sample.sample_name, 'profile.tsv', prj.results_folder, full_path=True)
+    profile = cache.get_profile(sample_name, profile_file_path) \
+        if profile_file_path else None
+    if profile is None and log_name is not None:
+        log_values = _scan_log(os.path.join(sample_dir, log_name),
+                               LOG_PROFILE_REGEXES)
+        if log_values:
+            profile = [log_values.get(key, NO_DATA_PLACEHOLDER)
+                       for key in ["time", "mem"]]
+    if profile is None:
+        _LOGGER.warning("No runtime and memory for sample '{}': neither a "
+                        "profile.tsv file nor log values found in: {}".
+                        format(sample_name, sample_dir))
+        profile = [NO_DATA_PLACEHOLDER, NO_DATA_PLACEHOLDER]
+    return sample_name, (button_class, flag, page_relpath, log_name,
+                         log_file_link) + tuple(profile)
 
@@ -10,6 +10,7 @@ import logging
 import os
 import subprocess
 import sys
+import time
 if sys.version_info < (3, 3):
     from collections import Mapping
 else:
@@ -17,7 +18,8 @@ else:
 import yaml
 import pandas as _pd
 
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 # Need specific sequence of actions for colorama imports?
 from colorama import init
 init()
@@ -30,8 +32,16 @@ from . import __version__, build_parser, _LEVEL_BY_VERBOSITY
 from .conductor import SubmissionConductor
 from .const import *
 from .exceptions import JobSubmissionException, MisconfigurationException
+from .file_writer import FileWriterPool, set_writer
+from .hook_runner import HookCommandRunner
 from .html_reports import HTMLReportBuilder
+from .report_server import LazyHTMLReportBuilder, serve_report
+from .plan import JobPlan
 from .project import Project, ProjectContext
+from .render_pool import RenderPool
+from .summaries import objs_summary_frame, stats_summary_frame, \
+    write_summary
+from .summary_cache import SummaryCache, parse_objects, parse_stats
 from .utils import *
 from .looper_config import *
 
@@ -137,6 +147,7 @@ class Cleaner(Executor):
         :param argparse.Namespace args: command-line options and arguments
         :param bool preview_flag: whether to halt before actually removing files
         """
+        scripts = []
         for sample in self.prj.samples:
             _LOGGER.info(self.counter.show(sample.sample_name))
             sample_output_folder = sample_folder(self.prj, sample)
@@ -149,10 +160,26 @@ class Cleaner(Executor):
                 # Preview: Don't actually clean, just show what will be cleaned.
                 _LOGGER.info("Files to clean: %s", ", ".join(cleanup_files))
             else:
-                for f in cleanup_files:
-                    _LOGGER.info(f)
-                    subprocess.call(["sh", f])
+                scripts.extend(cleanup_files)
         if not preview_flag:
+            jobs = max(getattr(args, "jobs", 1) or 1, 1)
+            if scripts:
+                _LOGGER.info("Running {} cleanup scripts with {} workers".
+                             format(len(scripts), min(jobs, len(scripts))))
+            failed = []
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for script, returncode, duration in \
+                        executor.map(_run_cleanup_script, scripts):
+                    _LOGGER.info("{}: exit code {} ({:.1f} s)".
+                                 format(script, returncode, duration))
+                    if returncode != 0:
+                        failed.append((script, returncode))
+            if failed:
+                _LOGGER.warning("{} of {} cleanup scripts failed:\n{}".format(
+                    len(failed), len(scripts), "\n".join(
+                        "{} (exit code {})".format(script, returncode)
+                        for script, returncode in failed)))
+                return 1
             _LOGGER.info("Clean complete.")
             return 0
         if args.dry_run:
@@ -170,26 +197,51 @@ class Cleaner(Executor):
 class Destroyer(Executor):
     """ Destroyer of files and folders associated with Project's Samples """
 
-    def __call__(self, args, preview_flag=True):
+    def __call__(self, args, preview_flag=True, folders=None):
         """
         Completely remove all output produced by any pipelines.
 
         :param argparse.Namespace args: command-line options and arguments
         :param bool preview_flag: whether to halt before actually removing files
+        :param list[(str, str)] folders: names and results folders of the
+            samples to remove, as previewed; by default, those of the samples
+            selected by the flags
         """
-
-        _LOGGER.info("Removing results:")
-        for sample in self.prj.samples:
-            _LOGGER.info(self.counter.show(sample.sample_name))
-            sample_output_folder = sample_folder(self.prj, sample)
-            if preview_flag:
-                # Preview: Don't actually delete, just show files.
-                _LOGGER.info(str(sample_output_folder))
-            else:
-                _remove_or_dry_run(sample_output_folder, args.dry_run)
-
-        _LOGGER.info("Removing summary:")
-        destroy_summary(self.prj, args.dry_run)
+        jobs = max(getattr(args, "jobs", 1) or 1, 1)
+        flags = getattr(args, "flags", None)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            if folders is None:
+                folders = self._select_folders(flags, executor)
+            self.counter = LooperCounter(len(folders))
+            if not preview_flag:
+                _LOGGER.info("Removing results:")
+                futures = {executor.submit(_remove_or_dry_run, folder,
+                                           args.dry_run): name
+                           for name, folder in folders}
+                for future in as_completed(futures):
+                    future.result()
+                    _LOGGER.info(self.counter.show(futures[future]))
+            elif args.dry_run or not args.force_yes:
+                _LOGGER.info("Results to remove:")
+                # the folders are measured concurrently, but listed in order
+                usage = executor.map(lambda x: _disk_usage(x[1]), folders)
+                total_size, total_inodes = 0, 0
+                for (name, folder), (size, inodes) in zip(folders, usage):
+                    _LOGGER.info(self.counter.show(name))
+                    _LOGGER.info(str(folder))
+                    total_size += size
+                    total_inodes += inodes
+                _LOGGER.info("Space to free: {} in {} files and folders".
+                             format(_format_size(total_size), total_inodes))
+
+        if flags:
+            # the summaries cover the samples that are kept, too
+            _LOGGER.info("Keeping summary, only the results of samples with "
+                         "flags {} are removed".format(", ".join(flags)))
+        else:
+            _LOGGER.info("Removing summary:")
+            # nothing is removed before the user confirms the intent
+            destroy_summary(self.prj, args.dry_run or preview_flag)
 
         if not preview_flag:
             _LOGGER.info("Destroy complete.")
@@ -208,7 +260,27 @@ class Destroyer(Executor):
         self.counter.reset()
 
         # Finally, run the true destroy:
-        return self(args, preview_flag=False)
+        return self(args, preview_flag=False, folders=folders)
+
+    def _select_folders(self, flags, executor):
+        """
+        Get the results folders of the samples to remove
+
+        :param Iterable[str] flags: names of the flags, e.g. 'failed', the
+            samples with any of which are selected; all samples if empty
+        :param concurrent.futures.Executor executor: executor to look for
+            the flag files of the samples with
+        :return list[(str, str)]: names and results folders of the samples
+        """
+        samples = self.prj.samples
+        if flags:
+            # flags of any pipeline
+            flagged = executor.map(lambda s: _has_flag(
+                fetch_sample_flags(self.prj, s, ""), flags), samples)
+            samples = [s for s, keep in zip(samples, flagged) if keep]
+            _LOGGER.info("Samples with flags {}: {}".format(
+                ", ".join(flags), len(samples)))
+        return [(s.sample_name, sample_folder(self.prj, s)) for s in samples]
 
 
 class Collator(Executor):
@@ -264,6 +336,7 @@ class Collator(Executor):
             )
             conductor._pool = [None]
             conductor.submit()
+            conductor.close_backend()
             jobs += conductor.num_job_submissions
         _LOGGER.info("\nLooper finished")
         _LOGGER.info("Jobs submitted: {}".format(jobs))
@@ -309,63 +382,125 @@ class Runner(Executor):
         [validate_config(self.prj, schema_file, True)
          for schema_file in self.prj.get_schemas(self.prj.pipeline_interfaces)]
 
-        for piface in self.prj.pipeline_interfaces:
-            conductor = SubmissionConductor(
-                pipeline_interface=piface,
-                prj=self.prj,
-                compute_variables=comp_vars,
-                delay=args.time_delay,
-                extra_args=args.command_extra,
-                extra_args_override=args.command_extra_override,
-                ignore_flags=args.ignore_flags,
-                max_cmds=args.lumpn,
-                max_size=args.lump
-            )
-            submission_conductors[piface.pipe_iface_file] = conductor
-
-        for sample in self.prj.samples[:upper_sample_bound]:
-            pl_fails = []
-            skip_reasons = []
-            sample_pifaces = self.prj.get_sample_piface(sample[SAMPLE_NAME_ATTR])
-            if not sample_pifaces:
-                skip_reasons.append("No pipeline interfaces defined")
-
-            if skip_reasons:
-                _LOGGER.warning(NOT_SUB_MSG.format(", ".join(skip_reasons)))
-                failures[sample.sample_name] = skip_reasons
-                continue
-
-            # single sample validation against a single schema
-            # (from sample's piface)
-            [validate_sample(self.prj, sample.sample_name, schema_file, True)
-             for schema_file in self.prj.get_schemas(sample_pifaces)]
-
-            processed_samples.add(sample[SAMPLE_NAME_ATTR])
-
-            for sample_piface in sample_pifaces:
-                _LOGGER.info(
-                    self.counter.show(name=sample.sample_name,
-                                      pipeline_name=sample_piface.pipeline_name)
+        # shared by the conductors, so that the hook commands of all the
+        # pipelines share the pool and the memoized outputs
+        hook_runner = HookCommandRunner(
+            jobs=args.hook_jobs,
+            cache_path=get_file_for_project(self.prj,
+                                            PRE_SUBMIT_CACHE_FILENAME))
+        # the scripts and sample files are written in the background, while
+        # the next samples are rendered
+        file_writer = FileWriterPool()
+        set_writer(file_writer)
+        # the commands and scripts of the single-sample jobs are rendered in
+        # worker processes, while the next samples are prepared
+        render_pool = None
+        try:
+            # in plan mode, the jobs are recorded instead of written and
+            # submitted
+            plan = JobPlan() if args.plan is not None else None
+            if args.render_workers > 1 and plan is None:
+                if RenderPool.is_supported():
+                    render_pool = RenderPool(args.render_workers)
+                else:
+                    _LOGGER.warning("Parallel script rendering is not "
+                                    "supported on this platform, rendering "
+                                    "serially")
+            for piface in self.prj.pipeline_interfaces:
+                if piface.pipe_iface_file in submission_conductors:
+                    continue
+                conductor = SubmissionConductor(
+                    pipeline_interface=piface,
+                    prj=self.prj,
+                    compute_variables=comp_vars,
+                    delay=args.time_delay,
+                    extra_args=args.command_extra,
+                    extra_args_override=args.command_extra_override,
+                    ignore_flags=args.ignore_flags,
+                    max_cmds=args.lumpn,
+                    max_size=args.lump,
+                    hook_runner=hook_runner,
+                    render_pool=render_pool,
+                    plan=plan
                 )
-                num_commands_possible += 1
-                cndtr = submission_conductors[sample_piface.pipe_iface_file]
+                submission_conductors[piface.pipe_iface_file] = conductor
+            if render_pool is not None:
+                # the worker processes are forked before the hooks and the
+                # writes start any thread
+                render_pool.start()
+
+            # batch pre-submission hooks see all the samples of a pipeline at
+            # once; no hooks are executed in plan mode
+            if plan is None:
+                for piface_source, conductor in submission_conductors.items():
+                    piface_samples = \
+                        self.prj._samples_by_interface.get(piface_source, [])
+                    piface_samples = \
+                        [s for s in self.prj.samples[:upper_sample_bound]
+                         if s.sample_name in piface_samples]
+                    conductor.exec_batch_pre_submit(piface_samples)
+                    conductor.prefetch_pre_submit(piface_samples)
+
+            for sample in self.prj.samples[:upper_sample_bound]:
+                pl_fails = []
+                skip_reasons = []
+                sample_pifaces = \
+                    self.prj.get_sample_piface(sample[SAMPLE_NAME_ATTR])
+                if not sample_pifaces:
+                    skip_reasons.append("No pipeline interfaces defined")
+
+                if skip_reasons:
+                    _LOGGER.warning(
+                        NOT_SUB_MSG.format(", ".join(skip_reasons)))
+                    failures[sample.sample_name] = skip_reasons
+                    if plan is not None:
+                        plan.add_skipped(None, sample.sample_name,
+                                         skip_reasons)
+                    continue
+
+                # single sample validation against a single schema
+                # (from sample's piface)
+                [validate_sample(self.prj, sample.sample_name, schema_file,
+                                 True)
+                 for schema_file in self.prj.get_schemas(sample_pifaces)]
+
+                processed_samples.add(sample[SAMPLE_NAME_ATTR])
+
+                for sample_piface in sample_pifaces:
+                    _LOGGER.info(self.counter.show(
+                        name=sample.sample_name,
+                        pipeline_name=sample_piface.pipeline_name))
+                    num_commands_possible += 1
+                    cndtr = \
+                        submission_conductors[sample_piface.pipe_iface_file]
+                    try:
+                        curr_pl_fails = cndtr.add_sample(sample, rerun=rerun)
+                    except JobSubmissionException as e:
+                        failed_submission_scripts.append(e.script)
+                    else:
+                        pl_fails.extend(curr_pl_fails)
+                if pl_fails:
+                    failures[sample.sample_name].extend(pl_fails)
+
+            job_sub_total = 0
+            cmd_sub_total = 0
+
+            for piface, conductor in submission_conductors.items():
                 try:
-                    curr_pl_fails = cndtr.add_sample(sample, rerun=rerun)
+                    conductor.submit(force=True)
                 except JobSubmissionException as e:
                     failed_submission_scripts.append(e.script)
-                else:
-                    pl_fails.extend(curr_pl_fails)
-            if pl_fails:
-                failures[sample.sample_name].extend(pl_fails)
-
-        job_sub_total = 0
-        cmd_sub_total = 0
-
-        for piface, conductor in submission_conductors.items():
-            conductor.submit(force=True)
-            job_sub_total += conductor.num_job_submissions
-            cmd_sub_total += conductor.num_cmd_submissions
-            conductor.write_skipped_sample_scripts()
+                conductor.close_backend()
+                job_sub_total += conductor.num_job_submissions
+                cmd_sub_total += conductor.num_cmd_submissions
+                conductor.write_skipped_sample_scripts()
+        finally:
+            # the threads and processes are stopped even if a submission fails
+            hook_runner.close()
+            if render_pool is not None:
+                render_pool.close()
+            set_writer(None)
+            file_writer.close()
 
         # Report what went down.
         _LOGGER.info("\nLooper finished")
@@ -374,7 +509,13 @@ class Runner(Executor):
         _LOGGER.info("Commands submitted: {} of {}".
                      format(cmd_sub_total, max_cmds))
         _LOGGER.info("Jobs submitted: {}".format(job_sub_total))
-        if args.dry_run:
+        if plan is not None:
+            _LOGGER.info("\nPlan totals:\n{}".format(plan.summary()))
+            if args.plan:
+                plan.write(args.plan)
+            _LOGGER.info("Plan only. No scripts were written and no jobs "
+                         "were submitted.")
+        elif args.dry_run:
             _LOGGER.info("Dry run. No jobs were actually submitted.")
 
         # Restructure sample/failure data for display.
@@ -412,17 +553,23 @@ class Runner(Executor):
 class Report(Executor):
     """ Combine project outputs into a browsable HTML report """
     def __call__(self, args):
-        # initialize the report builder
-        report_builder = HTMLReportBuilder(self.prj)
-
-        # Do the stats and object summarization.
-        table = Table(self.prj)()
+        # initialize the report builder; the served report is rendered
+        # on request
+        serve = getattr(args, "serve", None) is not None
+        builder_class = LazyHTMLReportBuilder if serve else HTMLReportBuilder
+        report_builder = builder_class(self.prj, jobs=args.jobs)
+
+        # Do the stats and object summarization. The TSV stats summary is
+        # always needed, since the report links to it.
+        table = Table(self.prj)(formats=uniqify(["tsv"] + args.format))
         # run the report builder. a set of HTML pages is produced
         report_path = report_builder(table.objs, table.stats,
                                      uniqify(table.columns))
 
         _LOGGER.info("HTML Report (n=" + str(len(table.stats)) + "): "
                      + report_path)
+        if serve:
+            serve_report(report_builder, args.serve)
 
 
 class Table(Executor):
@@ -432,24 +579,54 @@ class Table(Executor):
         super(Table, self).__init__(prj)
         self.prj = prj
 
-    def __call__(self):
+    def __call__(self, formats=("tsv",), stream=False):
+        """
+        Summarize the project statistics and objects.
+
+        In the streaming mode the summaries are written row by row, so the
+        memory use does not depend on the number of samples. The collected
+        statistics and objects are not retained in this mode.
+
+        :param Iterable[str] formats: formats to write the summaries in,
+            any of: 'tsv', 'parquet', 'feather'
+        :param bool stream: whether to stream the summaries to TSV files
+        :raise ValueError: if streaming is requested for a columnar format
+        """
+        if stream:
+            columnar_formats = [f for f in formats if f != "tsv"]
+            if columnar_formats:
+                raise ValueError("Only TSV summaries can be streamed, "
+                                 "requested: {}".format(columnar_formats))
+            self.stats, self.objs = None, None
+            self.columns = _stream_stats_summary(self.prj, self.counter)
+            _stream_obj_summary(self.prj, self.counter)
+            return self
         # pull together all the fits and stats from each sample into
-        # project-combined spreadsheets.
-        self.stats, self.columns = _create_stats_summary(self.prj, self.counter)
-        self.objs = _create_obj_summary(self.prj, self.counter)
+        # project-combined spreadsheets. Sample files that did not change
+        # since the previous call are not parsed again.
+        cache = SummaryCache(
+            get_file_for_project(self.prj, SUMMARY_CACHE_FILENAME))
+        self.stats, self.columns = \
+            _create_stats_summary(self.prj, self.counter, cache, formats)
+        self.objs = _create_obj_summary(self.prj, self.counter, cache, formats)
+        _LOGGER.debug("Sample files parsed: {}".format(cache.reparsed))
+        cache.save()
         return self
 
 
-def _create_stats_summary(project, counter):
+def _create_stats_summary(project, counter, cache, formats=("tsv",)):
     """
     Create stats spreadsheet and columns to be considered in the report, save
     the spreadsheet to file
 
     :param looper.Project project: the project to be summarized
     :param looper.LooperCounter counter: a counter object
+    :param looper.summary_cache.SummaryCache cache: parsed sample files cache
+    :param Iterable[str] formats: formats to save the spreadsheet in
     """
     # Create stats_summary file
     columns = []
+    sheet_columns = []
     stats = []
     project_samples = project.samples
     missing_files = []
@@ -461,47 +638,140 @@ def _create_stats_summary(project, counter):
         # This will correspond to a row in the output.
         sample_stats = sample.get_sheet_dict()
         columns.extend(sample_stats.keys())
+        sheet_columns.extend(sample_stats.keys())
         # Version 0.3 standardized all stats into a single file
         stats_file = os.path.join(sample_output_folder, "stats.tsv")
-        if not os.path.isfile(stats_file):
+        sample_results = cache.get_stats(sample.sample_name, stats_file)
+        if sample_results is None:
             missing_files.append(stats_file)
             continue
-        t = _pd.read_csv(stats_file, sep="\t", header=None,
-                         names=['key', 'value', 'pl'])
-        t.drop_duplicates(subset=['key', 'pl'], keep='last', inplace=True)
-        t.loc[:, 'plkey'] = t['pl'] + ":" + t['key']
-        dupes = t.duplicated(subset=['key'], keep=False)
-        t.loc[dupes, 'key'] = t.loc[dupes, 'plkey']
-        sample_stats.update(t.set_index('key')['value'].to_dict())
+        sample_stats.update(sample_results)
         stats.append(sample_stats)
-        columns.extend(t.key.tolist())
+        columns.extend([key for key, _ in sample_results])
     if missing_files:
         _LOGGER.warning("Stats files missing for {} samples: {}".
                         format(len(missing_files),missing_files))
+    if "tsv" in formats:
+        tsv_outfile_path = get_file_for_project(project, 'stats_summary.tsv')
+        tsv_outfile = open(tsv_outfile_path, 'w')
+        tsv_writer = csv.DictWriter(tsv_outfile, fieldnames=uniqify(columns),
+                                    delimiter='\t', extrasaction='ignore')
+        tsv_writer.writeheader()
+        for row in stats:
+            tsv_writer.writerow(row)
+        tsv_outfile.close()
+        _LOGGER.info("Statistics summary (n=" + str(len(stats)) + "): " +
+                     tsv_outfile_path)
+    columnar_formats = [f for f in formats if f != "tsv"]
+    if columnar_formats:
+        df = stats_summary_frame(stats, uniqify(columns), sheet_columns)
+        for fmt in columnar_formats:
+            path = write_summary(df, project, "stats_summary", fmt)
+            _LOGGER.info("Statistics summary (n=" + str(len(stats)) + "): " +
+                         path)
+    counter.reset()
+    return stats, uniqify(columns)
+
+
+def _stream_stats_summary(project, counter):
+    """
+    Write the stats spreadsheet one sample at a time.
+
+    The first pass collects the union of the columns, the second one parses
+    each sample's stats file again and writes its row right away. The summary
+    cache is not used, since it holds the parsed data of every sample; only
+    the column names are kept between the passes.
+
+    :param looper.Project project: the project to be summarized
+    :param looper.LooperCounter counter: a counter object
+    :return list[str]: columns of the written spreadsheet
+    """
+    _LOGGER.info("Collecting stats summary columns...")
+    columns = OrderedDict()
+    missing_files = []
+    for sample in project.samples:
+        columns.update((key, None) for key in sample.get_sheet_dict())
+        stats_file = os.path.join(sample_folder(project, sample), "stats.tsv")
+        if os.path.isfile(stats_file):
+            columns.update((key, None) for key, _ in parse_stats(stats_file))
+        else:
+            missing_files.append(stats_file)
+    columns = list(columns)
+    if missing_files:
+        _LOGGER.warning("Stats files missing for {} samples: {}".
+                        format(len(missing_files), missing_files))
+    _LOGGER.info("Creating stats summary...")
     tsv_outfile_path = get_file_for_project(project, 'stats_summary.tsv')
-    tsv_outfile = open(tsv_outfile_path, 'w')
-    tsv_writer = csv.DictWriter(tsv_outfile, fieldnames=uniqify(columns),
-                                delimiter='\t', extrasaction='ignore')
-    tsv_writer.writeheader()
-    for row in stats:
-        tsv_writer.writerow(row)
-    tsv_outfile.close()
-    _LOGGER.info("Statistics summary (n=" + str(len(stats)) + "): " +
+    n_rows = 0
+    with open(tsv_outfile_path, 'w') as tsv_outfile:
+        tsv_writer = csv.DictWriter(tsv_outfile, fieldnames=columns,
+                                    delimiter='\t', extrasaction='ignore')
+        tsv_writer.writeheader()
+        for sample in project.samples:
+            _LOGGER.info(counter.show(sample.sample_name, sample.protocol))
+            stats_file = os.path.join(sample_folder(project, sample),
+                                      "stats.tsv")
+            if not os.path.isfile(stats_file):
+                continue
+            sample_stats = sample.get_sheet_dict()
+            sample_stats.update(parse_stats(stats_file))
+            tsv_writer.writerow(sample_stats)
+            n_rows += 1
+    _LOGGER.info("Statistics summary (n=" + str(n_rows) + "): " +
                  tsv_outfile_path)
     counter.reset()
-    return stats, uniqify(columns)
+    return columns
+
+
+def _stream_obj_summary(project, counter):
+    """
+    Write the objects spreadsheet one sample at a time
+
+    :param looper.Project project: the project to be summarized
+    :param looper.LooperCounter counter: a counter object
+    """
+    _LOGGER.info("Creating objects summary...")
+    objs_file = get_file_for_project(project, 'objs_summary.tsv')
+    missing_files = []
+    n_rows = 0
+    with open(objs_file, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        for sample in project.samples:
+            _LOGGER.info(counter.show(sample.sample_name, sample.protocol))
+            sample_objs_file = os.path.join(sample_folder(project, sample),
+                                            "objects.tsv")
+            if not os.path.isfile(sample_objs_file):
+                missing_files.append(sample_objs_file)
+                continue
+            for row in parse_objects(sample_objs_file):
+                if n_rows == 0:
+                    writer.writerow([""] + OBJECTS_COLNAMES + ['sample_name'])
+                writer.writerow([n_rows] + row + [sample.sample_name])
+                n_rows += 1
+        if n_rows == 0:
+            # match the output of an empty data frame
+            writer.writerow([""])
+    if missing_files:
+        _LOGGER.warning("Object files missing for {} samples: {}".
+                        format(len(missing_files), missing_files))
+    _LOGGER.info("Objects summary (n=" +
+                 str(len(project.samples) - len(missing_files)) + "): " +
+                 objs_file)
+    counter.reset()
 
 
-def _create_obj_summary(project, counter):
+def _create_obj_summary(project, counter, cache, formats=("tsv",)):
     """
     Read sample specific objects files and save to a data frame
 
     :param looper.Project project: the project to be summarized
     :param looper.LooperCounter counter: a counter object
+    :param looper.summary_cache.SummaryCache cache: parsed sample files cache
+    :param Iterable[str] formats: formats to save the spreadsheet in
     :return pandas.DataFrame: objects spreadsheet
     """
     _LOGGER.info("Creating objects summary...")
-    objs = _pd.DataFrame()
+    rows = []
     # Create objects summary file
     missing_files = []
     for sample in project.samples:
@@ -509,23 +779,29 @@ def _create_obj_summary(project, counter):
         _LOGGER.info(counter.show(sample.sample_name, sample.protocol))
         sample_output_folder = sample_folder(project, sample)
         objs_file = os.path.join(sample_output_folder, "objects.tsv")
-        if not os.path.isfile(objs_file):
+        sample_objs = cache.get_objects(sample.sample_name, objs_file)
+        if sample_objs is None:
             missing_files.append(objs_file)
             continue
-        t = _pd.read_csv(objs_file, sep="\t", header=None,
-                         names=['key', 'filename', 'anchor_text',
-                                'anchor_image', 'annotation'])
-        t['sample_name'] = sample.sample_name
-        objs = objs.append(t, ignore_index=True)
+        rows.extend([row + [sample.sample_name] for row in sample_objs])
     if missing_files:
         _LOGGER.warning("Object files missing for {} samples: {}".
                         format(len(missing_files), missing_files))
-    # create the path to save the objects file in
-    objs_file = get_file_for_project(project, 'objs_summary.tsv')
-    objs.to_csv(objs_file, sep="\t")
-    _LOGGER.info("Objects summary (n=" +
-                 str(len(project.samples) - len(missing_files)) + "): " +
-                 objs_file)
+    objs = _pd.DataFrame(rows, columns=OBJECTS_COLNAMES + ['sample_name']) \
+        if rows else _pd.DataFrame()
+    objs_files = []
+    if "tsv" in formats:
+        # create the path to save the objects file in
+        objs_file = get_file_for_project(project, 'objs_summary.tsv')
+        objs.to_csv(objs_file, sep="\t")
+        objs_files.append(objs_file)
+    for fmt in [f for f in formats if f != "tsv"]:
+        objs_files.append(write_summary(
+            objs_summary_frame(objs), project, "objs_summary", fmt))
+    for objs_file in objs_files:
+        _LOGGER.info("Objects summary (n=" +
+                     str(len(project.samples) - len(missing_files)) + "): " +
+                     objs_file)
     return objs
 
 
@@ -561,13 +837,106 @@ def _remove_or_dry_run(paths, dry_run=False):
             _LOGGER.info(path + " does not exist.")
 
 
+def _run_cleanup_script(script):
+    """
+    Run a pipeline cleanup script
+
+    :param str script: path to the script
+    :return (str, int, float): path to the script, its exit code and
+        its duration in seconds
+    """
+    start = time.time()
+    try:
+        returncode = subprocess.call(["sh", script])
+    except OSError as e:
+        _LOGGER.error("Could not run cleanup script '{}': {}".
+                      format(script, getattr(e, 'message', repr(e))))
+        returncode = -1
+    return script, returncode, time.time() - start
+
+
+def _has_flag(flag_files, flags):
+    """
+    Check whether any of the flag files of a sample is one of the given flags
+
+    :param Iterable[str] flag_files: paths to the flag files of the sample
+    :param Iterable[str] flags: names of the flags, e.g. 'failed'
+    :return bool: whether any of the flag files is one of the flags
+    """
+    suffixes = tuple("{}.flag".format(flag) for flag in flags)
+    return any(os.path.basename(f).endswith(suffixes) for f in flag_files)
+
+
+def _disk_usage(path):
+    """
+    Measure the disk space used by a file or a directory tree.
+    Symbolic links are counted, but not followed.
+
+    :param str path: path to the file or directory
+    :return (int, int): bytes used and number of files and directories
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return 0, 0
+    size, inodes = _allocated_size(st), 1
+    if not os.path.isdir(path) or os.path.islink(path):
+        return size, inodes
+    dirs = [path]
+    while dirs:
+        try:
+            entries = list(os.scandir(dirs.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            size += _allocated_size(st)
+            inodes += 1
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.path)
+    return size, inodes
+
+
+def _allocated_size(st):
+    """
+    Get the disk space allocated for a file
+
+    :param os.stat_result st: status of the file
+    :return int: allocated bytes; the file size if not available
+    """
+    blocks = getattr(st, "st_blocks", None)
+    return st.st_size if blocks is None else blocks * 512
+
+
+def _format_size(size):
+    """
+    Format a number of bytes for humans
+
+    :param int size: number of bytes
+    :return str: size with a binary unit, e.g. '1.5 GiB'
+    """
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024.0
+    return "{} {}".format(size, unit) if unit == "B" \
+        else "{:.1f} {}".format(size, unit)
+
+
 def destroy_summary(prj, dry_run=False):
     """
     Delete the summary files if not in dry run mode
     """
-    _remove_or_dry_run([get_file_for_project(prj, "summary.html"),
-                        get_file_for_project(prj, 'stats_summary.tsv'),
-                        get_file_for_project(prj, 'objs_summary.tsv'),
+    summaries = [get_file_for_project(prj, "{}.{}".format(name, fmt))
+                 for name in ["stats_summary", "objs_summary"]
+                 for fmt in SUMMARY_FORMATS]
+    _remove_or_dry_run([get_file_for_project(prj, "summary.html")] +
+                       summaries +
+                       [get_file_for_project(prj, SUMMARY_CACHE_FILENAME),
+                        get_file_for_project(prj, REPORT_MANIFEST_FILENAME),
                         get_file_for_project(prj, "reports")], dry_run)
 
 
@@ -712,6 +1081,10 @@ def main():
         _LOGGER.warning("Unrecognized arguments: {}".
                       format(" ".join([str(x) for x in remaining_args])))
 
+    if getattr(args, "plan", None) is not None:
+        # nothing is written or submitted while planning
+        args.dry_run = True
+
     divcfg = select_divvy_config(filepath=args.divvy) \
         if hasattr(args, "divvy") else None
 
@@ -758,7 +1131,7 @@ def main():
             return Destroyer(prj)(args)
 
         if args.command == "table":
-            Table(prj)()
+            Table(prj)(formats=args.format, stream=args.stream)
         
         if args.command == "report":
             Report(prj)(args)
@@ -0,0 +1,75 @@
+""" Layered variable namespaces used to render the submission scripts """
+
+from collections import ChainMap
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["LayeredNamespace", "overlay"]
+
+
+class LayeredNamespace(ChainMap):
+    """
+    Namespace of variables looked up in a stack of layers.
+
+    A value is read from the first layer that defines it. The namespace is
+    updated in its first layer only, so the other layers can be shared, for
+    example by the namespaces of all the samples of a pipeline, without the
+    updates of one namespace being visible in the others. Values can be
+    accessed as items or as attributes.
+    """
+    def __getattr__(self, item):
+        if item.startswith("_") or item == "maps":
+            raise AttributeError(item)
+        try:
+            return self[item]
+        except KeyError:
+            raise AttributeError(item)
+
+    def __setattr__(self, key, value):
+        if key == "maps":
+            super(LayeredNamespace, self).__setattr__(key, value)
+        else:
+            self[key] = value
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, self.to_dict())
+
+    def items(self):
+        """
+        Produce the key-value pairs of the namespace, as stored in the layers
+
+        :return Iterable[(hashable, object)]: key-value pairs
+        """
+        merged = {}
+        for layer in reversed(self.maps):
+            merged.update(layer.items())
+        return merged.items()
+
+    def to_dict(self):
+        """
+        Return a builtin dict representation of the namespace
+
+        :return dict: merged layers, with the nested mappings converted
+        """
+        merged = {}
+        for layer in reversed(self.maps):
+            if hasattr(layer, "to_dict"):
+                merged.update(layer.to_dict())
+            else:
+                merged.update({k: v.to_dict() if hasattr(v, "to_dict") else v
+                               for k, v in layer.items()})
+        return merged
+
+
+def overlay(*layers):
+    """
+    Create a namespace with an empty top layer over the given layers,
+    which are never modified through it
+
+    :param Mapping | NoneType layers: layers, from the highest to the lowest
+        priority; None layers are skipped
+    :return LayeredNamespace: namespace to update
+    """
+    return LayeredNamespace({}, *[layer for layer in layers
+                                  if layer is not None])
@@ -8,7 +8,7 @@ from collections import Mapping
 from logging import getLogger
 from warnings import warn
 
-from attmap import PathExAttMap as PXAM
+from attmap import AttMap, PathExAttMap as PXAM
 from eido import read_schema
 from peppy import utils as peputil
 from ubiquerg import expandpath, is_url
@@ -63,15 +63,20 @@ class PipelineInterface(PXAM):
         """
         Render path templates under 'var_templates' in this pipeline interface.
 
+        The templates are left intact, so that they can be rendered for
+        every sample.
+
         :param dict namespaces: namespaces to use for rendering
+        :return attmap.AttMap | NoneType: rendered templates, None if this
+            pipeline interface has no 'var_templates' section
         """
         if VAR_TEMPL_KEY in self:
-            for k, v in self[VAR_TEMPL_KEY].items():
-                setattr(self[VAR_TEMPL_KEY], k,
-                        jinja_render_template_strictly(v, namespaces))
-        else:
-            _LOGGER.debug(f"'{VAR_TEMPL_KEY}' section not found in the "
-                          f"{self.__class__.__name__} object.")
+            return AttMap(
+                {k: jinja_render_template_strictly(v, namespaces)
+                 for k, v in self[VAR_TEMPL_KEY].items()})
+        _LOGGER.debug(f"'{VAR_TEMPL_KEY}' section not found in the "
+                      f"{self.__class__.__name__} object.")
+        return None
 
     def get_pipeline_schemas(self, schema_key=INPUT_SCHEMA_KEY):
         """
@@ -106,23 +111,33 @@ class PipelineInterface(PXAM):
         :raises InvalidResourceSpecificationException: if no default
             resource package specification is provided
         """
-        def _file_size_ante(name, data):
-            # Retrieve this package's minimum file size.
-            # Retain backwards compatibility while enforcing key presence.
-            try:
-                fsize = float(data[FILE_SIZE_COLNAME])
-            except KeyError:
-                raise InvalidResourceSpecificationException(
-                    "Required column '{}' does not exist in resource "
-                    "specification TSV.".format(FILE_SIZE_COLNAME))
-            # Negative file size is illogical and problematic for comparison.
-            if fsize < 0:
-                raise InvalidResourceSpecificationException(
-                    "Found negative value () in '{}' column; package '{}'".
-                        format(fsize, FILE_SIZE_COLNAME, name)
-                )
-            return fsize
+        resources_data = {}
+        for layer in reversed(
+                self.choose_resource_layers(namespaces, file_size)):
+            resources_data.update(layer)
+        return resources_data
+
+    def choose_resource_layers(self, namespaces, file_size):
+        """
+        Select the resources for given input file size to given pipeline, as
+        layers to look the resources up in, from the highest priority:
+        the project config 'looper.compute.resources' section, the 'compute'
+        section of this pipeline interface and the size-dependent resource
+        package. The resources returned by a dynamic variables command
+        replace all of them.
 
+        The resource packages are read once per resources file; the layers
+        are shared and must not be modified.
+
+        :param float file_size: Size of input data (in gigabytes).
+        :param Mapping[Mapping[str]] namespaces: namespaced variables to pass
+            as a context for fluid attributes command rendering
+        :return list[Mapping]: resource layers, from the highest priority
+        :raises ValueError: if indicated file size is negative, or if the
+            file size value specified for any resource package is negative
+        :raises InvalidResourceSpecificationException: if no default
+            resource package specification is provided
+        """
         def _notify(msg):
             msg += " for pipeline"
             if self.pipe_iface_file is not None:
@@ -173,15 +188,14 @@ class PipelineInterface(PXAM):
                         " pipeline '{}':\n{}".format(self.pipeline_name, json))
             return json
 
-        def _load_size_dep_vars(piface):
+        def _size_dep_vars_path(piface):
             """
-            Read the resources from a TSV provided in the pipeline interface
+            Get the path to the resources TSV provided in the pipeline
+            interface
 
             :param looper.PipelineInterface piface: currently processed piface
-            :param str section: section of pipeline interface to process
-            :return pandas.DataFrame: resources
+            :return str | NoneType: path to the resources TSV, if provided
             """
-            df = None
             if COMPUTE_KEY in piface \
                     and SIZE_DEP_VARS_KEY in piface[COMPUTE_KEY]:
                 resources_tsv_path = piface[COMPUTE_KEY][SIZE_DEP_VARS_KEY]
@@ -189,15 +203,9 @@ class PipelineInterface(PXAM):
                     resources_tsv_path = os.path.join(
                         os.path.dirname(piface.pipe_iface_file),
                         resources_tsv_path)
-                df = pd.read_csv(resources_tsv_path, sep='\t', header=0).\
-                    fillna(float("inf"))
-                df[ID_COLNAME] = df.index
-                df.set_index(ID_COLNAME)
-                _LOGGER.debug("Loaded resources ({}) for pipeline '{}':\n{}".
-                              format(resources_tsv_path, piface.pipeline_name, df))
-            else:
-                _notify("No '{}' defined".format(SIZE_DEP_VARS_KEY))
-            return df
+                return resources_tsv_path
+            _notify("No '{}' defined".format(SIZE_DEP_VARS_KEY))
+            return None
 
         # Ensure that we have a numeric value before attempting comparison.
         file_size = float(file_size)
@@ -207,26 +215,13 @@ class PipelineInterface(PXAM):
 
         fluid_resources = _load_dynamic_vars(self)
         if fluid_resources is not None:
-            return fluid_resources
-        resources_df = _load_size_dep_vars(self)
+            return [fluid_resources]
+        resources_tsv_path = _size_dep_vars_path(self)
         resources_data = {}
-        if resources_df is not None:
-            resources = resources_df.to_dict('index')
-            try:
-                # Sort packages by descending file size minimum to return first
-                # package for which given file size satisfies the minimum.
-                resource_packages = sorted(
-                    resources.items(),
-                    key=lambda name_and_data: _file_size_ante(*name_and_data),
-                    reverse=False)
-            except ValueError:
-                _LOGGER.error("Unable to use file size to prioritize "
-                              "resource packages: {}".format(resources))
-                raise
-
+        if resources_tsv_path is not None:
             # choose minimally-sufficient package
-            for rp_name, rp_data in resource_packages:
-                size_ante = _file_size_ante(rp_name, rp_data)
+            for rp_name, size_ante, rp_data in \
+                    _load_resource_packages(resources_tsv_path):
                 if file_size <= size_ante:
                     _LOGGER.debug(
                         "Selected '{}' package with file size {}Gb for file "
@@ -236,15 +231,16 @@ class PipelineInterface(PXAM):
                     resources_data = rp_data
                     break
 
+        layers = [resources_data]
         if COMPUTE_KEY in self:
-            resources_data.update(self[COMPUTE_KEY])
+            layers.insert(0, dict(self[COMPUTE_KEY]))
         project = namespaces["project"]
         if LOOPER_KEY in project and COMPUTE_KEY in project[LOOPER_KEY] \
                 and RESOURCES_KEY in project[LOOPER_KEY][COMPUTE_KEY]:
             # overwrite with values from project.looper.compute.resources
-            resources_data.\
-                update(project[LOOPER_KEY][COMPUTE_KEY][RESOURCES_KEY])
-        return resources_data
+            layers.insert(
+                0, dict(project[LOOPER_KEY][COMPUTE_KEY][RESOURCES_KEY]))
+        return layers
 
     def _expand_paths(self, keys):
         """
@@ -327,4 +323,64 @@ class PipelineInterface(PXAM):
             except jsonschema.exceptions.ValidationError as e:
                 if not exclude_case:
                     raise e
-                raise jsonschema.exceptions.ValidationError(e.message)
\ No newline at end of file
+                raise jsonschema.exceptions.ValidationError(e.message)
+
+
+# resource packages read by this process: path of the resources TSV to
+# its state and packages
+_RESOURCE_PACKAGES = {}
+
+
+def _load_resource_packages(resources_tsv_path):
+    """
+    Read the resource packages from a resources TSV, once as long as the
+    file does not change
+
+    :param str resources_tsv_path: path to the resources TSV
+    :return list[(str, float, dict)]: name, minimum file size and data of
+        each resource package, by ascending minimum file size; the data must
+        not be modified
+    :raises InvalidResourceSpecificationException: if a package has no file
+        size or a negative one
+    """
+    def _file_size_ante(name, data):
+        # Retrieve this package's minimum file size.
+        # Retain backwards compatibility while enforcing key presence.
+        try:
+            fsize = float(data[FILE_SIZE_COLNAME])
+        except KeyError:
+            raise InvalidResourceSpecificationException(
+                "Required column '{}' does not exist in resource "
+                "specification TSV.".format(FILE_SIZE_COLNAME))
+        # Negative file size is illogical and problematic for comparison.
+        if fsize < 0:
+            raise InvalidResourceSpecificationException(
+                "Found negative value () in '{}' column; package '{}'".
+                    format(fsize, FILE_SIZE_COLNAME, name)
+            )
+        return fsize
+
+    st = os.stat(resources_tsv_path)
+    state = (st.st_mtime_ns, st.st_size)
+    cached = _RESOURCE_PACKAGES.get(resources_tsv_path)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+    df = pd.read_csv(resources_tsv_path, sep='\t', header=0).\
+        fillna(float("inf"))
+    df[ID_COLNAME] = df.index
+    df.set_index(ID_COLNAME)
+    _LOGGER.debug("Loaded resources ({}):\n{}".format(resources_tsv_path, df))
+    resources = df.to_dict('index')
+    try:
+        # Sort packages by ascending file size minimum to return first
+        # package for which given file size satisfies the minimum.
+        packages = sorted(
+            [(name, _file_size_ante(name, data), data)
+             for name, data in resources.items()],
+            key=lambda package: package[1])
+    except ValueError:
+        _LOGGER.error("Unable to use file size to prioritize "
+                      "resource packages: {}".format(resources))
+        raise
+    _RESOURCE_PACKAGES[resources_tsv_path] = (state, packages)
+    return packages
@@ -0,0 +1,197 @@
+""" In-memory plan of the jobs a run would submit """
+
+import json
+from collections import OrderedDict
+from logging import getLogger
+
+from .const import FILE_SIZE_COLNAME, ID_COLNAME
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["JobPlan"]
+
+_LOGGER = getLogger(__name__)
+
+# compute settings recorded for each planned job
+PLAN_RESOURCE_KEYS = ["cores", "mem", "time", "partition"]
+
+
+class JobPlan(object):
+    """
+    Plan of the jobs a run would submit, and of the samples it would skip.
+
+    The jobs are recorded as the submission conductors would submit them:
+    with their samples, resource package, compute settings and rendered
+    commands. Nothing is written while the plan is built; the plan can be
+    dumped as JSON lines, one record per job or skipped sample.
+    """
+    def __init__(self):
+        self.records = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def __str__(self):
+        return "{} ({} jobs; {} skipped)".format(
+            self.__class__.__name__, len(self.jobs), len(self.skipped))
+
+    @property
+    def jobs(self):
+        """
+        Get the planned jobs
+
+        :return list[dict]: job records, in submission order
+        """
+        return [r for r in self.records if r["type"] == "job"]
+
+    @property
+    def skipped(self):
+        """
+        Get the samples the run would skip
+
+        :return list[dict]: skipped sample records
+        """
+        return [r for r in self.records if r["type"] == "skipped"]
+
+    def add_job(self, pipeline, job_name, samples, size, compute, commands,
+                reasons, submitted=True):
+        """
+        Record a planned job
+
+        :param str pipeline: name of the pipeline
+        :param str job_name: name of the job
+        :param Iterable[str] samples: names of the samples of the job
+        :param float size: total input file size of the job, in GB
+        :param Mapping compute: compute settings of the job, including the
+            selected size-dependent resource package
+        :param list[str] commands: rendered commands
+        :param list[str] reasons: why the commands of the job that could
+            not be rendered would not be submitted
+        :param bool submitted: whether the job would be submitted
+        """
+        self.records.append(OrderedDict([
+            ("type", "job"),
+            ("pipeline", pipeline),
+            ("job_name", job_name),
+            ("samples", list(samples)),
+            ("input_gb", float(size)),
+            ("package", _package_label(compute)),
+            ("resources", OrderedDict([(k, _plain(compute[k])) for k in
+                                       PLAN_RESOURCE_KEYS if k in compute])),
+            ("commands", commands),
+            ("submitted", submitted),
+            ("reasons", reasons)
+        ]))
+
+    def add_skipped(self, pipeline, sample_name, reasons, size=0):
+        """
+        Record a sample the run would skip
+
+        :param str | NoneType pipeline: name of the pipeline the sample would
+            be skipped for, None if it matches no pipeline
+        :param str sample_name: name of the sample
+        :param list[str] reasons: why the sample would be skipped
+        :param float size: input file size of the sample, in GB
+        """
+        self.records.append(OrderedDict([
+            ("type", "skipped"),
+            ("pipeline", pipeline),
+            ("sample", sample_name),
+            ("input_gb", float(size)),
+            ("reasons", list(reasons))
+        ]))
+
+    def totals(self):
+        """
+        Aggregate the planned jobs by pipeline and resource package.
+
+        The cores and memory are summed over the submitted jobs, as far as
+        their values are numeric.
+
+        :return dict[(str, str), dict]: number of jobs and commands, cores,
+            memory and input size in GB, by pipeline and package
+        """
+        totals = OrderedDict()
+        for job in self.jobs:
+            key = (job["pipeline"], job["package"])
+            total = totals.setdefault(key, OrderedDict(
+                [("jobs", 0), ("commands", 0), ("cores", 0), ("mem", 0),
+                 ("input_gb", 0.0), ("not_submitted", 0)]))
+            if not job["submitted"]:
+                total["not_submitted"] += 1
+                continue
+            total["jobs"] += 1
+            total["commands"] += len(job["commands"])
+            total["input_gb"] += job["input_gb"]
+            for k in ["cores", "mem"]:
+                total[k] += _number(job["resources"].get(k))
+        return totals
+
+    def summary(self):
+        """
+        Describe the plan totals
+
+        :return str: totals by pipeline and package, one per line, followed
+            by the number of skipped samples
+        """
+        lines = []
+        for (pipeline, package), total in self.totals().items():
+            lines.append(
+                "{}, package {}: {} jobs, {} commands, {:.10g} cores, {:.10g} mem, "
+                "{:.2f}Gb input".format(
+                    pipeline, package, total["jobs"], total["commands"],
+                    total["cores"], total["mem"], total["input_gb"]) +
+                ("; {} not submitted".format(total["not_submitted"])
+                 if total["not_submitted"] else ""))
+        lines.append("Skipped samples: {}".format(len(self.skipped)))
+        return "\n".join(lines)
+
+    def write(self, path):
+        """
+        Dump the plan as JSON lines, one record per job or skipped sample
+
+        :param str path: path to the file to write
+        """
+        with open(path, 'w') as f:
+            for record in self.records:
+                f.write(json.dumps(record, default=str) + "\n")
+        _LOGGER.info("Plan written to: {}".format(path))
+
+
+def _package_label(compute):
+    """
+    Name the size-dependent resource package of a job after its position in
+    the resources TSV and its maximum input file size
+
+    :param Mapping compute: compute settings of the job
+    :return str: resource package label, 'default' if the pipeline has no
+        size-dependent resources
+    """
+    if ID_COLNAME not in compute or FILE_SIZE_COLNAME not in compute:
+        return "default"
+    return "{} (max_file_size: {:g})".format(
+        compute[ID_COLNAME], float(compute[FILE_SIZE_COLNAME]))
+
+
+def _number(value):
+    """
+    Convert a compute setting to a number
+
+    :param object value: compute setting
+    :return float: numeric value, 0 if it is not a number
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _plain(value):
+    """
+    Convert a numpy scalar, as read from a resources TSV, to a builtin one
+
+    :param object value: compute setting
+    :return object: builtin value
+    """
+    return value.item() if hasattr(value, "item") else value
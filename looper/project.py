@@ -153,6 +153,25 @@ class Project(peppyProject):
         """
         return self._extra_cli_or_cfg(OUTDIR_KEY, strict=True)
 
+    @property
+    def shard_depth(self):
+        """
+        Number of hash-prefix folder levels the report pages, submission
+        scripts, logs and sample YAML files are nested in
+
+        :return int: shard depth; 0 for the flat layout
+        """
+        depth = self._extra_cli_or_cfg(SHARD_DEPTH_KEY) or 0
+        try:
+            depth = int(depth)
+        except (TypeError, ValueError):
+            depth = -1
+        if not 0 <= depth <= 16:
+            raise MisconfigurationException(
+                "'{}' must be an integer between 0 and 16, got: {}".
+                format(SHARD_DEPTH_KEY, self._extra_cli_or_cfg(SHARD_DEPTH_KEY)))
+        return depth
+
     def _extra_cli_or_cfg(self, attr_name, strict=False):
         """
         Get attribute value provided in kwargs in object constructor of from
@@ -433,10 +452,11 @@ class Project(peppyProject):
         """
         pifaces_by_sample = {}
         for source, sample_names in self._samples_by_interface.items():
+            # read and validated once, shared by the samples
+            piface = PipelineInterface(source, pipeline_type="sample")
             for sample_name in sample_names:
                 pifaces_by_sample.setdefault(sample_name, [])
-                pifaces_by_sample[sample_name].\
-                    append(PipelineInterface(source, pipeline_type="sample"))
+                pifaces_by_sample[sample_name].append(piface)
         return pifaces_by_sample
 
     def _omit_from_repr(self, k, cls):
@@ -473,6 +493,8 @@ class Project(peppyProject):
         """
         samples_by_piface = {}
         msgs = set()
+        # sources validated so far, each validated once for all the samples
+        valid_sources = {}
         for sample in self.samples:
             if piface_key in sample and sample[piface_key]:
                 piface_srcs = sample[piface_key]
@@ -480,15 +502,18 @@ class Project(peppyProject):
                     piface_srcs = [piface_srcs]
                 for source in piface_srcs:
                     source = self._resolve_path_with_cfg(source)
-                    try:
-                        PipelineInterface(source, pipeline_type="sample")
-                    except (ValidationError, IOError) as e:
-                        msg = "Ignoring invalid pipeline interface source: " \
-                              "{}. Caught exception: {}".\
-                            format(source, getattr(e, 'message', repr(e)))
-                        msgs.add(msg)
-                        continue
-                    else:
+                    if source not in valid_sources:
+                        try:
+                            PipelineInterface(source, pipeline_type="sample")
+                        except (ValidationError, IOError) as e:
+                            msg = "Ignoring invalid pipeline interface " \
+                                  "source: {}. Caught exception: {}".\
+                                format(source, getattr(e, 'message', repr(e)))
+                            msgs.add(msg)
+                            valid_sources[source] = False
+                        else:
+                            valid_sources[source] = True
+                    if valid_sources[source]:
                         samples_by_piface.setdefault(source, set())
                         samples_by_piface[source].add(sample[SAMPLE_NAME_ATTR])
         for msg in msgs:
@@ -0,0 +1,214 @@
+""" Rendering of the job commands and submission scripts, in worker processes """
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+
+from jinja2.exceptions import UndefinedError
+
+from .const import NOT_SUB_MSG
+from .utils import jinja_render_template_strictly
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["RenderPool", "render_command", "render_submission_script"]
+
+_LOGGER = getLogger(__name__)
+
+# rendering contexts of the pipelines, by key, in a worker process
+_CONTEXTS = {}
+# barrier the worker processes wait at once started, in a worker process
+_STARTED = []
+# seconds the worker processes wait for each other to start
+START_TIMEOUT = 60
+
+
+class RenderPool(object):
+    """
+    Pool of processes rendering the job commands and submission scripts.
+
+    The rendering context of a pipeline, which is the same for all its jobs,
+    is registered before the first job is submitted and is shipped once to
+    each worker process; a job carries the values that vary with the sample
+    only. The worker processes are forked when the pool is started, which
+    must happen before any other thread is started: a process forked while
+    other threads run could inherit locks held by those threads.
+
+    :param int workers: number of worker processes
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        # jobs queued or rendered, but not yet collected, per pipeline
+        self.max_pending = workers * 4
+        self._contexts = {}
+        self._executor = None
+
+    def __str__(self):
+        return "{} ({} workers; {} pipelines)".format(
+            self.__class__.__name__, self.workers, len(self._contexts))
+
+    def add_context(self, key, context):
+        """
+        Register the rendering context of a pipeline
+
+        :param str key: key of the context, used to submit the jobs
+        :param dict context: command template with the extras, 'command_template',
+            string appended to each command, 'extra_args', and divvy
+            adapters, 'adapters'
+        :raise RuntimeError: if the worker processes are started already
+        """
+        if self._executor is not None:
+            raise RuntimeError("Can't add a rendering context to a started "
+                               "{}".format(self.__class__.__name__))
+        self._contexts[key] = context
+
+    def start(self):
+        """
+        Fork the worker processes, all at once, so that none is forked later
+        from a process running other threads
+        """
+        if self._executor is not None:
+            return
+        _LOGGER.debug("Starting {}".format(self))
+        mp_context = multiprocessing.get_context("fork")
+        started = mp_context.Barrier(self.workers)
+        self._executor = ProcessPoolExecutor(
+            self.workers, mp_context=mp_context,
+            initializer=_init_render_worker,
+            initargs=(self._contexts, started))
+        # each worker waits for the others, so that a new worker is forked
+        # for each of these jobs, even where workers are forked on demand
+        for future in [self._executor.submit(_wait_started)
+                       for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, key, job):
+        """
+        Queue a job to be rendered
+
+        :param str key: key of the rendering context of the job pipeline
+        :param (dict, dict, dict) job: plain dict namespaces for the command
+            template, compute settings and looper namespace
+        :return concurrent.futures.Future: future with the rendered command,
+            None if it could not be rendered, the message explaining why, and
+            the submission script content
+        """
+        self.start()
+        return self._executor.submit(_render_job, key, job)
+
+    def close(self):
+        """ Stop the worker processes, once the queued jobs are rendered """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @staticmethod
+    def is_supported():
+        """
+        Check whether the platform can fork the worker processes
+
+        :return bool: whether the rendering can be parallelized
+        """
+        return "fork" in multiprocessing.get_all_start_methods()
+
+
+def render_command(template, extra_args, namespaces):
+    """
+    Render the command of a sample
+
+    :param str template: command template, including the extras
+    :param str extra_args: string appended to the command
+    :param Mapping[Mapping] namespaces: namespaces to render the template in
+    :return (str | NoneType, str | NoneType): rendered command, None if it
+        could not be rendered, and the message explaining why
+    """
+    try:
+        argstring = jinja_render_template_strictly(template=template,
+                                                   namespaces=namespaces)
+    except UndefinedError as jinja_exception:
+        return None, NOT_SUB_MSG.format(str(jinja_exception))
+    except KeyError as e:
+        exc = "pipeline interface is missing {} section".format(str(e))
+        return None, NOT_SUB_MSG.format(exc)
+    return "{} {}".format(argstring, extra_args), None
+
+
+def render_submission_script(adapters, compute, extra_vars):
+    """
+    Populate the submission template, like
+    divvy.ComputingConfiguration.write_script does, without writing the
+    script, so that it can be handed to the writer pool
+
+    :param Mapping[str, str] adapters: divvy adapters, mapping the template
+        fields to the attributes of the extra variables
+    :param Mapping compute: compute settings, including the path to the
+        submission template
+    :param list[Mapping] extra_vars: mappings with which to populate the
+        template fields, overriding the compute settings; the adapters
+        select the values used
+    :return str: submission script content
+    """
+    variables = dict(compute.items())
+    exclude = set()
+    for name, source in (adapters or {}).items():
+        attrs = source.split(".")
+        for extra_var in reversed(extra_vars):
+            # same (substring) namespace matching as divvy
+            if extra_var and attrs[0] in list(extra_var.keys())[0]:
+                exclude.add(attrs[0])
+                value = extra_var
+                for attr in attrs:
+                    try:
+                        value = value[attr]
+                    except KeyError:
+                        value = None
+                        break
+                if value is not None:
+                    variables[name] = value
+    for extra_var in reversed(extra_vars):
+        if extra_var and list(extra_var.keys())[0] not in exclude:
+            variables.update(extra_var)
+    with open(compute["submission_template"], 'r') as f:
+        content = f.read()
+    for key, value in list(variables.items()):
+        content = content.replace("{" + str(key).upper() + "}", str(value))
+    return content
+
+
+def _init_render_worker(contexts, started):
+    """
+    Set the rendering contexts of the pipelines in a worker process
+
+    :param dict[str, dict] contexts: rendering contexts, by key
+    :param multiprocessing.Barrier started: barrier the worker processes
+        wait at once started
+    """
+    _CONTEXTS.update(contexts)
+    _STARTED.append(started)
+
+
+def _wait_started():
+    """ Wait in a worker process for the other worker processes to start """
+    _STARTED[0].wait(START_TIMEOUT)
+
+
+def _render_job(key, job):
+    """
+    Render the command and the submission script of a job in a worker process
+
+    :param str key: key of the rendering context of the job pipeline
+    :param (dict, dict, dict) job: plain dict namespaces for the command
+        template, compute settings and looper namespace
+    :return (str | NoneType, str | NoneType, str): rendered command, None if
+        it could not be rendered, the message explaining why, and the
+        submission script content
+    """
+    context = _CONTEXTS[key]
+    namespaces, compute, looper = job
+    command, message = render_command(context["command_template"],
+                                      context["extra_args"], namespaces)
+    looper["command"] = command or ""
+    content = render_submission_script(context["adapters"], compute,
+                                       [{"looper": looper}])
+    return command, message, content
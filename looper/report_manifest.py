@@ -0,0 +1,138 @@
+""" Manifest of the generated HTML report pages and their inputs """
+
+import hashlib
+import json
+import os
+from logging import getLogger
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["ReportManifest", "page_digest", "file_state", "dir_state"]
+
+_LOGGER = getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+class ReportManifest(object):
+    """
+    Record of the report pages generated by the previous build, along with
+    the digest of the inputs each page was rendered from.
+
+    Pages whose inputs did not change since the previous build do not need to
+    be rendered again; pages that the current build does not produce anymore
+    are stale.
+
+    :param str path: path to the JSON file the manifest is persisted in
+    """
+    def __init__(self, path):
+        self.path = path
+        self._previous = {}
+        self._current = {}
+        self._load()
+
+    def __str__(self):
+        return "{} ({}; {} pages)".format(
+            self.__class__.__name__, self.path, len(self._current))
+
+    def is_current(self, page, digest):
+        """
+        Check whether a page was built from the given inputs before.
+
+        The page is recorded in the current build either way.
+
+        :param str page: path to the page
+        :param str digest: digest of the page inputs
+        :return bool: whether the page exists and is up to date
+        """
+        self._current[page] = digest
+        return self._previous.get(page) == digest and os.path.isfile(page)
+
+    def stale_pages(self):
+        """
+        Get the pages of the previous build that are not part of this one
+
+        :return list[str]: paths to the stale pages
+        """
+        return sorted(set(self._previous) - set(self._current))
+
+    def save(self):
+        """ Write the pages of the current build to disk """
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"version": MANIFEST_VERSION,
+                           "pages": self._current}, f, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            _LOGGER.warning("Could not save report manifest '{}': {}".
+                            format(self.path, getattr(e, 'message', repr(e))))
+            return
+        _LOGGER.debug("Saved report manifest: {}".format(self))
+
+    def _load(self):
+        """ Read the manifest file, if present and compatible """
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (IOError, ValueError) as e:
+            _LOGGER.warning("Ignoring unreadable report manifest '{}': {}".
+                            format(self.path, getattr(e, 'message', repr(e))))
+            return
+        if not isinstance(data, dict) \
+                or data.get("version") != MANIFEST_VERSION:
+            _LOGGER.debug("Ignoring outdated report manifest: {}".
+                          format(self.path))
+            return
+        self._previous = data.get("pages", {})
+
+
+def page_digest(*inputs):
+    """
+    Compute a digest of the inputs a page is rendered from
+
+    :param inputs: JSON-serializable objects; others are stringified
+    :return str: hex digest of the inputs
+    """
+    return hashlib.sha1(json.dumps(
+        inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def file_state(path):
+    """
+    Get the size and modification time of a file
+
+    :param str path: path to the file
+    :return list[int] | NoneType: size and modification time in nanoseconds,
+        None if the file does not exist
+    """
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def dir_state(path):
+    """
+    Get the names, sizes and modification times of the directory entries
+
+    :param str path: path to the directory
+    :return list[list]: name, size and modification time in nanoseconds of
+        each entry, sorted by name; empty if the directory does not exist
+    """
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return []
+    states = []
+    for entry in entries:
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        states.append([entry.name, st.st_size, st.st_mtime_ns])
+    return sorted(states)
@@ -0,0 +1,177 @@
+""" Local HTTP server rendering the HTML report pages on demand """
+
+import mimetypes
+import os
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from logging import getLogger
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote
+
+from .html_reports import HTMLReportBuilder, save_html
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["LazyHTMLReportBuilder", "serve_report"]
+
+_LOGGER = getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+
+
+class LazyHTMLReportBuilder(HTMLReportBuilder):
+    """
+    HTML report builder that keeps the report in memory and renders the
+    sample, object, parent and status pages only when they are requested.
+
+    The index page and the shared scripts are rendered when the builder is
+    called; every rendered page is memoized.
+    """
+    def __init__(self, prj, jobs=1):
+        super(LazyHTMLReportBuilder, self).__init__(prj, jobs=jobs)
+        self.pages = {}
+        self._renderers = {}
+        self._lock = threading.RLock()
+
+    def get_page(self, path):
+        """
+        Get the content of a report page, rendering it first if needed
+
+        :param str path: path of the page in the output directory
+        :return str | NoneType: page content, None if the report has no
+            such page
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self.pages:
+                renderer = self._renderers.get(path)
+                if renderer is None:
+                    return None
+                _LOGGER.debug("Rendering page: {}".format(path))
+                render, args = renderer
+                render(*args)
+            return self.pages.get(path)
+
+    def export(self):
+        """
+        Write the rendered pages to disk
+
+        :return list[str]: paths to the pages written
+        """
+        with self._lock:
+            for path, content in self.pages.items():
+                save_html(path, content)
+            return sorted(self.pages)
+
+    def _write_html(self, path, content):
+        self.pages[os.path.abspath(path)] = content
+
+    def _save_page(self, path, render, *args):
+        self._renderers[os.path.abspath(path)] = \
+            (lambda *a: self._write_html(path, render(*a)), args)
+
+    def _render_changed_pages(self, manifest, render, pages, navbar, footer):
+        for path, _, args in pages:
+            self._renderers[os.path.abspath(path)] = (render, args)
+
+    def _finish_build(self, manifest):
+        # pages are not written to disk, so the manifest is left untouched
+        pass
+
+
+class _ReportRequestHandler(BaseHTTPRequestHandler):
+    """ Serve the report pages of the server's builder """
+
+    def do_GET(self):
+        builder = self.server.builder
+        rel_path = unquote(self.path.split("?", 1)[0].split("#", 1)[0])
+        rel_path = rel_path.lstrip("/")
+        if not rel_path:
+            self.send_response(302)
+            self.send_header("Location", "/" + builder.index_html_filename)
+            self.end_headers()
+            return
+        root = os.path.abspath(builder._outdir)
+        path = os.path.abspath(os.path.join(root, rel_path))
+        if os.path.commonpath([root, path]) != root:
+            self.send_error(404)
+            return
+        try:
+            content = builder.get_page(path)
+        except Exception as e:
+            _LOGGER.error("Could not render page '{}': {}".
+                          format(path, getattr(e, 'message', repr(e))))
+            self.send_error(500)
+            return
+        if content is not None:
+            self._send(content.encode("utf-8"), path)
+            return
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            self._send(f.read(), path)
+
+    def _send(self, body, path):
+        """
+        Send a successful response
+
+        :param bytes body: response content
+        :param str path: path of the file served, determines the content type
+        """
+        content_type = mimetypes.guess_type(path)[0] \
+            or "application/octet-stream"
+        if content_type.startswith("text/") or path.endswith(".js"):
+            content_type += "; charset=utf-8"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        _LOGGER.debug("{} - {}".format(self.address_string(), format % args))
+
+
+class _ReportServer(ThreadingMixIn, HTTPServer):
+    """ HTTP server handling each request in a separate thread """
+    daemon_threads = True
+
+    def __init__(self, address, builder):
+        HTTPServer.__init__(self, address, _ReportRequestHandler)
+        self.builder = builder
+
+
+def serve_report(builder, port, host=DEFAULT_HOST):
+    """
+    Serve a lazily built report until interrupted, then export the pages
+    that were rendered
+
+    :param LazyHTMLReportBuilder builder: called report builder
+    :param int port: port to listen on, 0 to pick a free one
+    :param str host: address to listen on
+    :return list[str]: paths to the pages exported
+    """
+    server = _ReportServer((host, port), builder)
+    if threading.current_thread() is threading.main_thread():
+        # stopping the server with SIGTERM exports the pages too
+        signal.signal(signal.SIGTERM, _interrupt)
+    _LOGGER.info("Serving the HTML report at: http://{}:{}/ "
+                 "(press Ctrl+C to stop)".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    exported = builder.export()
+    _LOGGER.info("Exported {} report pages to: {}".
+                 format(len(exported), builder._outdir))
+    return exported
+
+
+def _interrupt(signum, frame):
+    """ Signal handler stopping the server like Ctrl+C does """
+    raise KeyboardInterrupt
@@ -0,0 +1,255 @@
+""" Consolidated store of sample records, one JSON line per sample """
+
+import atexit
+import json
+import os
+import threading
+from logging import getLogger
+
+from peppy.const import SAMPLE_NAME_ATTR
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["SampleStore", "open_store", "get", "sample_names"]
+
+_LOGGER = getLogger(__name__)
+
+INDEX_EXT = ".idx"
+
+# stores opened for writing by this process, by path
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+# indexes loaded for reading by this process, by path
+_INDEXES = {}
+
+
+class SampleStore(object):
+    """
+    Append-only store of sample records.
+
+    The records are written to a JSON lines file, one record per line, and
+    the offset and length of each line to an index file next to it, so a
+    single record can be read without parsing the others. A sample can be
+    written to the store multiple times; its last record is the one that
+    is read. The superseded records are dropped when the store is opened
+    and when it is closed.
+
+    :param str path: path to the JSON lines file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + INDEX_EXT
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._compact()
+        self._data = open(self.path, 'ab')
+        self._index = open(self.index_path, 'a')
+        self._offset = self._data.tell()
+
+    def __str__(self):
+        return "{} ({})".format(self.__class__.__name__, self.path)
+
+    def put(self, record):
+        """
+        Append a sample record to the store
+
+        :param Mapping record: sample record, JSON-serializable, with the
+            sample name
+        """
+        name = record[SAMPLE_NAME_ATTR]
+        line = (json.dumps(record, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            self._data.write(line)
+            # the index only points to records that are fully written
+            self._data.flush()
+            self._index.write("{}\t{}\t{}\n".format(
+                self._offset, len(line), name))
+            self._index.flush()
+            self._offset += len(line)
+
+    def close(self):
+        """ Close the files of the store and drop the superseded records """
+        with self._lock:
+            self._data.close()
+            self._index.close()
+            self._compact()
+
+    def _compact(self):
+        """
+        Rewrite the store without the superseded records, and with an index
+        consistent with the records
+        """
+        if not os.path.isfile(self.path):
+            return
+        size = os.path.getsize(self.path)
+        try:
+            index, count = _read_index(self.index_path)
+        except (IOError, OSError, ValueError):
+            index, count = None, 0
+        ends = [offset + length for offset, length in (index or {}).values()]
+        consistent = index is not None and max(ends, default=0) == size
+        if consistent and count == len(index):
+            return
+        _LOGGER.debug("Compacting sample store: {}".format(self.path))
+        records = _read_records(self.path, index) if consistent \
+            else _scan_records(self.path)
+        tmp_path, tmp_index_path = self.path + ".tmp", self.index_path + ".tmp"
+        offset = 0
+        with open(tmp_path, 'wb') as data, open(tmp_index_path, 'w') as idx:
+            for name, line in records.items():
+                data.write(line)
+                idx.write("{}\t{}\t{}\n".format(offset, len(line), name))
+                offset += len(line)
+        os.replace(tmp_path, self.path)
+        os.replace(tmp_index_path, self.index_path)
+
+
+def open_store(path):
+    """
+    Get the store at the given path, opened for writing by this process.
+
+    The store is opened once per process and closed at exit.
+
+    :param str path: path to the JSON lines file
+    :return SampleStore: store to write the sample records to
+    """
+    path = os.path.abspath(path)
+    with _STORES_LOCK:
+        if path not in _STORES:
+            _STORES[path] = SampleStore(path)
+        return _STORES[path]
+
+
+def get(path, sample_name):
+    """
+    Get the record of a sample from a store.
+
+    The store index is read once per process; every record is then read
+    with a single seek.
+
+    :param str path: path to the JSON lines file
+    :param str sample_name: name of the sample to get the record of
+    :return dict | NoneType: sample record, None if the store has no record
+        of the sample
+    """
+    for reload in [False, True]:
+        entry = _get_index(path, reload).get(sample_name)
+        if entry is None:
+            continue
+        offset, length = entry
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            line = f.read(length)
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        # the store may have been compacted since the index was read
+        if isinstance(record, dict) \
+                and record.get(SAMPLE_NAME_ATTR) == sample_name:
+            return record
+    return None
+
+
+def sample_names(path):
+    """
+    Get the names of the samples in a store
+
+    :param str path: path to the JSON lines file
+    :return list[str]: names of the samples, in the order they were added
+    """
+    return list(_get_index(path, reload=True))
+
+
+def _get_index(path, reload=False):
+    """
+    Get the index of a store, reading it if needed
+
+    :param str path: path to the JSON lines file
+    :param bool reload: whether to read the index even if it did not change
+        since it was last read
+    :return dict[str, (int, int)]: offset and length of the record of each
+        sample
+    """
+    index_path = path + INDEX_EXT
+    try:
+        st = os.stat(index_path)
+    except OSError:
+        return {}
+    state = (st.st_ino, st.st_size, st.st_mtime_ns)
+    cached = _INDEXES.get(index_path)
+    if reload or cached is None or cached[0] != state:
+        cached = (state, _read_index(index_path)[0])
+        _INDEXES[index_path] = cached
+    return cached[1]
+
+
+def _read_index(index_path):
+    """
+    Read an index file
+
+    :param str index_path: path to the index file
+    :return (dict[str, (int, int)], int): offset and length of the last
+        record of each sample, and the number of records in the index
+    :raise ValueError: if the index is malformed
+    """
+    index = {}
+    count = 0
+    with open(index_path, 'r') as f:
+        for line in f:
+            if not line.endswith("\n"):
+                # partially written entry
+                break
+            offset, length, name = line[:-1].split("\t", 2)
+            index.pop(name, None)
+            index[name] = (int(offset), int(length))
+            count += 1
+    return index, count
+
+
+def _read_records(path, index):
+    """
+    Read the indexed records from a JSON lines file
+
+    :param str path: path to the JSON lines file
+    :param dict[str, (int, int)] index: offset and length of the record of
+        each sample
+    :return dict[str, bytes]: record line of each sample
+    """
+    records = {}
+    with open(path, 'rb') as f:
+        for name, (offset, length) in index.items():
+            f.seek(offset)
+            records[name] = f.read(length)
+    return records
+
+
+def _scan_records(path):
+    """
+    Read the last complete record of each sample from a JSON lines file
+
+    :param str path: path to the JSON lines file
+    :return dict[str, bytes]: record line of each sample
+    """
+    records = {}
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                name = json.loads(line)[SAMPLE_NAME_ATTR]
+            except (ValueError, KeyError, TypeError):
+                _LOGGER.warning("Dropping malformed record from sample "
+                                "store: {}".format(path))
+                continue
+            records.pop(name, None)
+            records[name] = line if line.endswith(b"\n") else line + b"\n"
+    return records
+
+
+@atexit.register
+def _close_stores():
+    """ Close the stores opened for writing by this process """
+    with _STORES_LOCK:
+        for store in _STORES.values():
+            store.close()
+        _STORES.clear()
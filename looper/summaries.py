@@ -0,0 +1,168 @@
+""" Typed, columnar representations of the project summaries """
+
+import os
+from logging import getLogger
+
+import pandas as _pd
+from peppy.const import SAMPLE_NAME_ATTR
+
+from .const import *
+from .utils import get_file_for_project
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["stats_summary_frame", "objs_summary_frame", "write_summary",
+           "read_stats_summary", "read_objs_summary"]
+
+_LOGGER = getLogger(__name__)
+
+STATS_SUMMARY_NAME = "stats_summary"
+OBJS_SUMMARY_NAME = "objs_summary"
+# columns of the objects summary that are worth storing as categoricals
+OBJS_CATEGORICAL_COLS = ["key", "annotation", "sample_name"]
+
+
+def stats_summary_frame(stats, columns, sample_columns=None):
+    """
+    Build a typed data frame from the collected sample statistics.
+
+    Statistics whose every reported value can be interpreted as a number are
+    converted to numeric columns; sample metadata columns become categoricals.
+
+    :param list[dict] stats: statistics for each analyzed sample
+    :param list[str] columns: ordered, unique column names
+    :param Iterable[str] sample_columns: names of the columns that come from
+        the sample annotation sheet
+    :return pandas.DataFrame: typed stats summary
+    """
+    sample_columns = set(sample_columns or []) - {SAMPLE_NAME_ATTR}
+    df = _pd.DataFrame.from_records(stats, columns=columns)
+    for col in columns:
+        if col in sample_columns:
+            df[col] = _as_categorical(df[col])
+        elif col != SAMPLE_NAME_ATTR:
+            df[col] = _as_numeric_if_possible(df[col])
+    return df
+
+
+def objs_summary_frame(objs):
+    """
+    Type the objects summary data frame for columnar storage
+
+    :param pandas.DataFrame objs: objects reported for all samples
+    :return pandas.DataFrame: typed objects summary
+    """
+    if objs.columns.empty:
+        # no objects reported; keep the schema for the columnar formats
+        objs = _pd.DataFrame(columns=OBJECTS_COLNAMES + [SAMPLE_NAME_ATTR])
+    objs = objs.reset_index(drop=True)
+    for col in OBJS_CATEGORICAL_COLS:
+        if col in objs:
+            objs[col] = _as_categorical(objs[col])
+    return objs
+
+
+def write_summary(df, prj, name, fmt):
+    """
+    Write a summary data frame in a columnar format
+
+    :param pandas.DataFrame df: summary to write
+    :param looper.Project prj: project the summary was created for
+    :param str name: name of the summary, e.g. 'stats_summary'
+    :param str fmt: format to use, one of: 'parquet', 'feather'
+    :return str: path to the file written
+    :raise ValueError: if the format is not a supported columnar format
+    """
+    path = get_file_for_project(prj, "{}.{}".format(name, fmt))
+    try:
+        if fmt == "parquet":
+            df.to_parquet(path, index=False)
+        elif fmt == "feather":
+            df.reset_index(drop=True).to_feather(path)
+        else:
+            raise ValueError("Unsupported columnar summary format: {}".
+                             format(fmt))
+    except ImportError:
+        _LOGGER.error("Writing {} summaries requires the 'pyarrow' package".
+                      format(fmt))
+        raise
+    return path
+
+
+def read_stats_summary(prj, formats=None):
+    """
+    Read the most recently written project stats summary
+
+    :param looper.Project prj: project to read the summary for
+    :param Iterable[str] formats: formats to consider, in order of preference
+        in case of equally recent files. Default: all summary formats,
+        columnar ones first
+    :return pandas.DataFrame | NoneType: stats summary, None if there is none
+    """
+    return _read_summary(prj, STATS_SUMMARY_NAME, formats)
+
+
+def read_objs_summary(prj, formats=None):
+    """
+    Read the most recently written project objects summary
+
+    :param looper.Project prj: project to read the summary for
+    :param Iterable[str] formats: formats to consider, in order of preference
+        in case of equally recent files. Default: all summary formats,
+        columnar ones first
+    :return pandas.DataFrame | NoneType: objects summary, None if there is none
+    """
+    return _read_summary(prj, OBJS_SUMMARY_NAME, formats, index_col=0)
+
+
+def _read_summary(prj, name, formats=None, **tsv_kwargs):
+    """
+    Read the freshest of the available representations of a summary
+
+    :param looper.Project prj: project to read the summary for
+    :param str name: name of the summary, e.g. 'stats_summary'
+    :param Iterable[str] formats: formats to consider, in order of preference
+    :return pandas.DataFrame | NoneType: summary, None if there is none
+    """
+    formats = list(formats or reversed(SUMMARY_FORMATS))
+    candidates = []
+    for rank, fmt in enumerate(formats):
+        path = get_file_for_project(prj, "{}.{}".format(name, fmt))
+        if os.path.isfile(path):
+            candidates.append((os.path.getmtime(path), -rank, fmt, path))
+    if not candidates:
+        _LOGGER.debug("No {} found in formats: {}".format(name, formats))
+        return None
+    _, _, fmt, path = max(candidates)
+    _LOGGER.debug("Reading {} from: {}".format(name, path))
+    if fmt == "parquet":
+        return _pd.read_parquet(path)
+    if fmt == "feather":
+        return _pd.read_feather(path)
+    return _pd.read_csv(path, sep="\t", keep_default_na=False,
+                        na_values=[""], **tsv_kwargs)
+
+
+def _as_categorical(col):
+    """
+    Convert a column to a categorical one, stringifying non-missing values
+
+    :param pandas.Series col: column to convert
+    :return pandas.Series: categorical column
+    """
+    return col.where(col.isna(), col.astype(str)).astype("category")
+
+
+def _as_numeric_if_possible(col):
+    """
+    Convert a column to a numeric one if all its values are numbers
+
+    :param pandas.Series col: column to convert
+    :return pandas.Series: numeric column or the original one
+    """
+    present = col.replace("", float("nan")).dropna()
+    numeric = _pd.to_numeric(present, errors="coerce")
+    if present.empty or numeric.isna().any():
+        return col
+    return _pd.to_numeric(col.replace("", float("nan")))
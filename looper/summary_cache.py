@@ -0,0 +1,302 @@
+""" Incremental cache of parsed sample stats and objects files """
+
+import csv
+import json
+import os
+import re
+import threading
+from collections import Counter
+from datetime import timedelta
+from logging import getLogger
+
+import numpy as np
+import pandas as _pd
+
+from .const import *
+
+__author__ = "Databio lab"
+__email__ = "nathan@code.databio.org"
+
+__all__ = ["SummaryCache", "parse_stats", "parse_objects", "parse_profile"]
+
+_LOGGER = getLogger(__name__)
+
+CACHE_VERSION = 1
+STATS_KIND = "stats"
+OBJECTS_KIND = "objects"
+PROFILE_KIND = "profile"
+# runtime as reported in profile.tsv files, e.g. 1:02:03.45
+RUNTIME_REGEX = re.compile(r"^(\d+):(\d+):(\d+(?:\.\d*)?)$")
+
+
+class SummaryCache(object):
+    """
+    Per-project cache of the parsed contents of each sample's stats.tsv and
+    objects.tsv files, and of the summaries of its pipeline profile.
+
+    Every cached entry records the size and modification time of its source
+    file, so a file is re-read only if it changed since it was last parsed.
+
+    :param str path: path to the JSON file the cache is persisted in
+    """
+    def __init__(self, path):
+        self.path = path
+        self._entries = {STATS_KIND: {}, OBJECTS_KIND: {}, PROFILE_KIND: {}}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._reparsed = 0
+        self._load()
+
+    def __str__(self):
+        return "{} ({}; {} stats, {} objects)".format(
+            self.__class__.__name__, self.path,
+            len(self._entries[STATS_KIND]), len(self._entries[OBJECTS_KIND]))
+
+    @property
+    def reparsed(self):
+        """
+        Number of files that had to be parsed since the cache was loaded
+
+        :return int: count of files that were new or changed
+        """
+        return self._reparsed
+
+    def get_stats(self, sample_name, path):
+        """
+        Get the statistics reported for a sample
+
+        :param str sample_name: name of the sample the file belongs to
+        :param str path: path to the sample's stats.tsv file
+        :return list[list[str]] | NoneType: ordered pairs of statistic name
+            and value, None if the file does not exist
+        """
+        return self._get(STATS_KIND, sample_name, path, parse_stats)
+
+    def get_objects(self, sample_name, path):
+        """
+        Get the objects reported for a sample
+
+        :param str sample_name: name of the sample the file belongs to
+        :param str path: path to the sample's objects.tsv file
+        :return list[list[str]] | NoneType: object rows, as many fields
+            as there are OBJECTS_COLNAMES, None if the file does not exist
+        """
+        return self._get(OBJECTS_KIND, sample_name, path, parse_objects)
+
+    def get_profile(self, sample_name, path):
+        """
+        Get the summary of a sample's pipeline profile
+
+        :param str sample_name: name of the sample the file belongs to
+        :param str path: path to the sample's profile.tsv file
+        :return list[str] | NoneType: total runtime and peak memory,
+            None if the file does not exist
+        """
+        return self._get(PROFILE_KIND, sample_name, path, parse_profile)
+
+    def save(self):
+        """
+        Write the cache to disk, if any entries changed since it was loaded
+        """
+        if not self._dirty:
+            _LOGGER.debug("Summary cache unchanged: {}".format(self.path))
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"version": CACHE_VERSION,
+                           "entries": self._entries}, f)
+            os.replace(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            _LOGGER.warning("Could not save summary cache '{}': {}".
+                            format(self.path, getattr(e, 'message', repr(e))))
+            return
+        self._dirty = False
+        _LOGGER.debug("Saved summary cache: {}".format(self))
+
+    def _get(self, kind, sample_name, path, parser):
+        """
+        Get cached data for a file, (re)parsing it first if needed.
+        Safe to call from multiple threads.
+
+        :param str kind: type of the file, stats or objects
+        :param str sample_name: name of the sample the file belongs to
+        :param str path: path to the file
+        :param callable parser: function parsing the file at the given path
+        :return list | NoneType: parsed file data, None if it does not exist
+        """
+        entries = self._entries[kind]
+        try:
+            st = os.stat(path)
+        except OSError:
+            with self._lock:
+                if entries.pop(sample_name, None) is not None:
+                    self._dirty = True
+            return None
+        entry = entries.get(sample_name)
+        if entry is not None and entry["path"] == path \
+                and entry["size"] == st.st_size \
+                and entry["mtime"] == st.st_mtime_ns:
+            return entry["data"]
+        _LOGGER.debug("Parsing {} file: {}".format(kind, path))
+        data = parser(path)
+        with self._lock:
+            entries[sample_name] = {"path": path, "size": st.st_size,
+                                    "mtime": st.st_mtime_ns, "data": data}
+            self._dirty = True
+            self._reparsed += 1
+        return data
+
+    def _load(self):
+        """ Read the cache file, if present and compatible """
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (IOError, ValueError) as e:
+            _LOGGER.warning("Ignoring unreadable summary cache '{}': {}".
+                            format(self.path, getattr(e, 'message', repr(e))))
+            return
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            _LOGGER.debug("Ignoring outdated summary cache: {}".
+                          format(self.path))
+            return
+        for kind in self._entries:
+            self._entries[kind].update(data["entries"].get(kind, {}))
+        _LOGGER.debug("Loaded summary cache: {}".format(self))
+
+
+def _read_tsv_rows(path):
+    """
+    Read the non-empty rows of a headerless TSV file
+
+    :param str path: path to the file
+    :return list[list[str]]: rows of fields
+    """
+    with open(path, 'r', newline='') as f:
+        return [row for row in csv.reader(f, delimiter='\t') if row]
+
+
+def parse_stats(path):
+    """
+    Parse a stats.tsv file into an ordered collection of statistics.
+
+    Only the last value reported for a given statistic by a given pipeline is
+    kept. If multiple pipelines report a statistic with the same name, its
+    name is prefixed with the name of the pipeline: '<pipeline>:<statistic>'.
+
+    :param str path: path to the stats.tsv file
+    :return list[list[str]]: ordered pairs of statistic name and value
+    """
+    rows = [(row + ["", ""])[:3] for row in _read_tsv_rows(path)]
+    last = {}
+    for idx, (key, _, pl) in enumerate(rows):
+        last[(key, pl)] = idx
+    kept = [rows[idx] for idx in sorted(last.values())]
+    key_counts = Counter(key for key, _, _ in kept)
+    return [["{}:{}".format(pl, key) if key_counts[key] > 1 else key, value]
+            for key, value, pl in kept]
+
+
+def parse_objects(path):
+    """
+    Parse an objects.tsv file. Missing or empty fields are set to None.
+
+    :param str path: path to the objects.tsv file
+    :return list[list[str]]: object rows
+    """
+    n = len(OBJECTS_COLNAMES)
+    return [[field or None for field in (row + [None] * n)[:n]]
+            for row in _read_tsv_rows(path)]
+
+
+def parse_profile(path):
+    """
+    Summarize a pipeline profile.tsv file.
+
+    The runtime is the sum of the runtimes of the commands, each command ID
+    counted once, with its last reported runtime. The memory is the peak
+    memory use reported for any command.
+
+    :param str path: path to the profile.tsv file
+    :return list[str]: total runtime, e.g. '1:02:03', and peak memory,
+        e.g. '1.5 GB'
+    """
+    try:
+        cids, runtimes, mems = _read_profile_columns(path)
+    except ValueError:
+        _LOGGER.debug("Parsing unusual profile file with pandas: {}".
+                      format(path))
+        return _parse_profile_frame(path)
+    # indices of the last occurrence of each command ID, in file order
+    _, first_from_end = np.unique(cids[::-1], return_index=True)
+    last = np.sort(len(cids) - 1 - first_from_end)
+    runtime = runtimes[last].sum() if len(last) else 0
+    mem = mems.max() if len(mems) else 0
+    return [_format_runtime(runtime), "{} GB".format(mem)]
+
+
+def _read_profile_columns(path):
+    """
+    Read the command IDs, runtimes in seconds and memory use columns of
+    a profile.tsv file
+
+    :param str path: path to the profile.tsv file
+    :return (numpy.ndarray, numpy.ndarray, numpy.ndarray): command IDs,
+        runtimes and memory use
+    :raise ValueError: if the file does not have the expected layout
+    """
+    n = len(PROFILE_COLNAMES)
+    cid_idx, runtime_idx, mem_idx = [PROFILE_COLNAMES.index(c)
+                                     for c in ["cid", "runtime", "mem"]]
+    cids, runtimes, mems = [], [], []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split("#", 1)[0].rstrip("\r\n")
+            if not line.strip():
+                continue
+            fields = line.split("\t")
+            if len(fields) != n:
+                raise ValueError("Expected {} fields, got {}".
+                                 format(n, len(fields)))
+            cids.append(int(fields[cid_idx]))
+            match = RUNTIME_REGEX.match(fields[runtime_idx].strip())
+            if match is None:
+                raise ValueError("Unexpected runtime: {}".
+                                 format(fields[runtime_idx]))
+            h, m, sec = match.groups()
+            runtimes.append(int(h) * 3600 + int(m) * 60 + float(sec))
+            mems.append(fields[mem_idx].strip())
+    # integer memory values are reported as such, like pandas would
+    try:
+        mems = np.array([int(m) for m in mems], dtype=np.int64)
+    except ValueError:
+        mems = np.array([float(m) for m in mems], dtype=np.float64)
+    return np.array(cids, dtype=np.int64), \
+        np.array(runtimes, dtype=np.float64), mems
+
+
+def _parse_profile_frame(path):
+    """
+    Summarize a profile.tsv file of any layout pandas can read
+
+    :param str path: path to the profile.tsv file
+    :return list[str]: total runtime and peak memory
+    """
+    df = _pd.read_csv(path, sep="\t", comment="#", names=PROFILE_COLNAMES)
+    df['runtime'] = _pd.to_timedelta(df['runtime'])
+    unique_df = df[~df.duplicated('cid', keep='last').values]
+    runtime = sum(unique_df['runtime'].apply(lambda x: x.total_seconds()))
+    mem = max(df['mem']) if not df['mem'].empty else 0
+    return [_format_runtime(runtime), "{} GB".format(str(mem))]
+
+
+def _format_runtime(seconds):
+    """
+    Format a runtime as H:MM:SS, dropping the fractions of a second
+
+    :param float seconds: runtime in seconds
+    :return str: formatted runtime
+    """
+    return str(timedelta(seconds=float(seconds))).split(".")[0]
@@ -2,7 +2,9 @@
 
 from collections import defaultdict, Iterable
 from logging import getLogger
+from functools import lru_cache
 import glob
+import hashlib
 import os
 from .const import *
 from .exceptions import MisconfigurationException
@@ -121,6 +123,30 @@ def sample_folder(prj, sample):
                         sample[SAMPLE_NAME_ATTR])
 
 
+def sharded_path(folder, name, filename=None, shard_depth=0):
+    """
+    Get the path to a file or folder that belongs to a sample or a job.
+
+    In the sharded layout, the path is nested in as many subfolders as the
+    shard depth, named after consecutive pairs of characters of the name's
+    hash, e.g. 'submission/3f/a1/sample1.sub'. This keeps the number of
+    entries in each folder small for projects with many samples.
+
+    :param str folder: parent folder, e.g. the submission folder
+    :param str name: name of the sample or the job the path belongs to
+    :param str filename: name of the file, the name itself if not provided
+    :param int shard_depth: number of hash-prefix folder levels; 0 for
+        the flat layout
+    :return str: path to the file or folder
+    """
+    filename = name if filename is None else filename
+    if not shard_depth:
+        return os.path.join(folder, filename)
+    digest = hashlib.md5(str(name).encode("utf-8")).hexdigest()
+    shards = [digest[2 * i:2 * i + 2] for i in range(int(shard_depth))]
+    return os.path.join(folder, *shards, filename)
+
+
 def get_file_for_project(prj, appendix):
     """
     Create a path to the file for the current project.
@@ -143,7 +169,7 @@ def jinja_render_template_strictly(template, namespaces):
     Render a command string in the provided namespaces context.
 
     Strictly, which means that all the requested attributes must be
-    available in the namespaces
+    available in the namespaces. Each template is compiled once per process.
 
     :param str template: command template do be filled in with the
         variables in the provided namespaces. For example:
@@ -152,18 +178,7 @@ def jinja_render_template_strictly(template, namespaces):
         Possible namespaces are: looper, project, sample, pipeline
     :return str: rendered command
     """
-    def _finfun(x):
-        """
-        A callable that can be used to process the result of a variable
-        expression before it is output. Joins list elements
-        """
-        return " ".join(x) if isinstance(x, list) else x
-
-    env = jinja2.Environment(undefined=jinja2.StrictUndefined,
-                             variable_start_string="{",
-                             variable_end_string="}",
-                             finalize=_finfun)
-    templ_obj = env.from_string(template)
+    templ_obj = _compile_template(template)[0]
     try:
         rendered = templ_obj.render(**namespaces)
     except jinja2.exceptions.UndefinedError:
@@ -175,6 +190,168 @@ def jinja_render_template_strictly(template, namespaces):
     return rendered
 
 
+def template_context(templates, namespaces):
+    """
+    Copy the namespace values some command templates reference into plain
+    dicts, which render the templates like the namespaces do.
+
+    Attributes the templates reference but the namespaces do not have are
+    undefined in the copy, so rendering fails for them with the same error
+    as with the namespaces.
+
+    :param Iterable[str] templates: command templates
+    :param Mapping[Mapping] namespaces: namespaces to render the templates in
+    :return dict[str, object]: plain dict namespaces; the values referenced
+        as a whole are not copied
+    """
+    def _select(obj, tree):
+        selected = {}
+        for attr, subtree in tree.items():
+            value = _JINJA_ENV.getattr(obj, attr)
+            if isinstance(value, jinja2.Undefined):
+                value = _MissingAttribute(value._undefined_message)
+            selected[attr] = value if subtree is None \
+                else _select(value, subtree)
+        return selected
+
+    refs = {}
+    for template in templates:
+        template_refs = _compile_template(template)[1]
+        if template_refs is None:
+            return dict(namespaces)
+        _merge_references(refs, template_refs)
+    return {name: namespaces[name] if subtree is None
+            else _select(namespaces[name], subtree)
+            for name, subtree in refs.items() if name in namespaces}
+
+
+def _finfun(x):
+    """
+    A callable that can be used to process the result of a variable
+    expression before it is output. Joins list elements
+    """
+    return " ".join(x) if isinstance(x, list) else x
+
+
+_JINJA_ENV = jinja2.Environment(undefined=jinja2.StrictUndefined,
+                                variable_start_string="{",
+                                variable_end_string="}",
+                                finalize=_finfun)
+
+
+class _MissingAttribute(jinja2.StrictUndefined):
+    """
+    Attribute missing from a namespaces copy; it keeps the error message of
+    the namespaces rather than a reference to them, so it can be pickled
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return _MissingAttribute, (self._undefined_hint,)
+
+
+# the cache is bounded, since some templates are rendered once per sample,
+# like the paths the 'var_templates' are rendered to
+@lru_cache(maxsize=512)
+def _compile_template(template):
+    """
+    Compile a command template and find the namespace attributes it
+    references, once per template
+
+    :param str template: command template
+    :return (jinja2.Template, dict | NoneType): compiled template and the
+        attributes it references, None if they could not be determined
+    """
+    ast = _JINJA_ENV.parse(template)
+    return _JINJA_ENV.from_string(ast), template_references(ast)
+
+
+def template_references(template):
+    """
+    Find the namespace attributes a command template references.
+
+    The references are found statically: for every top-level name, the
+    attributes are those accessed with a constant attribute path, like
+    'sample.read1' or 'project["looper"].output_dir'. A name used in any
+    other way, for example in a filter or a loop, is referenced as a whole.
+
+    :param str | jinja2.nodes.Template template: command template, or its
+        parsed form
+    :return dict[str, dict] | NoneType: tree of the referenced attributes
+        of each name, where None marks the attributes referenced as a whole;
+        None if the template assigns variables, so the references
+        can not be determined
+    """
+    from jinja2 import nodes
+
+    def _attr_path(node):
+        path = []
+        while True:
+            if isinstance(node, nodes.Getattr):
+                path.append(node.attr)
+            elif isinstance(node, nodes.Getitem) \
+                    and isinstance(node.arg, nodes.Const) \
+                    and isinstance(node.arg.value, str):
+                path.append(node.arg.value)
+            elif isinstance(node, nodes.Name) and node.ctx == "load":
+                return [node.name] + path[::-1]
+            else:
+                return None
+            node = node.node
+
+    def _add(tree, path):
+        for attr in path[:-1]:
+            subtree = tree.setdefault(attr, {})
+            if subtree is None:
+                return
+            tree = subtree
+        tree[path[-1]] = None
+
+    def _visit(node):
+        if isinstance(node, nodes.Name):
+            if node.ctx != "load":
+                raise ValueError(node.name)
+            paths.append([node.name])
+            return
+        if isinstance(node, (nodes.Getattr, nodes.Getitem)):
+            path = _attr_path(node)
+            if path is not None:
+                paths.append(path)
+                return
+        for child in node.iter_child_nodes():
+            _visit(child)
+
+    if isinstance(template, str):
+        template = _JINJA_ENV.parse(template)
+    paths = []
+    try:
+        _visit(template)
+    except ValueError:
+        return None
+    refs = {}
+    # shorter paths first, so the values referenced as a whole are kept whole
+    for path in sorted(paths, key=len):
+        _add(refs, path)
+    return refs
+
+
+def _merge_references(refs, other):
+    """
+    Merge trees of referenced attributes, in place
+
+    :param dict refs: tree to merge into
+    :param dict other: tree to merge
+    """
+    for attr, subtree in other.items():
+        if subtree is None:
+            refs[attr] = None
+        elif attr not in refs:
+            refs[attr] = {}
+            _merge_references(refs[attr], subtree)
+        elif refs[attr] is not None:
+            _merge_references(refs[attr], subtree)
+
+
 def read_yaml_file(filepath):
     """
     Read a YAML file
@@ -83,7 +83,14 @@ setup(
     license="BSD2",
     entry_points={
         "console_scripts": [
-            'looper = looper.__main__:main'
+            'looper = looper.__main__:main',
+            'looper-fake-scheduler = looper.fake_scheduler:main'
+        ],
+        "looper.submission_backends": [
+            'shell = looper.backends:ShellBackend',
+            'local = looper.backends:LocalPoolBackend',
+            'memory = looper.backends:MemoryBackend',
+            'fake = looper.backends:FakeSchedulerBackend'
         ],
     },
     scripts=scripts,
@@ -1,6 +1,20 @@
+import contextlib
+import signal
+import socket
+import time
+from urllib.request import urlopen
+
 import pytest
+from jinja2.exceptions import UndefinedError
 from tests.smoketests.conftest import *
 from looper.const import FLAGS
+from looper.conductor import _write_shared_namespace
+from looper import html_reports
+from looper.backends import backend_settings
+from looper.file_writer import FileWriterPool
+from looper.render_pool import RenderPool
+from looper.utils import jinja_render_template_strictly, template_context, \
+    template_references
 from peppy import Project
 
 
@@ -49,3 +63,436 @@ class LooperCheckTests:
         print(stderr)
         for f in FLAGS:
             assert "{}: {}".format(f.upper(), "0") in stderr
+
+
+def _make_stats(cfg, count, stats=None):
+    p = Project(cfg)
+    out_dir = p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY]
+    for s in p.samples[:count]:
+        sf = os.path.join(out_dir, "results_pipeline", s[SAMPLE_NAME_ATTR])
+        if not os.path.exists(sf):
+            os.makedirs(sf)
+        with open(os.path.join(sf, "stats.tsv"), 'a') as f:
+            for k, v in (stats or {"reads": "10"}).items():
+                f.write("{}\t{}\tPIPELINE1\n".format(k, v))
+
+
+def _read_stats_summary(cfg):
+    p = Project(cfg)
+    path = os.path.join(p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY],
+                        p.name + "_stats_summary.tsv")
+    with open(path, 'r') as f:
+        return [line.rstrip("\n").split("\t") for line in f]
+
+
+class LooperTableTests:
+    @pytest.mark.parametrize("count", [1, 3])
+    def test_table_works(self, prep_temp_pep, count):
+        """ Verify that a row is written for each sample with stats """
+        tp = prep_temp_pep
+        _make_stats(tp, count)
+        stdout, stderr, rc = subp_exec(tp, "table")
+        print(stderr)
+        assert rc == 0
+        summary = _read_stats_summary(tp)
+        assert len(summary) == count + 1
+        assert "reads" in summary[0]
+
+    def test_table_rereads_changed_stats(self, prep_temp_pep):
+        """ Verify that stats changed after the previous call are updated """
+        tp = prep_temp_pep
+        _make_stats(tp, 2)
+        stdout, stderr, rc = subp_exec(tp, "table")
+        assert rc == 0
+        _make_stats(tp, 1, {"reads": "20", "new_stat": "x"})
+        stdout, stderr, rc = subp_exec(tp, "table")
+        print(stderr)
+        assert rc == 0
+        summary = _read_stats_summary(tp)
+        rows = [dict(zip(summary[0], r)) for r in summary[1:]]
+        assert rows[0]["reads"] == "20" and rows[0]["new_stat"] == "x"
+        assert rows[1]["reads"] == "10" and rows[1]["new_stat"] == ""
+
+    @pytest.mark.parametrize("fmt", ["parquet", "feather"])
+    def test_table_columnar_formats(self, prep_temp_pep, fmt):
+        """ Verify that typed columnar summaries are written on request """
+        pytest.importorskip("pyarrow")
+        from looper.project import Project as LooperProject
+        from looper.summaries import read_stats_summary
+        tp = prep_temp_pep
+        _make_stats(tp, 2)
+        stdout, stderr, rc = subp_exec(tp, "table", ["--format", fmt])
+        print(stderr)
+        assert rc == 0
+        p = Project(tp)
+        out_dir = p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY]
+        assert os.path.isfile(
+            os.path.join(out_dir, "{}_stats_summary.{}".format(p.name, fmt)))
+        assert not os.path.exists(
+            os.path.join(out_dir, "{}_stats_summary.tsv".format(p.name)))
+        df = read_stats_summary(LooperProject(tp, output_dir=out_dir))
+        assert df["reads"].tolist() == [10, 10]
+        assert df["protocol"].dtype.name == "category"
+
+    def test_table_stream_matches_default(self, prep_temp_pep):
+        """ Verify that the streamed summary is identical to the default one """
+        tp = prep_temp_pep
+        _make_stats(tp, 1, {"reads": "20", "new_stat": "x"})
+        _make_stats(tp, 2)
+        stdout, stderr, rc = subp_exec(tp, "table")
+        assert rc == 0
+        expected = _read_stats_summary(tp)
+        stdout, stderr, rc = subp_exec(tp, "table", ["--stream"])
+        print(stderr)
+        assert rc == 0
+        assert _read_stats_summary(tp) == expected
+
+
+
+def _make_pipeline_outputs(cfg, count):
+    p = Project(cfg)
+    out_dir = p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY]
+    for s in p.samples[:count]:
+        sf = os.path.join(out_dir, "results_pipeline", s[SAMPLE_NAME_ATTR])
+        if not os.path.exists(sf):
+            os.makedirs(sf)
+        with open(os.path.join(sf, "objects.tsv"), 'w') as f:
+            f.write("plot\tplot.pdf\tPlot\tplot.png\tPIPELINE1\n")
+        for name in ["plot.pdf", "plot.png", "PIPELINE1_commands.sh",
+                     "PIPELINE1_completed.flag"]:
+            open(os.path.join(sf, name), 'a').close()
+        with open(os.path.join(sf, "PIPELINE1_profile.tsv"), 'w') as f:
+            f.write("# pid\thash\tcid\truntime\tmem\tcmd\tlock\n"
+                    "1\tabc\t1\t0:00:10\t0.5\tcmd\tlock.a\n")
+        with open(os.path.join(sf, "PIPELINE1_log.md"), 'w') as f:
+            f.write("* Total elapsed time (all runs):  0:00:10\n"
+                    "* Peak memory (this run):  0.5 GB\n")
+
+
+
+def _prep_report(cfg):
+    _make_stats(cfg, 3)
+    _make_pipeline_outputs(cfg, 3)
+    with mod_yaml_data(cfg) as config_data:
+        config_data[LOOPER_KEY][PIPELINE_INTERFACES_KEY] = \
+            [os.path.join(os.path.dirname(cfg), PIP.format("1"))]
+
+
+class LooperReportTests:
+    def test_report_jobs_identical(self, prep_temp_pep):
+        """ Verify that the pages rendered in parallel match the serial ones """
+        tp = prep_temp_pep
+        _prep_report(tp)
+        p = Project(tp)
+        out_dir = p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY]
+        pages = {}
+        for jobs in ["1", "2"]:
+            stdout, stderr, rc = subp_exec(tp, "report", ["--jobs", jobs])
+            print(stderr)
+            assert rc == 0
+            reports_dir = os.path.join(out_dir, p.name + "_reports")
+            pages[jobs] = {}
+            for f in os.listdir(reports_dir):
+                with open(os.path.join(reports_dir, f), 'r') as fh:
+                    pages[jobs][f] = fh.read()
+            rmtree(reports_dir)
+        assert pages["1"] and pages["1"] == pages["2"]
+
+    def test_report_rerenders_changed_pages(self, prep_temp_pep):
+        """ Verify that only the pages with changed inputs are rendered """
+        tp = prep_temp_pep
+        _prep_report(tp)
+        p = Project(tp)
+        out_dir = p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY]
+        reports_dir = os.path.join(out_dir, p.name + "_reports")
+        stdout, stderr, rc = subp_exec(tp, "report")
+        assert rc == 0
+        pages = [os.path.join(reports_dir, s + ".html")
+                 for s in ["sample1", "sample2"]]
+        for page in pages:
+            os.utime(page, (0, 0))
+        open(os.path.join(out_dir, "results_pipeline", "sample2",
+                          "PIPELINE1_failed.flag"), 'a').close()
+        stdout, stderr, rc = subp_exec(tp, "report")
+        print(stderr)
+        assert rc == 0
+        assert os.path.getmtime(pages[0]) == 0
+        assert os.path.getmtime(pages[1]) != 0
+
+    def test_report_runtime_from_log(self, prep_temp_pep):
+        """ Verify that the runtime is read from the log with no profile """
+        tp = prep_temp_pep
+        _prep_report(tp)
+        p = Project(tp)
+        out_dir = p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY]
+        sf = os.path.join(out_dir, "results_pipeline", "sample1")
+        os.remove(os.path.join(sf, "PIPELINE1_profile.tsv"))
+        with open(os.path.join(sf, "PIPELINE1_log.md"), 'w') as f:
+            f.write("* Total elapsed time (all runs):  1:23:45\n"
+                    "* Peak memory (this run):  2.5 GB\n")
+        stdout, stderr, rc = subp_exec(tp, "report")
+        print(stderr)
+        assert rc == 0
+        is_in_file(os.path.join(out_dir, p.name + "_reports", "status.html"),
+                   "1:23:45")
+
+    def test_report_names_sample_without_runtime(self, prep_temp_pep):
+        """ Verify that a sample with no profile nor log values is named """
+        tp = prep_temp_pep
+        _prep_report(tp)
+        p = Project(tp)
+        sf = os.path.join(p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY],
+                          "results_pipeline", "sample1")
+        os.remove(os.path.join(sf, "PIPELINE1_profile.tsv"))
+        with open(os.path.join(sf, "PIPELINE1_log.md"), 'w') as f:
+            f.write("No totals reported\n")
+        stdout, stderr, rc = subp_exec(tp, "report")
+        print(stderr)
+        assert rc == 0
+        assert "No runtime and memory for sample 'sample1'" in stderr
+        assert "'None' does not exist" not in stderr
+
+    def test_report_shared_assets(self, prep_temp_pep):
+        """ Verify that the navbar and table data are not embedded in pages """
+        tp = prep_temp_pep
+        _prep_report(tp)
+        p = Project(tp)
+        out_dir = p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY]
+        reports_dir = os.path.join(out_dir, p.name + "_reports")
+        stdout, stderr, rc = subp_exec(tp, "report")
+        print(stderr)
+        assert rc == 0
+        for asset in ["navbar.js", "stats.js", "summary_table.js"]:
+            assert os.path.isfile(os.path.join(reports_dir, asset))
+        with open(os.path.join(reports_dir, "sample1.html"), 'r') as f:
+            sample_page = f.read()
+        assert "navbar.js" in sample_page and "navbar-nav" not in sample_page
+        with open(os.path.join(out_dir, p.name + "_summary.html"), 'r') as f:
+            index_page = f.read()
+        assert "summary_table.js" in index_page and "LN1" not in index_page
+
+    def test_report_serve_exports_requested_pages(self, prep_temp_pep):
+        """ Verify that the served report writes only the requested pages """
+        tp = prep_temp_pep
+        _prep_report(tp)
+        p = Project(tp)
+        out_dir = p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY]
+        reports_dir = os.path.join(out_dir, p.name + "_reports")
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        proc = subprocess.Popen(["looper", "report", tp, "--serve", str(port)],
+                                stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        url = "http://127.0.0.1:{}/{}_reports/sample1.html".format(port, p.name)
+        page = None
+        for _ in range(120):
+            try:
+                page = urlopen(url).read().decode()
+                break
+            except (IOError, OSError):
+                time.sleep(0.5)
+        proc.send_signal(signal.SIGINT)
+        stdout, stderr = proc.communicate()
+        print(stderr)
+        assert proc.returncode == 0
+        assert page is not None and "sample1" in page
+        assert os.path.isfile(os.path.join(reports_dir, "sample1.html"))
+        assert not os.path.exists(os.path.join(reports_dir, "sample2.html"))
+        assert not os.path.exists(os.path.join(reports_dir, "status.html"))
+
+
+class LooperDestroyTests:
+    def test_destroy_flagged_only(self, prep_temp_pep):
+        """ Verify that only the results of the flagged samples are removed """
+        tp = prep_temp_pep
+        _make_flags(tp, "completed", 2)
+        _make_flags(tp, "failed", 1)
+        p = Project(tp)
+        results = os.path.join(p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY],
+                               "results_pipeline")
+        proc = subprocess.Popen(
+            ["looper", "destroy", tp, "--jobs", "2", "--force-yes",
+             "--flags", "failed"],
+            stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        print(stderr)
+        assert proc.returncode == 0
+        # the folders are not measured without a preview
+        assert b"Space to free" not in stderr
+        assert b"Removing summary" not in stderr
+        assert not os.path.exists(os.path.join(results, "sample1"))
+        assert os.path.isdir(os.path.join(results, "sample2"))
+
+    def test_destroy_dry_run_previews_space(self, prep_temp_pep):
+        """ Verify that the dry run measures the folders and removes none """
+        tp = prep_temp_pep
+        _make_flags(tp, "completed", 2)
+        p = Project(tp)
+        results = os.path.join(p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY],
+                               "results_pipeline")
+        stdout, stderr, rc = subp_exec(tp, "destroy", ["--force-yes"])
+        print(stderr)
+        assert rc == 0
+        assert "Space to free" in stderr
+        assert os.path.isdir(os.path.join(results, "sample1"))
+
+
+class LooperCleanTests:
+    def test_clean_reports_failed_scripts(self, prep_temp_pep):
+        """ Verify that all cleanup scripts run and failures are reported """
+        tp = prep_temp_pep
+        _make_flags(tp, "completed", 2)
+        p = Project(tp)
+        results = os.path.join(p[CONFIG_KEY][LOOPER_KEY][OUTDIR_KEY],
+                               "results_pipeline")
+        for sample, code in [("sample1", 0), ("sample2", 3)]:
+            with open(os.path.join(results, sample, "PIPELINE1_cleanup.sh"),
+                      'w') as f:
+                f.write("touch {}\nexit {}\n".format(
+                    os.path.join(results, sample, "cleaned"), code))
+        proc = subprocess.Popen(
+            ["looper", "clean", tp, "--jobs", "2", "--force-yes"],
+            stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        print(stderr)
+        assert proc.returncode == 1
+        assert b"1 of 2 cleanup scripts failed" in stderr
+        for sample in ["sample1", "sample2"]:
+            assert os.path.isfile(os.path.join(results, sample, "cleaned"))
+
+
+class TemplateContextTests:
+    def test_template_context_renders_like_namespaces(self, prep_temp_pep):
+        p = Project(prep_temp_pep)
+        namespaces = {"sample": p.samples[0], "project": p[CONFIG_KEY]}
+        templ = "{sample.sample_name} {project.looper.output_dir} {sample.nope}"
+        assert template_references(templ) == \
+            {"sample": {"sample_name": None, "nope": None},
+             "project": {"looper": {"output_dir": None}}}
+        ctx = template_context(["{sample}", templ], namespaces)
+        # the sample is referenced as a whole, the project partially
+        assert ctx["sample"] is p.samples[0]
+        assert ctx["project"] == \
+            {"looper": {"output_dir": p[CONFIG_KEY].looper.output_dir}}
+        templ = templ.rsplit(" ", 1)[0]
+        assert jinja_render_template_strictly(templ, ctx) == \
+            jinja_render_template_strictly(templ, namespaces)
+        with pytest.raises(UndefinedError, match="no attribute 'nope'"):
+            jinja_render_template_strictly(
+                "{project.nope}", template_context(["{project.nope}"],
+                                                   namespaces))
+
+
+class FileWriterTests:
+    def test_failed_background_write_raises(self, tmp_path):
+        """ Verify that a write failed before the barrier is not lost """
+        blocker = tmp_path / "blocker"
+        blocker.write_text("not a folder")
+        writer = FileWriterPool()
+        writer.submit(str(blocker / "job.sub"), b"content")
+        time.sleep(0.5)
+        with pytest.raises(OSError):
+            writer.barrier()
+        writer.submit(str(blocker / "other.sub"), b"content")
+        with pytest.raises(OSError):
+            writer.close()
+
+
+class ScanLogTests:
+    def test_scan_log_stops_at_last_key(self, tmp_path, monkeypatch):
+        """ Verify that the log is not read past the last matched key """
+        log = tmp_path / "log.md"
+        log.write_text("* Total elapsed time (all runs):  0:01:02\n"
+                       "* Peak memory (this run):  1.5 GB\n"
+                       "* Total elapsed time (all runs):  9:99:99\n" +
+                       "filler\n" * 100)
+        read = []
+
+        def _open(*args, **kwargs):
+            f = open(*args, **kwargs)
+            for line in f:
+                read.append(line)
+                yield line
+            f.close()
+        monkeypatch.setattr(html_reports, "open",
+                            lambda *a, **k: contextlib.closing(_open(*a, **k)),
+                            raising=False)
+        values = html_reports._scan_log(str(log),
+                                        html_reports.LOG_PROFILE_REGEXES)
+        assert values == {"time": "0:01:02", "mem": "1.5 GB"}
+        assert len(read) == 2
+
+    def test_scan_log_keys_in_one_pass(self, tmp_path):
+        """ Verify that several keys are matched, on any lines """
+        log = tmp_path / "log.md"
+        log.write_text("* Peak memory (this run):  1.5 GB\n"
+                       "other: line\n"
+                       "* Total elapsed time (all runs):  0:01:02\n")
+        values = html_reports._scan_log(
+            str(log), dict(html_reports.LOG_PROFILE_REGEXES,
+                           missing=r'(Not logged)'))
+        assert values == {"time": "0:01:02", "mem": "1.5 GB"}
+
+    def test_scan_log_undecodable_bytes(self, tmp_path):
+        """ Verify that undecodable bytes do not prevent the matching """
+        log = tmp_path / "log.md"
+        log.write_bytes(b"\xff\xfe binary \x80 output\n"
+                        b"* Peak memory (this run):  1.5 GB \xe9\n")
+        values = html_reports._scan_log(str(log), {"mem": r'(Peak memory)'})
+        assert values["mem"].startswith("1.5 GB")
+
+    def test_scan_log_missing_file(self, tmp_path):
+        with pytest.raises(IOError):
+            html_reports._scan_log(str(tmp_path / "log.md"), {"mem": "mem"})
+
+
+class BackendSettingsTests:
+    def test_backend_settings_exclude_resources(self):
+        """ Verify that only the settings configuring the backend are kept """
+        compute = {"submission_backend": "local", "submission_workers": 2,
+                   "submission_command": "sh", "mem": "1000", "cores": 4,
+                   "fake_max_jobs": 4}
+        assert backend_settings(compute) == {
+            "submission_backend": "local", "submission_workers": 2,
+            "submission_command": "sh"}
+        compute["submission_backend"] = "fake"
+        assert backend_settings(compute)["fake_max_jobs"] == 4
+
+
+class RenderPoolTests:
+    def test_start_forks_all_workers(self, tmp_path):
+        """ Verify that no worker is forked after the pool is started """
+        template = tmp_path / "template.sub"
+        template.write_text("{LOOPER.COMMAND}")
+        pool = RenderPool(2)
+        pool.add_context("piface", dict(command_template="run {sample.name}",
+                                        extra_args="", adapters={}))
+        pool.start()
+        workers = set(pool._executor._processes)
+        assert len(workers) == 2
+        futures = [pool.submit("piface", ({"sample": {"name": str(i)}},
+                                          {"submission_template":
+                                           str(template)}, {}))
+                   for i in range(4)]
+        assert [f.result()[0] for f in futures] == \
+            ["run {} ".format(i) for i in range(4)]
+        assert set(pool._executor._processes) == workers
+        pool.close()
+
+
+class SharedNamespaceTests:
+    def test_shared_namespace_files_by_folder_and_format(self, tmp_path):
+        """ Verify that a namespace is written to each folder and format """
+        data = {"name": "project"}
+        paths = [_write_shared_namespace(str(tmp_path / folder), "project",
+                                         dict(data), ext)
+                 for folder in ["run1", "run2"] for ext in [".yaml", ".json"]]
+        assert len(set(paths)) == 4
+        for path, folder, ext in zip(
+                paths, ["run1", "run1", "run2", "run2"],
+                [".yaml", ".json"] * 2):
+            assert os.path.dirname(path) == str(tmp_path / folder)
+            assert path.endswith(ext) and os.path.isfile(path)
+        # the namespaces written before are remembered
+        assert _write_shared_namespace(str(tmp_path / "run1"), "project",
+                                       dict(data), ".yaml") == paths[0]
@@ -1,13 +1,41 @@
+import glob
+import json
+import sys
+
 import pytest
 from tests.smoketests.conftest import *
 from peppy.const import *
 from looper.const import *
+from looper import read_submission_yaml, sample_store
+from looper.fake_scheduler import FakeScheduler, compute_package
 from looper.project import Project
-from yaml import dump
+from divvy.const import DEFAULT_CONFIG_FILEPATH
+from yaml import dump, safe_load
 
 CMD_STRS = ["string", " --string", " --sjhsjd 212", "7867#$@#$cc@@"]
 
 
+def _write_divvy_config(dirpath, package, **settings):
+    """
+    Write a divvy config with the default compute packages and one that
+    extends the local package with the given settings
+
+    :return str: path to the divvy config
+    """
+    with open(DEFAULT_CONFIG_FILEPATH, 'r') as f:
+        divvy_data = safe_load(f)
+    templates_dir = os.path.dirname(DEFAULT_CONFIG_FILEPATH)
+    for pkg in divvy_data["compute_packages"].values():
+        pkg["submission_template"] = os.path.join(
+            templates_dir, pkg["submission_template"])
+    divvy_data["compute_packages"][package] = \
+        dict(divvy_data["compute_packages"]["local"], **settings)
+    divvy_path = os.path.join(dirpath, "divvy_config.yaml")
+    with open(divvy_path, 'w') as f:
+        dump(divvy_data, f)
+    return divvy_path
+
+
 class LooperBothRunsTests:
     @pytest.mark.parametrize("cmd", ["run", "runp"])
     def test_looper_cfg_invalid(self, cmd):
@@ -309,6 +337,171 @@ class LooperRunPreSubmissionHooksTests:
         assert rc == 0
         verify_filecount_in_dir(sd, "test.txt", 3)
 
+    def test_looper_batch_command_templates_hooks(self, prep_temp_pep):
+        tp = prep_temp_pep
+        cmd = "mkdir -p {looper.output_dir}; cat > {looper.output_dir}/" \
+              "{pipeline.pipeline_name}_batch.jsonl; {%raw%}echo {}{%endraw%}"
+        for path in {piface["pipe_iface_file"] for piface in
+                     Project(tp).pipeline_interfaces}:
+            with mod_yaml_data(path) as piface_data:
+                piface_data[PRE_SUBMIT_HOOK_KEY][PRE_SUBMIT_BATCH_CMD_KEY] = \
+                    [cmd]
+        stdout, stderr, rc = subp_exec(tp, "run")
+        print(stderr)
+        assert rc == 0
+        batch_files = glob.glob(os.path.join(get_outdir(tp), "*_batch.jsonl"))
+        assert len(batch_files) == 2
+        for f in batch_files:
+            with open(f) as fh:
+                # the hook of each pipeline runs once, for all the samples
+                assert len(fh.readlines()) == 3
+
+    def test_looper_batch_hooks_values_in_scripts(self, prep_temp_pep,
+                                                  tmp_path, monkeypatch):
+        tp = prep_temp_pep
+        # a batch function and a batch command, each setting a different
+        # value for every sample
+        (tmp_path / "batch_hooks.py").write_text(
+            "def batch_fun(namespaces):\n"
+            "    return {s.sample_name: {'sample': {'fun_value': 'fun_' + "
+            "s.sample_name}} for s in namespaces['samples']}\n")
+        (tmp_path / "batch_cmd.py").write_text(
+            "import json, sys\n"
+            "samples = [json.loads(line) for line in sys.stdin]\n"
+            "print(json.dumps({s['sample_name']: {'sample': {'cmd_value': "
+            "'cmd_' + s['sample_name']}} for s in samples}))\n")
+        monkeypatch.setenv("PYTHONPATH", os.pathsep.join(
+            [str(tmp_path)] + [x for x in [os.environ.get("PYTHONPATH")]
+                               if x]))
+        for path in {piface["pipe_iface_file"] for piface in
+                     Project(tp).pipeline_interfaces}:
+            with mod_yaml_data(path) as piface_data:
+                pre_submit = piface_data[PRE_SUBMIT_HOOK_KEY]
+                pre_submit[PRE_SUBMIT_BATCH_PY_FUN_KEY] = \
+                    ["batch_hooks.batch_fun"]
+                pre_submit[PRE_SUBMIT_BATCH_CMD_KEY] = ["{} {}".format(
+                    sys.executable, tmp_path / "batch_cmd.py")]
+                piface_data["command_template"] = \
+                    piface_data["command_template"].strip() + \
+                    " --fun {sample.fun_value} --cmd {sample.cmd_value}"
+        stdout, stderr, rc = subp_exec(tp, "run")
+        print(stderr)
+        assert rc == 0
+        sd = os.path.join(get_outdir(tp), "submission")
+        subs = glob.glob(os.path.join(sd, "*.sub"))
+        assert len(subs) == 6
+        for sub in subs:
+            name = os.path.splitext(os.path.basename(sub))[0].split("_")[-1]
+            is_in_file(sub, "--fun fun_{} --cmd cmd_{}".format(name, name))
+
+    def test_looper_cacheable_command_hooks_memoized(self, prep_temp_pep):
+        tp = prep_temp_pep
+        hook = {"template": "mkdir -p {looper.output_dir}; "
+                            "echo x >> {looper.output_dir}/hook_calls.txt; "
+                            "{%raw%}echo {}{%endraw%}",
+                "cacheable": True, "timeout": 10}
+        for path in {piface["pipe_iface_file"] for piface in
+                     Project(tp).pipeline_interfaces}:
+            with mod_yaml_data(path) as piface_data:
+                piface_data[PRE_SUBMIT_HOOK_KEY][PRE_SUBMIT_CMD_KEY] = [hook]
+        calls_file = os.path.join(get_outdir(tp), "hook_calls.txt")
+        for _ in range(2):
+            stdout, stderr, rc = subp_exec(tp, "run", ["--hook-jobs", "2"])
+            print(stderr)
+            assert rc == 0
+            # the command renders the same for every sample, and its
+            # output is persisted for the second run
+            with open(calls_file) as f:
+                assert len(f.readlines()) == 1
+
+    def test_looper_prefetched_hooks_skip_flagged_samples(self,
+                                                          prep_temp_pep):
+        tp = prep_temp_pep
+        hook = {"template": "mkdir -p {looper.output_dir}; "
+                            "echo {pipeline.pipeline_name}_"
+                            "{sample.sample_name}_{looper.total_input_size} "
+                            ">> {looper.output_dir}/hook_calls.txt; "
+                            "{%raw%}echo {}{%endraw%}",
+                "cacheable": True, "timeout": 10}
+        for path in {piface["pipe_iface_file"] for piface in
+                     Project(tp).pipeline_interfaces}:
+            with mod_yaml_data(path) as piface_data:
+                piface_data[PRE_SUBMIT_HOOK_KEY][PRE_SUBMIT_CMD_KEY] = [hook]
+        flag_dir = os.path.join(get_outdir(tp), "results_pipeline", "sample2")
+        os.makedirs(flag_dir, exist_ok=True)
+        open(os.path.join(flag_dir, "PIPELINE1_completed.flag"), 'a').close()
+        stdout, stderr, rc = subp_exec(tp, "run", ["--hook-jobs", "2"])
+        print(stderr)
+        assert rc == 0
+        with open(os.path.join(get_outdir(tp), "hook_calls.txt")) as f:
+            calls = f.read().split()
+        # the size-dependent command is prefetched with the sample size, so
+        # it runs once per sample; the skipped sample is not prefetched, its
+        # command runs only when its script is written, after the others
+        assert len(calls) == len(set(calls)) == 6
+        assert calls[-1].startswith("PIPELINE1_sample2_")
+
+    def test_looper_command_hooks_read_plugin_files(self, prep_temp_pep):
+        tp = prep_temp_pep
+        # fails unless the sample YAML file is written before the command runs
+        hook = "test -s {looper.output_dir}/submission/" \
+               "{sample.sample_name}_sample.yaml && {%raw%}echo {}{%endraw%}"
+        for path in {piface["pipe_iface_file"] for piface in
+                     Project(tp).pipeline_interfaces}:
+            with mod_yaml_data(path) as piface_data:
+                piface_data[PRE_SUBMIT_HOOK_KEY][PRE_SUBMIT_PY_FUN_KEY] = \
+                    ["looper.write_sample_yaml"]
+                piface_data[PRE_SUBMIT_HOOK_KEY][PRE_SUBMIT_CMD_KEY] = [hook]
+        stdout, stderr, rc = subp_exec(tp, "run")
+        print(stderr)
+        assert rc == 0
+        sd = os.path.join(get_outdir(tp), "submission")
+        assert len(glob.glob(os.path.join(sd, "*.sub"))) == 6
+
+    def test_looper_sample_store_plugin(self, prep_temp_pep):
+        tp = prep_temp_pep
+        for path in {piface["pipe_iface_file"] for piface in
+                     Project(tp).pipeline_interfaces}:
+            with mod_yaml_data(path) as piface_data:
+                piface_data[PRE_SUBMIT_HOOK_KEY][PRE_SUBMIT_PY_FUN_KEY] = \
+                    ["looper.write_sample_store"]
+        sd = os.path.join(get_outdir(tp), "submission")
+        for _ in range(2):
+            stdout, stderr, rc = subp_exec(tp, "run")
+            print(stderr)
+            assert rc == 0
+        stores = glob.glob(os.path.join(sd, "*_samples.jsonl"))
+        assert len(stores) == 2
+        for store in stores:
+            # the records of the first run are dropped by the second one
+            assert sample_store.sample_names(store) == \
+                ["sample1", "sample2", "sample3"]
+            with open(store) as f:
+                assert len(f.readlines()) == 3
+            assert sample_store.get(store, "sample2")["sample_name"] == \
+                "sample2"
+            assert sample_store.get(store, "bogus") is None
+
+    def test_looper_submission_yaml_shares_namespaces(self, prep_temp_pep):
+        tp = prep_temp_pep
+        for path in {piface["pipe_iface_file"] for piface in
+                     Project(tp).pipeline_interfaces}:
+            with mod_yaml_data(path) as piface_data:
+                piface_data[PRE_SUBMIT_HOOK_KEY][PRE_SUBMIT_PY_FUN_KEY] = \
+                    ["looper.write_submission_yaml"]
+        stdout, stderr, rc = subp_exec(tp, "run")
+        print(stderr)
+        assert rc == 0
+        sd = os.path.join(get_outdir(tp), "submission")
+        # the project namespace is the same for all the samples
+        assert len(glob.glob(os.path.join(
+            sd, SHARED_NAMESPACES_SUBDIR, "project_*.yaml"))) == 1
+        namespaces = read_submission_yaml(
+            os.path.join(sd, "sample1_submission.yaml"))
+        assert SHARED_NAMESPACES_KEY not in namespaces
+        assert namespaces["sample"]["sample_name"] == "sample1"
+        assert namespaces["project"]["name"] == Project(tp).name
+
 
 class LooperRunSubmissionScriptTests:
     def test_looper_run_produces_submission_scripts(self, prep_temp_pep):
@@ -322,6 +515,123 @@ class LooperRunSubmissionScriptTests:
         assert rc == 0
         verify_filecount_in_dir(sd, ".sub", 6)
 
+    def test_looper_run_shards_submission_scripts(self, prep_temp_pep):
+        """ Verify that the job files are nested in hash-prefix folders """
+        tp = prep_temp_pep
+        with mod_yaml_data(tp) as config_data:
+            config_data[LOOPER_KEY][SHARD_DEPTH_KEY] = 1
+        stdout, stderr, rc = subp_exec(tp, "run")
+        sd = os.path.join(get_outdir(tp), "submission")
+        print(stderr)
+        assert rc == 0
+        verify_filecount_in_dir(sd, ".sub", 0)
+        subs = glob.glob(os.path.join(sd, "*", "*.sub"))
+        assert len(subs) == 6
+        assert all(len(os.path.basename(os.path.dirname(s))) == 2 for s in subs)
+
+    def test_looper_render_workers_match_serial_scripts(self, prep_temp_pep):
+        """ Verify that scripts rendered in worker processes are the same """
+        tp = prep_temp_pep
+        sd = os.path.join(get_outdir(tp), "submission")
+
+        def _read_scripts():
+            scripts = {}
+            for path in glob.glob(os.path.join(sd, "*.sub")):
+                with open(path, 'r') as f:
+                    scripts[os.path.basename(path)] = f.read()
+            return scripts
+
+        stdout, stderr, rc = subp_exec(tp, "run")
+        assert rc == 0
+        serial = _read_scripts()
+        rmtree(sd)
+        stdout, stderr, rc = subp_exec(tp, "run", ["--render-workers", "2"])
+        print(stderr)
+        assert rc == 0
+        assert "Jobs submitted: 6" in stderr
+        assert len(serial) == 6
+        assert _read_scripts() == serial
+
+    def test_looper_plan_writes_no_scripts(self, prep_temp_pep):
+        """ Verify that the plan lists the jobs and that nothing is written """
+        tp = prep_temp_pep
+        plan_file = os.path.join(os.path.dirname(tp), "plan.jsonl")
+        stdout, stderr, rc = subp_exec(tp, "run", ["--plan", plan_file])
+        print(stderr)
+        assert rc == 0
+        assert "Plan totals" in stderr
+        assert not os.path.exists(os.path.join(get_outdir(tp), "submission"))
+        with open(plan_file, 'r') as f:
+            records = [json.loads(line) for line in f]
+        jobs = [r for r in records if r["type"] == "job"]
+        assert len(jobs) == 6
+        assert all(j["commands"] for j in jobs)
+
+    def test_looper_submission_backend_captures_job_ids(self, prep_temp_pep):
+        """ Verify that the selected backend submits the scripts in batches """
+        tp = prep_temp_pep
+        divvy_path = _write_divvy_config(
+            os.path.dirname(tp), "memory", submission_backend="memory",
+            submission_batch_size=4)
+        stdout, stderr, rc = subp_exec(
+            tp, "run", ["--divvy", divvy_path, "--package", "memory"],
+            dry=False)
+        print(stderr)
+        assert rc == 0
+        assert "Commands submitted: 6 of 6" in stderr
+        assert stderr.count("Submitted job ") == 6
+
+    def test_looper_submission_backend_per_compute_settings(
+            self, prep_temp_pep, tmp_path, monkeypatch):
+        """ Verify that the scripts are grouped by their backend settings """
+        tp = prep_temp_pep
+        divvy_path = _write_divvy_config(
+            os.path.dirname(tp), "memory", submission_backend="memory")
+        # the backend of the first sample is configured differently, the
+        # other samples differ in their resources only
+        (tmp_path / "compute_hooks.py").write_text(
+            "def set_group(namespaces):\n"
+            "    computes = {'sample1': {'submission_batch_size': 2},\n"
+            "                'sample2': {'mem': '1000'},\n"
+            "                'sample3': {'mem': '2000'}}\n"
+            "    return {s.sample_name: {'compute': computes[s.sample_name]}\n"
+            "            for s in namespaces['samples']}\n")
+        monkeypatch.setenv("PYTHONPATH", os.pathsep.join(
+            [str(tmp_path)] + [x for x in [os.environ.get("PYTHONPATH")]
+                               if x]))
+        for path in {piface["pipe_iface_file"] for piface in
+                     Project(tp).pipeline_interfaces}:
+            with mod_yaml_data(path) as piface_data:
+                piface_data[PRE_SUBMIT_HOOK_KEY][
+                    PRE_SUBMIT_BATCH_PY_FUN_KEY] = ["compute_hooks.set_group"]
+        stdout, stderr, rc = subp_exec(
+            tp, "run", ["--divvy", divvy_path, "--package", "memory"],
+            dry=False)
+        print(stderr)
+        assert rc == 0
+        assert "Commands submitted: 6 of 6" in stderr
+        # each group has its own backend, numbering its jobs from 1
+        assert "Submitted job PIPELINE1_sample1: 1" in stderr
+        assert "Submitted job PIPELINE1_sample2: 1" in stderr
+        assert "Submitted job PIPELINE1_sample3: 2" in stderr
+
+    def test_looper_fake_scheduler_throttles_submissions(self, prep_temp_pep):
+        """ Verify that the jobs the fake scheduler rejects are reported """
+        tp = prep_temp_pep
+        with FakeScheduler(queue_latency=60, max_jobs=4) as scheduler:
+            divvy_path = _write_divvy_config(
+                os.path.dirname(tp), "fake",
+                **compute_package(scheduler.serve()))
+            stdout, stderr, rc = subp_exec(
+                tp, "run", ["--divvy", divvy_path, "--package", "fake"],
+                dry=False)
+            print(stderr)
+            assert rc == 0
+            assert len(scheduler.jobs) == 4
+            assert scheduler.stats()["queue_full"] == 2
+        assert "Commands submitted: 4 of 6" in stderr
+        assert "failed job submission: sample3" in stderr
+
     def test_looper_lumping(self, prep_temp_pep):
         tp = prep_temp_pep
         stdout, stderr, rc = subp_exec(tp, "run", ["--lumpn", "2"])
@@ -415,4 +725,26 @@ class LooperComputeTests:
         sd = os.path.join(get_outdir(tp), "submission")
         subs_list = [os.path.join(sd, f)
                      for f in os.listdir(sd) if f.endswith(".sub")]
-        is_in_file(subs_list, "testin_mem", reverse=True)
\ No newline at end of file
+        is_in_file(subs_list, "testin_mem", reverse=True)
+
+    def test_looper_compute_settings_do_not_leak(self, prep_temp_pep):
+        tp = prep_temp_pep
+        for piface in Project(tp).pipeline_interfaces:
+            with mod_yaml_data(piface["pipe_iface_file"]) as piface_data:
+                if piface["pipeline_name"] == "OTHER_PIPELINE2":
+                    piface_data.setdefault(COMPUTE_KEY, {})["partition"] = \
+                        "other_partition"
+                else:
+                    piface_data[VAR_TEMPL_KEY]["sample_yaml_path"] = \
+                        "{looper.output_dir}/custom/{sample.sample_name}.yaml"
+        stdout, stderr, rc = subp_exec(tp, "run", ["-p", "slurm"])
+        print(stderr)
+        assert rc == 0
+        sd = os.path.join(get_outdir(tp), "submission")
+        is_in_file(glob.glob(os.path.join(sd, "PIPELINE1_*.sub")),
+                   "other_partition", reverse=True)
+        is_in_file(glob.glob(os.path.join(sd, "OTHER_PIPELINE2_*.sub")),
+                   "other_partition")
+        # the var_templates are rendered for every sample
+        assert sorted(os.listdir(os.path.join(get_outdir(tp), "custom"))) == \
+            ["sample1.yaml", "sample2.yaml", "sample3.yaml"]